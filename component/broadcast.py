@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the broadcaster that fans frames out to connected display clients.
+
+Note:
+    - Every client gets its own bounded outbound queue and writer task, so a stalled client
+      never blocks the coroutine that publishes (i.e. the FSM input path).
+    - Frames are encoded once per encoding in use and shared by all clients of that encoding.
+    - Overflow policy is chosen per frame kind: 'drop-oldest' frames (cursor) are bounded by the
+      queue size, 'never-drop' frames (state, params, users) are always delivered in order. A client with
+      `max_pending` never-drop frames queued has stopped reading: it is disconnected (1013) instead of being
+      buffered for the rest of the session (a display with a resume token can reconnect and catch up).
+    - Published frames are numbered and the latest `replay` of them are kept. A client that disconnects with a
+      resume token stays detached until its missed frames leave that buffer (its encoding is still produced);
+      when it reconnects with the token and the number of frames it received, resume() queues exactly the
+      published frames it missed. Each channel remembers the numbers of its latest written frames for this.
+"""
+import asyncio, time, websockets
+from collections import deque, OrderedDict
+from .tracing import client_label
+
+DROP_OLDEST = 'drop-oldest'
+NEVER_DROP = 'never-drop'
+
+DEFAULT_POLICIES = {
+    'cursor': DROP_OLDEST,
+    'state': NEVER_DROP,
+    'params': NEVER_DROP,
+    'users': NEVER_DROP,
+    'trace': NEVER_DROP,
+    'stats': NEVER_DROP
+}
+
+
+class Channel(object):
+    """ Outbound queue and writer task for a single connected client. """
+
+    def __init__(self, websocket, maxsize: int = 8, encoding: str = 'json', tracer=None, token: str = None, start: int = 0, history: int = 0, max_pending: int = 1024):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.maxsize = maxsize
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.overflowed = False # disconnected for exceeding max_pending
+        self.token = token # resume token (None: the client cannot resume)
+        self.start = start # number of the last frame published before this client was added (or resumed)
+        self.detached = None # number of the last frame published before it disconnected
+        self.written = 0 # frames written to the socket
+        self.history = deque(maxlen=history) # numbers of the latest written frames (None: sent to this client only)
+        self.tracer = tracer # records queue --> socket latency as the 'send' stage
+        self.label = client_label(websocket)
+        self._queue = deque()
+        self._droppable = 0 # number of queued frames that may be dropped
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._run())
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, frame, droppable: bool = False, seq: int = None):
+        """ Queues a frame without blocking. Droppable frames evict the oldest droppable frame when full. """
+        if self.overflowed:
+            return
+        if droppable:
+            if self._droppable >= self.maxsize:
+                self._drop_oldest()
+            self._droppable += 1
+        elif len(self._queue) - self._droppable >= self.max_pending:
+            self._overflow()
+            return
+        self._queue.append((frame, droppable, time.perf_counter(), seq))
+        self._wakeup.set()
+
+    def _overflow(self):
+        """ Disconnects a client that stopped reading; its connection handler unregisters it. """
+        self.overflowed = True
+        self.close()
+        asyncio.ensure_future(self.websocket.close(1013, 'display queue overflow'))
+
+    def _drop_oldest(self):
+        for i, (_, droppable, _, _) in enumerate(self._queue):
+            if droppable:
+                del self._queue[i]
+                self._droppable -= 1
+                self.dropped += 1
+                return
+
+    async def _run(self):
+        queue = self._queue
+        try:
+            while True:
+                while queue:
+                    frame, droppable, queued, seq = queue.popleft()
+                    if droppable:
+                        self._droppable -= 1
+                    await self.websocket.send(frame)
+                    self.written += 1
+                    self.history.append(seq)
+                    if self.tracer is not None:
+                        self.tracer.record('send', self.label, time.perf_counter() - queued)
+                self._wakeup.clear()
+                await self._wakeup.wait()
+        except websockets.ConnectionClosed:
+            pass # The connection handler unregisters the client.
+
+    def close(self):
+        self._writer.cancel()
+        self._queue.clear()
+        self._droppable = 0
+
+
+class Broadcaster(object):
+    """ Set-like collection of client channels that publishes frames without awaiting any client. """
+
+    def __init__(self, maxsize: int = 8, policies: dict = None, tracer=None, replay: int = 256, max_pending: int = 1024):
+        self.maxsize = maxsize
+        self.max_pending = max_pending # never-drop frames a client may have queued before it is disconnected
+        self.policies = dict(DEFAULT_POLICIES, **(policies or {}))
+        self.tracer = tracer
+        self.seq = 0 # number of the latest published frame
+        self._replay = deque(maxlen=replay) # (seq, frames, droppable) of the latest published frames
+        self._channels = {}
+        self._encodings = {}
+        self._detached = OrderedDict() # token --> channel of a disconnected client that may resume
+
+    def __len__(self):
+        return len(self._channels)
+
+    def __bool__(self):
+        """ Whether published frames have a recipient: a connected client, or a detached one that may resume. """
+        return bool(self._channels or self._detached)
+
+    def __contains__(self, websocket):
+        return websocket in self._channels
+
+    def __iter__(self):
+        return iter(self._channels.values())
+
+    @property
+    def detached(self) -> int:
+        """ Disconnected clients that may still resume. """
+        return len(self._detached)
+
+    @property
+    def encodings(self) -> set:
+        """ Encodings with at least one subscribed client. """
+        return {e for e, n in self._encodings.items() if n}
+
+    def add(self, websocket, encoding: str = 'json', token: str = None) -> Channel:
+        channel = Channel(websocket, self.maxsize, encoding, self.tracer, token, self.seq, self._replay.maxlen, self.max_pending)
+        self._channels[websocket] = channel
+        self._encodings[encoding] = self._encodings.get(encoding, 0) + 1
+        return channel
+
+    def remove(self, websocket):
+        """ Removes a client; one with a resume token stays detached while its missed frames can be replayed. """
+        channel = self._channels.pop(websocket)
+        channel.close()
+        if channel.token is not None and self._replay.maxlen:
+            channel.detached = self.seq
+            self._detached[channel.token] = channel
+        else:
+            self._encodings[channel.encoding] -= 1
+
+    def _expire(self):
+        """ Forgets detached clients whose missed frames are no longer all in the replay buffer. """
+        oldest = self._replay[0][0] if self._replay else self.seq + 1
+        while self._detached:
+            token, channel = next(iter(self._detached.items()))
+            if channel.detached + 1 >= oldest:
+                break
+            del self._detached[token]
+            self._encodings[channel.encoding] -= 1
+
+    def resume(self, websocket, token: str, received: int):
+        """ Queues the published frames a reconnecting client missed, given the number of frames it received on
+        its previous connection. Returns how many frames were queued, or None if it needs a snapshot instead. """
+        detached = self._detached.pop(token, None)
+        if detached is None:
+            return None
+        self._encodings[detached.encoding] -= 1
+        channel = self._channels[websocket]
+        channel.token = token
+        history = list(detached.history)
+        lost = detached.written - received # frames written to the old socket that never arrived
+        if channel.encoding != detached.encoding or not 0 <= lost <= len(history) or None in history[len(history) - lost:]:
+            return None # a lost frame cannot be replayed (sent to that client only) or is too old
+        last = next((seq for seq in reversed(history[:len(history) - lost]) if seq is not None), None)
+        if last is None: # no published frame received: it missed everything after it was added
+            if detached.written > len(history):
+                return None
+            last = detached.start
+        missed = [(frames, droppable, seq) for seq, frames, droppable in self._replay if seq > last]
+        if (self.seq > last and (not missed or missed[0][2] != last + 1)) or \
+                any(isinstance(frames, dict) and channel.encoding not in frames for frames, _, _ in missed):
+            return None
+        channel.start = last
+        for frames, droppable, seq in missed:
+            frame = frames[channel.encoding] if isinstance(frames, dict) else frames
+            if frame is not None:
+                channel.put(frame, droppable, seq)
+        return len(missed)
+
+    def set_encoding(self, websocket, encoding: str):
+        channel = self._channels[websocket]
+        self._encodings[channel.encoding] -= 1
+        self._encodings[encoding] = self._encodings.get(encoding, 0) + 1
+        channel.encoding = encoding
+
+    def publish(self, frames, kind: str = 'state'):
+        """ Queues a frame for every client. `frames` is one payload or a dict of payloads by encoding (None: nothing to send). """
+        droppable = self.policies[kind] == DROP_OLDEST
+        self.seq = seq = self.seq + 1
+        if self._replay.maxlen:
+            self._replay.append((seq, frames, droppable))
+            if self._detached:
+                self._expire()
+        if isinstance(frames, dict):
+            for channel in self._channels.values():
+                frame = frames[channel.encoding]
+                if frame is not None:
+                    channel.put(frame, droppable, seq)
+        else:
+            for channel in self._channels.values():
+                channel.put(frames, droppable, seq)
+
+    def send(self, websocket, frame, kind: str = 'state'):
+        """ Queues a frame for a single client, keeping its order relative to published frames. """
+        self._channels[websocket].put(frame, self.policies[kind] == DROP_OLDEST)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the persistent websocket client used by the GUI and script clients.
+
+Note:
+    - PersistentClient keeps one connection open on its own event loop thread, so callers on any thread (a Qt GUI,
+      a blocking script) send without an event loop and without a handshake per message.
+    - send() is thread-safe and never blocks by default: messages wait in a bounded queue (rejected and counted
+      in `dropped` when it is full, or block=True to wait for room). Messages sent with a `key` coalesce: a newer
+      message replaces the pending one with the same key in place (latest position wins, order is kept).
+    - The writer sends everything pending at once, after waiting `batch_period` s from the first message so that
+      bursts coalesce; messages stay queued while disconnected and the connection is retried with exponential
+      backoff (with jitter) until close().
+    - on_message(message) runs on the client thread for every received message (it may call send());
+      on_connect() returns the messages to send first on every (re)connection, e.g. subscriptions.
+"""
+import asyncio, logging, random, threading
+from collections import deque
+import websockets
+
+
+class PersistentClient(object):
+    """ A websocket connection kept open on a background loop thread, with a thread-safe bounded send queue. """
+
+    def __init__(self, uri: str, maxsize: int = 256, on_message=None, on_connect=None, batch_period: float = 0.0,
+                 backoff: tuple = (0.1, 5.0), name: str = 'WS-CLIENT', **connect_options):
+        '''Constructor for PersistentClient object.
+
+        backoff is the (first, longest) delay (s) between reconnection attempts; connect_options are passed to
+        websockets.connect (e.g. subprotocols, ping_interval).
+        '''
+        self.uri = uri
+        self.maxsize = maxsize
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.batch_period = batch_period
+        self.backoff = backoff
+        self.connect_options = connect_options
+        self.logger = logging.getLogger(name)
+        self.sent = 0
+        self.dropped = 0
+        self.connections = 0
+        self.connected = threading.Event()
+        self._queue = deque() # [key, message] entries
+        self._keys = {} # key --> its pending entry
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._loop = None
+        self._ready = threading.Event()
+        self._wakeup = None # asyncio.Event on the client loop
+        self._waking = False # a wakeup is already scheduled on the loop
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def __repr__(self):
+        return f'PersistentClient({self.uri}, {"connected" if self.connected.is_set() else "disconnected"}, {len(self)} queued)'
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self) -> 'PersistentClient':
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def send(self, message, key=None, block: bool = False, timeout: float = None) -> bool:
+        """ Queues a message (str or bytes) from any thread; returns False if it was dropped (queue full or closed). """
+        with self._lock:
+            if self._closing:
+                return False
+            entry = self._keys.get(key) if key is not None else None
+            if entry is not None: # coalesce: newest message, same place in the queue
+                entry[1] = message
+                return True
+            if len(self._queue) >= self.maxsize:
+                if block and threading.current_thread() is not self._thread: # the client thread cannot wait for itself
+                    self._room.wait_for(lambda: len(self._queue) < self.maxsize or self._closing, timeout)
+                if len(self._queue) >= self.maxsize or self._closing:
+                    self.dropped += 1
+                    return False
+            entry = [key, message]
+            self._queue.append(entry)
+            if key is not None:
+                self._keys[key] = entry
+            waking, self._waking = self._waking, True
+        if not waking and self._loop is not None: # before start(), the first connection sends the queue
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def close(self, timeout: float = 2.0):
+        """ Sends what is still queued (if connected), disconnects and stops the thread; waits for it at most `timeout` s. """
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            self._room.notify_all()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+            self._thread.join(timeout)
+
+    def join(self, timeout: float = None):
+        """ Blocks until the client is closed (e.g. a script that only reacts to received messages). """
+        self._thread.join(timeout)
+
+    def _take(self) -> list:
+        with self._lock:
+            batch = [message for _, message in self._queue]
+            self._queue.clear()
+            self._keys.clear()
+            self._waking = False
+            self._room.notify_all()
+        return batch
+
+    def _requeue(self, messages: list):
+        """ Puts unsent messages back at the front (they are sent again after reconnecting). """
+        with self._lock:
+            self._queue.extendleft([None, message] for message in reversed(messages))
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._connect_forever())
+        finally:
+            self._loop.close()
+
+    async def _connect_forever(self):
+        delay = self.backoff[0]
+        while not self._closing:
+            try:
+                async with websockets.connect(self.uri, **self.connect_options) as websocket:
+                    self.connections += 1
+                    self.connected.set()
+                    delay = self.backoff[0]
+                    await self._serve(websocket)
+            except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake, websockets.ConnectionClosed) as e:
+                if not self._closing:
+                    self.logger.debug('DISCONNECTED::%s::%s', self.uri, e)
+            finally:
+                self.connected.clear()
+            if not self._closing:
+                try: # a close() during the backoff ends it early
+                    await asyncio.wait_for(self._wait_closing(), delay * random.uniform(0.5, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, self.backoff[1])
+
+    async def _wait_closing(self):
+        while not self._closing:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _serve(self, websocket):
+        reader = asyncio.ensure_future(self._read(websocket))
+        try:
+            if self.on_connect is not None:
+                for message in self.on_connect():
+                    await websocket.send(message)
+            while True:
+                if not self._queue:
+                    if self._closing:
+                        return
+                    self._wakeup.clear()
+                    wakeup = asyncio.ensure_future(self._wakeup.wait())
+                    await asyncio.wait([reader, wakeup], return_when=asyncio.FIRST_COMPLETED)
+                    if reader.done(): # the server closed the connection
+                        wakeup.cancel()
+                        return reader.result()
+                    if self.batch_period > 0 and not self._closing:
+                        await asyncio.sleep(self.batch_period) # let a burst coalesce
+                batch = self._take()
+                for i, message in enumerate(batch):
+                    try:
+                        await websocket.send(message)
+                    except websockets.ConnectionClosed:
+                        self._requeue(batch[i:])
+                        raise
+                    self.sent += 1
+        finally:
+            reader.cancel()
+
+    async def _read(self, websocket):
+        async for message in websocket:
+            if self.on_message is not None:
+                try:
+                    self.on_message(message)
+                except Exception:
+                    self.logger.exception('ON_MESSAGE::%s', self.uri)
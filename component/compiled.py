@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing a table-driven state machine compiled from `transitions`-style definitions.
+
+Note:
+    - Behaves like the `TimeoutMachine` used by CenterOut (queued triggers, `before`/`after` callbacks,
+      machine-level `after_state_change`, per-state timeouts with `on_timeout`), but resolves all
+      callbacks once at construction and dispatches triggers through integer-indexed tables.
+    - `machine.states[name].timeout` stays writable so that timeouts can be re-randomized per trial.
+    - Timeouts are armed on a TimerScheduler (see component/timers.py), labeled with the state name.
+    - Does not import `transitions`; invalid triggers raise this module's MachineError (same message and `value`).
+"""
+import asyncio
+from collections import deque
+from .timers import TimerScheduler
+
+
+class MachineError(Exception):
+    """ Invalid trigger for the current state (mirrors transitions.MachineError). """
+
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+def _listify(names) -> list:
+    if names is None:
+        return []
+    if isinstance(names, (list, tuple)):
+        return list(names)
+    return [names]
+
+
+class CompiledState(object):
+    """ Minimal state record; `timeout` may be changed at runtime. """
+
+    def __init__(self, index: int, name: str, value, timeout: float = 0, on_timeout=None):
+        self.index = index
+        self.name = name
+        self.value = value
+        self.timeout = timeout
+        self.on_timeout = _listify(on_timeout)
+
+    def __repr__(self):
+        return f'<CompiledState({self.name})@{self.index}>'
+
+
+class CompiledMachine(object):
+    """ Integer-indexed replacement for the `AsyncGraphMachine` used by CenterOut. """
+
+    def __init__(self, model, states: list, transitions: list, initial: str = None, after_state_change=None, loop=None, timers: TimerScheduler = None):
+        self.model = model
+        self.loop = loop
+        self.timers = timers if timers is not None else TimerScheduler(loop)
+        self.states = {} # name --> CompiledState
+        self._states = [] # index --> CompiledState
+        for s in states:
+            value = s['name']
+            name = value.name if hasattr(value, 'name') else value
+            state = CompiledState(len(self._states), name, value, s.get('timeout', 0), s.get('on_timeout'))
+            self.states[name] = state
+            self._states.append(state)
+        n = len(self._states)
+
+        # Trigger index --> [source state index --> (dest index, before callables, after callables) or None]
+        self._triggers = []
+        self._table = []
+        index = {}
+        for t in transitions:
+            trigger = t['trigger']
+            if trigger not in index:
+                index[trigger] = len(self._triggers)
+                self._triggers.append(trigger)
+                self._table.append([None] * n)
+            row = self._table[index[trigger]]
+            dest = self.states[self._name(t['dest'])].index
+            entry = (dest, self._resolve(t.get('before')), self._resolve(t.get('after')))
+            sources = range(n) if t['source'] == '*' else [self.states[self._name(src)].index for src in _listify(t['source'])]
+            for src in sources:
+                if row[src] is None: # First matching definition wins, as in `transitions`.
+                    row[src] = entry
+        self._after_state_change = self._resolve(after_state_change)
+        self._on_timeout = [[index[name] for name in s.on_timeout] for s in self._states]
+
+        for name, i in index.items():
+            setattr(model, name, self._make_trigger(i))
+
+        self._queue = deque()
+        self._processing = False
+        self._timer = None
+        self._state = self.states[initial].index if initial is not None else 0
+        model.state = self._states[self._state].value
+
+    @staticmethod
+    def _name(state) -> str:
+        return state.name if hasattr(state, 'name') else state
+
+    def _resolve(self, names) -> tuple:
+        """ Binds callback names to (callable, is_coroutine) pairs once, at compile time. """
+        return tuple((getattr(self.model, name), asyncio.iscoroutinefunction(getattr(self.model, name))) for name in _listify(names))
+
+    def _make_trigger(self, index: int):
+        async def trigger():
+            return await self.trigger(index)
+        trigger.__name__ = self._triggers[index]
+        return trigger
+
+    @property
+    def state(self) -> str:
+        return self._states[self._state].name
+
+    async def trigger(self, index: int) -> bool:
+        """ Queues trigger `index` and processes the queue unless a transition is already running. """
+        self._queue.append(index)
+        if self._processing:
+            return True
+        self._processing = True
+        try:
+            while self._queue:
+                await self._process(self._queue.popleft())
+        except Exception:
+            self._queue.clear()
+            raise
+        finally:
+            self._processing = False
+        return True
+
+    async def _process(self, index: int):
+        entry = self._table[index][self._state]
+        if entry is None:
+            raise MachineError(f"Can't trigger event {self._triggers[index]} from state {self.state}!")
+        dest, before, after = entry
+        for fn, is_async in before:
+            if is_async:
+                await fn()
+            else:
+                fn()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._state = dest
+        state = self._states[dest]
+        self.model.state = state.value
+        if state.timeout > 0:
+            self._timer = self.timers.call_later(state.timeout, self._timeout, dest, label=state.name)
+        for fn, is_async in after:
+            if is_async:
+                await fn()
+            else:
+                fn()
+        for fn, is_async in self._after_state_change:
+            if is_async:
+                await fn()
+            else:
+                fn()
+
+    def _timeout(self, index: int):
+        self._timer = None
+        if self._state == index:
+            for trigger in self._on_timeout[index]:
+                self.timers.spawn(self.trigger(trigger))
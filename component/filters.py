@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the cursor filter pipeline (raw ADC samples --> filtered cursor pixels).
+
+Note:
+    - The pipeline is the calibration map followed by the stages named in 'Filter Pipeline' (params.txt,
+      comma-separated names from STAGES, e.g. 'one_euro,extrapolate'); each stage reads its own parameters
+      from TaskParams in configure(), which keeps its state, so changing a coefficient does not restart it.
+    - Stages filter whole frames: process(xy, t) works in place on a (2, n) array of x/y rows given the sample
+      times t (monotonic s) and keeps its state (last inputs/outputs) in preallocated arrays between frames.
+      step() is the scalar path used for single samples.
+    - The recursive stages (EMA, one-euro, the biquad's poles) use the closed form of the first-order recursion
+      y[n] = a[n] x[n] + b[n] y[n-1] (see recurse()): a frame costs a few NumPy calls instead of a Python loop.
+      Those calls have a fixed cost of about ten microseconds, so the EMA (the default stage) still loops over short frames.
+      The dead-zone's hysteresis is sequential; it only loops from the first sample that leaves the zone.
+    - Pipeline.cost() is the measured CPU time per sample of every stage and Pipeline.group_delay() the delay
+      each adds at low frequencies (s, at 'Sample Rate'); the extrapolator's is negative, since it leads its input
+      by 'Extrapolation Horizon' to offset render latency. tests/bench_filters.py measures both on test signals.
+    - Display stages (the extrapolator) only change what is drawn: they run after the other stages, on a copy of
+      the last filtered sample (Pipeline.shown), so target tests and recordings never see the lead.
+"""
+import functools, math, time
+from array import array
+import numpy as np
+
+_DEPTH = 200.0 # recurse() restarts its cumulative product before it falls below exp(-_DEPTH)
+_TINY = 1e-12
+_LOOP_MAX = 32 # frames up to this length run the EMA as a Python loop (cheaper than the fixed cost of recurse())
+
+
+@functools.lru_cache(maxsize=64)
+def _powers(b, n: int) -> np.ndarray:
+    """ b ** [1, ..., n] (cached: the constant-coefficient stages ask for the same few frame lengths). """
+    return b ** np.arange(1, n + 1)
+
+
+def recurse(x: np.ndarray, a, b, y0) -> np.ndarray:
+    """ y[n] = a[n] x[n] + b[n] y[n-1] along the last axis of x (2, n), with y[-1] = y0 (2,); a, b broadcast (b may be complex). """
+    ax = a * x
+    if np.ndim(b) == 0 and abs(b) > _TINY: # constant coefficient: cached powers
+        n = ax.shape[-1]
+        length = n if abs(b) >= 1 else max(1, min(n, int(_DEPTH / -math.log(abs(b)))))
+        P = _powers(b, length)
+        y = np.empty(ax.shape, dtype=np.result_type(ax, b, y0))
+        prev = np.asarray(y0)
+        for s in range(0, n, length):
+            e = min(s + length, n)
+            y[:, s:e] = P[:e - s] * (prev[:, None] + np.cumsum(ax[:, s:e] / P[:e - s], axis=1))
+            prev = y[:, e - 1]
+        return y
+    b = np.broadcast_to(b, ax.shape)
+    y = np.empty(ax.shape, dtype=np.result_type(ax, b, y0))
+    depth = -np.cumsum(np.log(np.maximum(np.abs(b), _TINY)).min(axis=0))
+    edges = [0] + np.searchsorted(depth, np.arange(_DEPTH, depth[-1], _DEPTH)).tolist() + [ax.shape[-1]]
+    prev = np.asarray(y0)
+    for s, e in zip(edges[:-1], edges[1:]):
+        if e > s:
+            P = np.cumprod(b[:, s:e], axis=1)
+            y[:, s:e] = P * (prev[:, None] + np.cumsum(ax[:, s:e] / P, axis=1))
+            prev = y[:, e - 1]
+    return y
+
+
+def _intervals(t: np.ndarray, t_last: float, rate: float) -> np.ndarray:
+    """ Sample intervals (s); repeated or unknown times count as one nominal sample period. """
+    dt = np.diff(t, prepend=t_last if t_last is not None else t[0])
+    return np.where(dt > 0, dt, 1.0 / rate)
+
+
+class Stage(object):
+    """ A filter stage: configure() reads its parameters, reset() sets its output, process() filters a frame. """
+
+    name = None
+    display = False # True: shapes only the displayed cursor (see Pipeline.shown), never the task position
+
+    def configure(self, p):
+        self.rate = p.sample_rate
+
+    def reset(self, x: float, y: float):
+        pass
+
+    def process(self, xy: np.ndarray, t: np.ndarray):
+        raise NotImplementedError
+
+    def step(self, x: float, y: float, t: float) -> tuple:
+        xy = np.array([[x], [y]])
+        self.process(xy, np.array([t]))
+        return float(xy[0, 0]), float(xy[1, 0])
+
+    def delay(self) -> float:
+        """ Group delay (s) at low frequencies. """
+        return 0.0
+
+
+class Calibration(Stage):
+    """ Linear map of the ADC bounds to the canvas (x: left --> 0, right --> w; y: bottom --> 0, top --> h). """
+
+    name = 'calibration'
+
+    def __init__(self, w: float, h: float):
+        self.w, self.h = w, h
+
+    def configure(self, p):
+        super().configure(p)
+        self.bounds = (p.adc_left, p.adc_right, p.adc_bottom, p.adc_top)
+
+    def process(self, xy, t):
+        left, right, bottom, top = self.bounds
+        xy[0] = (xy[0] - left) * self.w / (right - left)
+        xy[1] = (xy[1] - bottom) * self.h / (top - bottom)
+
+    def step(self, x, y, t):
+        left, right, bottom, top = self.bounds
+        return (x - left) * self.w / (right - left), (y - bottom) * self.h / (top - bottom)
+
+
+class EMA(Stage):
+    """ Exponential moving average: y = alpha x + (1 - alpha) y[-1] ('EMA Alpha'). """
+
+    name = 'ema'
+
+    def __init__(self):
+        self.y = np.zeros(2)
+
+    def configure(self, p):
+        super().configure(p)
+        self.alpha = p.ema_alpha
+
+    def reset(self, x, y):
+        self.y[:] = (x, y)
+
+    def process(self, xy, t):
+        alpha = self.alpha
+        if xy.shape[1] > _LOOP_MAX:
+            xy[:] = recurse(xy, alpha, 1 - alpha, self.y)
+        else: # a short frame costs less as a loop than as the NumPy calls of recurse()
+            mx, my = xy.tolist()
+            x, y = self.y.tolist()
+            for i in range(len(mx)):
+                mx[i] = x = alpha * mx[i] + (1 - alpha) * x
+                my[i] = y = alpha * my[i] + (1 - alpha) * y
+            xy[0], xy[1] = mx, my
+        self.y[:] = xy[:, -1]
+
+    def step(self, x, y, t):
+        alpha = self.alpha
+        x = alpha * x + (1 - alpha) * self.y[0]
+        y = alpha * y + (1 - alpha) * self.y[1]
+        self.y[0], self.y[1] = x, y
+        return x, y
+
+    def delay(self):
+        return (1 - self.alpha) / self.alpha / self.rate
+
+
+class OneEuro(Stage):
+    """ One-euro filter: a low-pass whose cutoff rises with speed (Casiez et al., CHI 2012).
+
+    cutoff = 'One Euro Min Cutoff' + 'One Euro Beta' * |speed| (Hz), with the speed low-passed at 'One Euro D Cutoff'.
+    """
+
+    name = 'one_euro'
+
+    def __init__(self):
+        self.x = np.zeros(2) # last input
+        self.y = np.zeros(2) # last output
+        self.dx = np.zeros(2) # last filtered speed (pixels/s)
+        self.t = None
+
+    def configure(self, p):
+        super().configure(p)
+        self.min_cutoff = p.one_euro_min_cutoff
+        self.beta = p.one_euro_beta
+        self.d_cutoff = p.one_euro_d_cutoff
+
+    def reset(self, x, y):
+        self.x[:] = self.y[:] = (x, y)
+        self.dx[:] = 0.0
+        self.t = None
+
+    def process(self, xy, t):
+        dt = _intervals(t, self.t, self.rate)
+        a = dt / (dt + 1.0 / (2 * math.pi * self.d_cutoff))
+        dx = recurse(np.diff(xy, prepend=self.x[:, None]) / dt, a, 1 - a, self.dx)
+        self.x[:], self.dx[:], self.t = xy[:, -1], dx[:, -1], float(t[-1])
+        tau = 1.0 / (2 * math.pi * (self.min_cutoff + self.beta * np.abs(dx)))
+        a = dt / (dt + tau)
+        xy[:] = recurse(xy, a, 1 - a, self.y)
+        self.y[:] = xy[:, -1]
+
+    def delay(self):
+        return 1.0 / (2 * math.pi * self.min_cutoff) # at rest (lowest cutoff)
+
+
+class Biquad(Stage):
+    """ Second-order low-pass ('Biquad Cutoff' Hz, 'Biquad Q' > 0.5; 0.7071 is Butterworth) at 'Sample Rate'.
+
+    The numerator runs as a 3-tap FIR; the complex-conjugate poles p, p* as one complex first-order recursion
+    u[n] = w[n] + p u[n-1], with y = 2 Re(c u) (partial fractions).
+    """
+
+    name = 'biquad'
+
+    def __init__(self):
+        self.xh = np.zeros((2, 2)) # last two inputs per axis
+        self.u = np.zeros(2, dtype=complex)
+
+    def configure(self, p):
+        super().configure(p)
+        if not p.biquad_q > 0.5:
+            raise ValueError(f"'Biquad Q' must be > 0.5 (got {p.biquad_q}).")
+        if not 0 < p.biquad_cutoff < p.sample_rate / 2:
+            raise ValueError(f"'Biquad Cutoff' must be between 0 and half the 'Sample Rate' (got {p.biquad_cutoff}).")
+        w0 = 2 * math.pi * p.biquad_cutoff / p.sample_rate # RBJ audio EQ cookbook low-pass
+        alpha = math.sin(w0) / (2 * p.biquad_q)
+        a0 = 1 + alpha
+        self.b = np.array([(1 - math.cos(w0)) / 2, 1 - math.cos(w0), (1 - math.cos(w0)) / 2]) / a0
+        self.a = np.array([1.0, -2 * math.cos(w0) / a0, (1 - alpha) / a0])
+        self.pole = complex(np.roots(self.a)[0])
+        self.c = self.pole / (self.pole - self.pole.conjugate())
+
+    def reset(self, x, y):
+        self.xh[:] = np.array([x, y])[:, None]
+        self.u[:] = self.b.sum() * np.array([x, y]) / (1 - self.pole) # steady state
+
+    def process(self, xy, t):
+        n = xy.shape[1]
+        padded = np.concatenate([self.xh, xy], axis=1)
+        w = self.b[0] * padded[:, 2:] + self.b[1] * padded[:, 1:-1] + self.b[2] * padded[:, :-2]
+        self.xh[:] = padded[:, n:]
+        u = recurse(w, 1.0, self.pole, self.u)
+        self.u[:] = u[:, -1]
+        xy[:] = 2 * (self.c * u).real
+
+    def delay(self):
+        k = np.arange(3)
+        return float((k @ self.b) / self.b.sum() - (k @ self.a) / self.a.sum()) / self.rate
+
+
+class DeadZone(Stage):
+    """ Hysteresis: the output holds until the input is 'Dead Zone' pixels away, then follows it at that distance.
+
+    Suppresses jitter at rest; while moving, the output trails the input by the radius (a position lag, not a delay).
+    """
+
+    name = 'dead_zone'
+
+    def __init__(self):
+        self.y = np.zeros(2)
+
+    def configure(self, p):
+        super().configure(p)
+        self.radius = p.dead_zone
+
+    def reset(self, x, y):
+        self.y[:] = (x, y)
+
+    def process(self, xy, t):
+        r = self.radius
+        if r <= 0:
+            self.y[:] = xy[:, -1]
+            return
+        out = np.hypot(xy[0] - self.y[0], xy[1] - self.y[1]) > r
+        start = int(np.argmax(out)) if out.any() else xy.shape[1]
+        ox, oy = self.y
+        xy[0, :start], xy[1, :start] = ox, oy
+        for i in range(start, xy.shape[1]): # sequential from the first sample that left the zone
+            dx, dy = xy[0, i] - ox, xy[1, i] - oy
+            d = math.hypot(dx, dy)
+            if d > r:
+                ox, oy = ox + dx * (1 - r / d), oy + dy * (1 - r / d)
+            xy[0, i], xy[1, i] = ox, oy
+        self.y[:] = ox, oy
+
+
+class Extrapolator(Stage):
+    """ Leads the cursor by 'Extrapolation Horizon' s along its velocity (low-passed with 'Extrapolation Alpha').
+
+    Set the horizon to the measured input-to-display latency (see the 'latency' event) to offset it.
+    """
+
+    name = 'extrapolate'
+    display = True
+
+    def __init__(self):
+        self.x = np.zeros(2) # last input
+        self.v = np.zeros(2) # last filtered velocity (pixels/s)
+        self.t = None
+
+    def configure(self, p):
+        super().configure(p)
+        self.horizon = p.extrapolation_horizon
+        self.alpha = p.extrapolation_alpha
+
+    def reset(self, x, y):
+        self.x[:] = (x, y)
+        self.v[:] = 0.0
+        self.t = None
+
+    def process(self, xy, t):
+        dt = _intervals(t, self.t, self.rate)
+        v = recurse(np.diff(xy, prepend=self.x[:, None]) / dt, self.alpha, 1 - self.alpha, self.v)
+        self.x[:], self.v[:], self.t = xy[:, -1], v[:, -1], float(t[-1])
+        xy += self.horizon * v
+
+    def delay(self):
+        return -self.horizon
+
+
+STAGES = {stage.name: stage for stage in (EMA, OneEuro, Biquad, DeadZone, Extrapolator)}
+
+
+def parse_stages(text: str) -> tuple:
+    """ Stage names of a 'Filter Pipeline' value ('ema, one_euro' --> ('ema', 'one_euro'); 'none' or '' --> ()).
+
+    Display stages are moved after the others (in their given order), which is where the pipeline runs them.
+    """
+    names = tuple(name.strip() for name in text.split(',') if name.strip() and name.strip() != 'none')
+    for name in names:
+        if name not in STAGES:
+            raise ValueError(f"Unknown filter stage '{name}' in 'Filter Pipeline' (expected {', '.join(STAGES)}).")
+    return tuple(sorted(names, key=lambda name: STAGES[name].display))
+
+
+class Pipeline(object):
+    """ The calibration map followed by the configured stages, with per-stage CPU time counters.
+
+    process() and step() return the task position (without the display stages); `shown` is the position to draw
+    and `led` the last frame as drawn (x and y arrays).
+    """
+
+    def __init__(self, names: tuple, p, w: float, h: float):
+        self.names = (Calibration.name,) + tuple(names)
+        self.stages = [Calibration(w, h)] + [STAGES[name]() for name in names]
+        self.split = next((i for i, stage in enumerate(self.stages) if stage.display), len(self.stages)) # first display stage
+        self.ns = array('Q', bytes(8 * len(self.stages))) # CPU time per stage
+        self.samples = 0
+        self.shown = [w / 2, h / 2] # displayed cursor position (the last task position led by the display stages)
+        self.led = None
+        self.configure(p)
+
+    def configure(self, p):
+        for stage in self.stages:
+            stage.configure(p)
+
+    def reset(self, x: float, y: float):
+        """ Sets every stage's output (and history) to the cursor position (x, y). """
+        for stage in self.stages[1:]:
+            stage.reset(x, y)
+        self.shown[:] = (x, y)
+
+    def process(self, xs, ys, ts) -> tuple:
+        """ Filters a frame of raw ADC samples taken at times ts; returns task x and y arrays. """
+        xy = np.array([xs, ys], dtype=float)
+        ts = np.asarray(ts, dtype=float)
+        if xy.shape[1] <= 1: # nothing to vectorize: the scalar path
+            if len(ts):
+                xy[0, 0], xy[1, 0] = self.step(xy[0, 0], xy[1, 0], ts[0])
+            self.led = (np.array(self.shown[:1]), np.array(self.shown[1:])) if len(ts) else (xy[0], xy[1])
+            return xy[0], xy[1]
+        ns, clock, split = self.ns, time.perf_counter_ns, self.split
+        t0 = clock()
+        for i, stage in enumerate(self.stages):
+            if i == split: # the display stages lead a copy; the task keeps xy
+                task, xy = xy, xy.copy()
+            stage.process(xy, ts)
+            t1 = clock()
+            ns[i] += t1 - t0
+            t0 = t1
+        self.samples += xy.shape[1]
+        self.shown[:] = xy[:, -1].tolist()
+        self.led = (xy[0], xy[1])
+        return (task[0], task[1]) if split < len(self.stages) else (xy[0], xy[1])
+
+    def step(self, x: float, y: float, t: float) -> tuple:
+        """ Filters one raw ADC sample; returns the task position. """
+        ns, clock, split = self.ns, time.perf_counter_ns, self.split
+        t0 = clock()
+        task = None
+        for i, stage in enumerate(self.stages):
+            if i == split:
+                task = (x, y)
+            x, y = stage.step(x, y, t)
+            t1 = clock()
+            ns[i] += t1 - t0
+            t0 = t1
+        self.samples += 1
+        self.shown[0], self.shown[1] = x, y
+        return (x, y) if task is None else task
+
+    def cost(self) -> dict:
+        """ {stage: CPU seconds per sample} since the pipeline was built. """
+        return {name: self.ns[i] * 1e-9 / self.samples if self.samples else 0.0 for i, name in enumerate(self.names)}
+
+    def group_delay(self) -> dict:
+        """ {stage: low-frequency group delay (s)}; the pipeline's is the sum. """
+        return {name: stage.delay() for name, stage in zip(self.names, self.stages)}
@@ -1,13 +1,26 @@
 #!/usr/bin/env python
-import asyncio, csv, json, math, websockets
+import asyncio, json, logging, math, os, secrets, time, websockets
+from array import array
+from urllib.parse import parse_qs, urlsplit
 from .enumerations import TaskState, OutcomeState, TaskDirection
+from . import protocol
+from .broadcast import Broadcaster
+from .compiled import CompiledMachine
+from .recorder import Recorder, SAMPLE, TRANSITION, OUTCOME
+from .logs import rotate_log
+from .params import TaskParams, ParamsLoader
+from .schedule import TrialSchedule, BLOCKS, load_targets
+from .tracing import LatencyTracer, client_label, same_host
+from .timers import TimerScheduler
+from .metrics import ConnectionCounters, Exposition
+from .stats import SessionStats
+from .filters import Pipeline, parse_stages
+from .snapshot import Snapshot
+import numpy as np
 from numpy import random as rng
-from transitions.extensions import AsyncGraphMachine as AGMachine
-from transitions.extensions.states import add_state_features
-from transitions.extensions.asyncio import AsyncTimeout
 
 
-def randomize(min_val: float, max_val: float = None, cdf_bound = 5):
+def randomize(min_val: float, max_val: float = None, cdf_bound = 5, generator = rng):
     """Returns a random value (seconds) from an exponential distribution with fixed upper and lower bounds."""
     # Setting exponential cdf: 99.326% of values fall between [0, 5 * (1/lambda)]
     #   Note: lambda is sometimes called "intensity" parameter (it's the mean RATE of "something happens")
@@ -20,7 +33,7 @@ def randomize(min_val: float, max_val: float = None, cdf_bound = 5):
     elif max_val > min_val:
         beta = (max_val - min_val) / cdf_bound
         # Add the minimum number of seconds back onto the value, and clip to t_max_s (should rarely clip if cdf_bound is high enough)
-        random_out = min(rng.exponential(scale=beta), max_val) + min_val
+        random_out = min(generator.exponential(scale=beta), max_val) + min_val
     else:
         random_out = min_val
     return random_out
@@ -37,10 +50,6 @@ def ema(alpha: float, x: float, y: float) -> float:
     """Applies EMA coefficient to x given past last sample of x (y)."""
     return (alpha * x) + ((1 - alpha) * y)
 
-@add_state_features(AsyncTimeout)
-class TimeoutMachine(AGMachine):
-    pass
-
 
 class CenterOut(object):
 
@@ -77,13 +86,69 @@ class CenterOut(object):
         {'trigger': 'fail', 'source': '*', 'dest': TaskState.t1_pre, 'after':'count_bad'}
     ]
 
-    def __init__(self, targets_file: str = '../config/targets.txt', params_file: str = '../config/params.json'):
-        '''Constructor for CenterOut object.'''
-        import logging
+    # Per-sample checks run by check_state: (target: 0 = T1 / 1 = T2, cursor inside when it fires, trigger)
+    checks = {
+        TaskState.t1_pre:    (0, True,  'enter_t1'), # Hit T1: advances state to t1_hold_1
+        TaskState.t1_hold_1: (0, False, 'leave_t1'), # Left T1: failure, but not counted as such (too early in trial)
+        TaskState.t1_hold_2: (0, False, 'fail'),
+        TaskState.go:        (0, False, 'react'),    # Left T1: advances state to move
+        TaskState.move:      (1, True,  'enter_t2'), # Hit T2: advances state to t2_hold_1
+        TaskState.t2_hold_1: (1, False, 'overshoot'),
+        TaskState.overshoot: (1, True,  'enter_t2')  # Back in T2: advances state to t2_hold_1
+    }
+
+    # Precomputations and the parameters they depend on (rerun only when one of these changes)
+    derived = {
+        '_precompute_target_radius': ('Target Size', 'Cursor Size'),
+        '_precompute_target_locations': ('N Targets', 'Outer Target Circle Radius', 'Target Angle Offset'),
+        '_precompute_state_timeouts': ('Min T1_HOLD_1 Time', 'Max T1_HOLD_1 Time', 'Min T1_HOLD_2 Time', 'Max T1_HOLD_2 Time',
+                                       'Fixed GO Limit', 'Fixed MOVE Limit', 'Fixed T2_HOLD_1 Limit', 'Fixed REWARD Delay'),
+        '_precompute_schedule': ('N Trials Baseline', 'N Trials Perturbation', 'N Trials Washout'),
+        '_precompute_filters': ('Filter Pipeline', 'Sample Rate', 'ADC Left', 'ADC Right', 'ADC Top', 'ADC Bottom', 'EMA Alpha',
+                                'One Euro Min Cutoff', 'One Euro Beta', 'One Euro D Cutoff', 'Biquad Cutoff', 'Biquad Q',
+                                'Dead Zone', 'Extrapolation Horizon', 'Extrapolation Alpha')
+    }
+
+    # params event field --> parameter
+    params_fields = {
+        "BaselineTrials": 'N Trials Baseline',
+        "PerturbationTrials": 'N Trials Perturbation',
+        "WashoutTrials": 'N Trials Washout',
+        "VMR_Rotation": 'VMR Rotation Angle',
+        "Mode": 'Mode',
+        "TargetRingRadius": 'Outer Target Circle Radius',
+        "TargetSize": 'Target Size',
+        "CursorSize": 'Cursor Size',
+        "JitterAngularVar": 'Jitter Angular Variance',
+        "Alpha": 'EMA Alpha',
+        "ADCLeft": 'ADC Left',
+        "ADCRight": 'ADC Right',
+        "ADCTop": 'ADC Top',
+        "ADCBottom": 'ADC Bottom'
+    }
+
+    def __init__(self, targets_file: str = '../config/targets.txt', params_file: str = '../config/params.json', queue_size: int = 8, policies: dict = None, engine: str = 'transitions', data_dir: str = 'data', log_dir: str = 'logs', trace_interval: float = 1.0, trace_window: float = 10.0, session: str = None, timers: TimerScheduler = None, seed: int = None, graph: bool = False, replay_size: int = 256):
+        '''Constructor for CenterOut object.
+
+        queue_size and policies configure the per-client display queues (see component/broadcast.py); replay_size
+        published frames are kept for displays that reconnect with their resume token (0: always resend the snapshot).
+        engine selects the state machine: 'transitions' (TimeoutMachine, see component/machine.py) or 'compiled' (CompiledMachine).
+        graph adds get_graph() to the 'transitions' engine (imports the diagram extension; see component/graph.py to
+        render the state diagram without a CenterOut).
+        data_dir is where session recordings are written when `Save Data` is set (see component/recorder.py).
+        log_dir receives one log file per recorded session, if the server configured logging (see component/logs.py);
+        CenterOut itself never reconfigures the process's loggers.
+        trace_interval is the period (s) of display trace probes (0 disables them); latency histograms
+        cover the last one to two trace_window seconds (see component/tracing.py).
+        session names the instance when several share a process (see component/host.py); its log records go to
+        the 'CENTER-OUT.<session>' logger and recordings no longer rotate the process-wide log file.
+        timers runs the state timeouts and is the task clock (default: the event loop's monotonic clock);
+        component/replay.py passes a virtual clock. seed makes the randomized hold times reproducible.
+        '''
         logging.getLogger("websockets").addHandler(logging.NullHandler())
         logging.getLogger("websockets").propagate = False
-        self.logging = logging
-        self.logging.basicConfig(filename='example.log', filemode='w', level=logging.INFO, format='%(asctime)s::CENTER-OUT::%(levelname)s::%(message)s')
+        self.session = session
+        self.logger = logging.getLogger('CENTER-OUT' if session is None else f'CENTER-OUT.{session}')
         self.w = 1200 # see .canvas in css/main.css --> this is width
         self.h = 800  # see .canvas in css/main.css --> this is height
         self.x = 600  # see .canvas in css/main.css --> this is half of height
@@ -95,236 +160,693 @@ class CenterOut(object):
             'overshoots': 0
         }
         self._r = 50.0 # will change
-        # Initialize the state machine
-        self.machine = TimeoutMachine(model=self, 
-                                      states=CenterOut.states, 
-                                      transitions=CenterOut.transitions,
-                                      initial='idle', 
-                                      queued=True)
-
-        self._t = {
-            TaskDirection.IN: [(self.w / 2, self.h / 2)] * 8,
-            TaskDirection.OUT: [(self.w / 2, self.h / 2)] * 8 
-        }
-        self.p = {'Subject': "Unknown"}
-        self.update_parameters(params_file)
-        self._target = CenterOut._next_line(targets_file)
-        self._users = set()
-
-        self.target = next(self._target)
+        self._r2 = self._r * self._r
+        self._data_dir = data_dir
+        self._log_dir = log_dir
+        self.recorder = None
+        self._last_state = TaskState.idle.value
+        # Initialize the state machine; state timeouts run on self.timers (see component/timers.py)
+        self.timers = timers if timers is not None else TimerScheduler()
+        self.rng = rng if seed is None else np.random.default_rng(seed)
+        if engine == 'compiled':
+            self.machine = CompiledMachine(model=self, 
+                                           states=CenterOut.states, 
+                                           transitions=CenterOut.transitions,
+                                           initial='idle', 
+                                           after_state_change=['record_state', 'push_state'],
+                                           timers=self.timers)
+        elif engine == 'transitions':
+            from .machine import TimeoutMachine, graph_machine # only this engine needs `transitions`
+            machine = graph_machine() if graph else TimeoutMachine
+            self.machine = machine(model=self, 
+                                   states=CenterOut.states, 
+                                   transitions=CenterOut.transitions,
+                                   initial='idle', 
+                                   after_state_change=['record_state', 'push_state'],
+                                   queued=True,
+                                   timers=self.timers)
+        else:
+            raise ValueError(f"Unknown state machine engine '{engine}' (expected 'transitions' or 'compiled').")
+        self._checks = [None] * len(TaskState)
+        for state, (which, fires, trigger) in CenterOut.checks.items():
+            self._checks[state.value] = (which, fires, getattr(self, trigger))
+
+        self._t = np.full((len(TaskDirection), 8, 2), (self.w / 2, self.h / 2)) # [direction, target] --> center (x, y)
+        self.target = 0
+        self.block = 0
         self.direction = [TaskDirection.IN, TaskDirection.OUT]
+        self.schedule = TrialSchedule(load_targets(targets_file))
+        # Sample and event times (monotonic s); reaction/movement times are resolved at target boundary crossings.
+        self.t_sample = None
+        self._prev = (self.x, self.y, None) # cursor position and time before the latest sample
+        self._event_time = None
+        self.t_state = math.nan # time of the latest transition
+        self.t_go = math.nan
+        self.t_move = math.nan
+        self.reaction_time = math.nan
+        self.movement_time = math.nan
+        self.filters = None # raw samples --> cursor pixels, built from 'Filter Pipeline' (see component/filters.py)
+        # Sent alone to every new display; sections are re-encoded only after they change (see component/snapshot.py)
+        self.snapshot = Snapshot({'params': self.display_params,
+                                  'score': lambda: dict(self.n),
+                                  'recent': lambda: self.stats.recent(),
+                                  'stats': lambda: self.stats.summary()})
+        self.p = TaskParams()
+        self._params_loader = ParamsLoader()
+        self.apply_parameters(self._params_loader.load(params_file), force=True)
+        self.tracer = LatencyTracer()
+        self._trace_interval = trace_interval
+        self._trace_window = trace_window
+        self._trace_task = None
+        self._users = Broadcaster(queue_size, policies, self.tracer, replay_size)
+        self._dirty = False # cursor moved since the last render tick
+        self._published = None # last position published to 'delta' clients
+        self._render_task = None
+        # Runtime metrics (see component/metrics.py): preallocated counters, read only when scraped
+        self.connections = ConnectionCounters()
+        self.transition_counts = array('Q', bytes(8 * len(TaskState))) # entries per state
+        self._trial_ends = np.full(256, -np.inf) # times of the latest trial outcomes (ring)
+        self.stats = SessionStats() # online per-trial kinematics and outcome summaries (see component/stats.py)
+
+        self.next_target()
 
     async def check_state(self):
         """ Runs the state machine for the game. """
-        s = self.state.name
-        if s == 'idle': # Do nothing.
-            pass
-        elif s == 't1_pre': # Check to see if we have hit T1.
-            if self.in_t1():
-                await self.enter_t1() # Advances state to t1_hold_1
-
-        elif s == 't1_hold_1': # Check if we haven't left T1 yet (advance state to t1_hold_2 on timeout)
-            if not self.in_t1():
-                await self.leave_t1() # Failure, but not counted as such (too early in trial).
-
-        elif s == 't1_hold_2': # Check if we haven't left T1 yet (advance state to go on timeout)
-            if not self.in_t1():
-                await self.fail()  
-
-        elif s == 'go': # Check if we have left T1 yet (fails on timeout)
-            if not self.in_t1():
-                await self.react()  # Advances state to move
-
-        elif s == 'move': # Check to see if we have hit T2 yet (fails on timeout)
-            if self.in_t2():
-                await self.enter_t2() # Advances state to t2_hold_1
-
-        elif s == 't2_hold_1': # Check that we have not left T2 yet (advances on timeout)
-            if not self.in_t2():
-                await self.overshoot() # Advances state to overshoot
-
-        elif s == 'overshoot': # Check to see if we went back into T2 (fails on timeout)
-            if self.in_t2():
-                await self.enter_t2() # Advances state to t2_hold_1
-
-        elif s == 'reward': # Do nothing.
-            pass
+        check = self._checks[self.state.value]
+        if check is not None: # idle and reward: do nothing.
+            cx, cy = self._c[check[0]]
+            dx, dy = cx - self.x, cy - self.y
+            if (dx * dx + dy * dy < self._r2) == check[1]:
+                await self._fire(check)
+
+    async def _fire(self, check):
+        """ Triggers a check's transition, timestamped where the cursor crossed the target boundary. """
+        x0, y0, t0 = self._prev
+        crossing = self._crossing(check[0], x0, y0, t0, self.x, self.y, self.t_sample, check[1])
+        self._event_time = crossing if not crossing < self.t_state else self.t_state # never before the state was entered
+        try:
+            await check[2]()
+        finally:
+            self._event_time = None
     
     def signal_reward(self):
         """ Run reward dispenser here. """
-        self.logging.info(f'SIGNAL::{self.state.name}::')
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info('SIGNAL::%s::', self.state.name)
 
     def count_good(self):
         """ Increment successful and total trial counters. Also, flip order of t1/t2 (inner vs outer). """
         self.n['successful'] += 1
         self.n['total'] += 1
+        self.record_outcome(OutcomeState.success)
         self.n['overshoots'] = 0
+        self._update_block()
         if self.n['successful'] % 2 == 0:
             self.direction = [TaskDirection.IN, TaskDirection.OUT]
-            self.target = next(self._target)
+            self.next_target()
         else:
             self.direction = [TaskDirection.OUT, TaskDirection.IN]
+            self._update_centers()
+
+    def next_target(self):
+        """ Advances to the next scheduled target. """
+        self.target = self.schedule.next()
+        self._update_centers()
+
+    def _update_block(self):
+        """ Block of the next trial, from the successful trial count (as on the display). """
+        block = self.schedule.block(self.n['successful'])
+        if block != self.block and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info('BLOCK::%s', BLOCKS[block])
+        self.block = block
 
     def count_bad(self):
         """ Increment unsuccessful and total trial counters. """
         self.n['unsuccessful'] += 1
         self.n['total'] += 1
+        self.record_outcome(OutcomeState.failure)
         self.n['overshoots'] = 0
 
+    def record_state(self):
+        """ Records a state transition (the previous state is kept in the record) and resolves reaction/movement times. """
+        t = self.timers.time() if self._event_time is None else self._event_time
+        state = self.state
+        self.t_state = t
+        if state is TaskState.go:
+            self.t_go = t
+        elif state is TaskState.move:
+            self.t_move = t
+            self.reaction_time = t - self.t_go
+        elif state is TaskState.t2_hold_1 and self._last_state == TaskState.move.value:
+            self.movement_time = t - self.t_move
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug('TIMES::RT=%.4f::MT=%.4f', self.reaction_time, self.movement_time)
+        self.transition_counts[state.value] += 1
+        self.stats.transition(state, t, self.x, self.y, self._c[1], self._r)
+        if self.recorder is not None:
+            self.recorder.write(TRANSITION, state.value, self.target, self.direction[1].value, self._last_state, t=t)
+        self._last_state = state.value
+
+    def record_outcome(self, outcome: OutcomeState):
+        t = self.timers.time()
+        self._trial_ends[self.n['total'] % len(self._trial_ends)] = t
+        record = self.stats.finish(outcome is OutcomeState.success, self.target, self.block, self.direction[1].value, self.n['overshoots'], t)
+        if self.recorder is not None:
+            self.recorder.write(OUTCOME, self.state.value, self.target, self.direction[1].value, outcome.value, self.n['overshoots'], self.n['total'], t=t)
+        self.snapshot.invalidate('score', 'recent', 'stats')
+        if self._users:
+            self._users.publish(self.stats_event(record), 'stats')
+
+    def open_session(self):
+        """ Starts a new session recording in data_dir if `Save Data` is set. """
+        if self.p.save_data and self.recorder is None:
+            os.makedirs(self._data_dir, exist_ok=True)
+            fname = os.path.join(self._data_dir, f"{self.p.subject}_{time.strftime('%Y%m%d_%H%M%S')}.rec")
+            self.recorder = Recorder(fname)
+            self.stats.reset() # the session's .stats.json covers its own trials
+            self.snapshot.invalidate('recent', 'stats')
+            if self.session is None:
+                rotate_log(os.path.join(self._log_dir, os.path.splitext(os.path.basename(fname))[0] + '.log'))
+            self.logger.info('SESSION::OPEN::%s', fname)
+
+    def close_session(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.tracer.save(os.path.splitext(self.recorder.fname)[0] + '.latency.json')
+            self.timers.save(os.path.splitext(self.recorder.fname)[0] + '.timeouts.json')
+            self.save_stats(os.path.splitext(self.recorder.fname)[0])
+            self.logger.info('SESSION::CLOSE::%s::%d records', self.recorder.fname, len(self.recorder))
+            self.recorder = None
+
+    def save_stats(self, base: str):
+        """ Writes the summaries to <base>.stats.json and the trial records to <base>.trials.npy. """
+        with open(base + '.stats.json', 'w') as f:
+            json.dump(self.stats.summary(), f, indent=2)
+        np.save(base + '.trials.npy', self.stats.trials())
+
+    async def shutdown(self):
+        """ Stops the task, closes the recording and disconnects every client. """
+        await self.stop()
+        self.close_session()
+        for task in (self._render_task, self._trace_task):
+            if task is not None:
+                task.cancel()
+        self._render_task = self._trace_task = None
+        self._trace_interval = 0
+        await asyncio.gather(*(channel.websocket.close(1001, 'session closed') for channel in list(self._users)), return_exceptions=True)
+
     def in_t1(self) -> bool:
         """ Check if cursor is in primary target. """
-        return l2norm(self._t[self.direction[0]][self.target][0] - self.x, 
-                      self._t[self.direction[0]][self.target][1] - self.y) < self._r
+        cx, cy = self._c[0]
+        return (cx - self.x) ** 2 + (cy - self.y) ** 2 < self._r2
 
     def in_t2(self) -> bool:
         """ Check if cursor is in secondary target. """
-        return l2norm(self._t[self.direction[1]][self.target][0] - self.x, 
-                      self._t[self.direction[1]][self.target][1] - self.y) < self._r
+        cx, cy = self._c[1]
+        return (cx - self.x) ** 2 + (cy - self.y) ** 2 < self._r2
+
+    def in_target_batch(self, which: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """ Tests a frame of cursor positions against the primary (0) or secondary (1) target at once. """
+        cx, cy = self._c[which]
+        return (xs - cx) ** 2 + (ys - cy) ** 2 < self._r2
+
+    def _crossing(self, which: int, x0: float, y0: float, t0: float, x1: float, y1: float, t1: float, entering: bool) -> float:
+        """ Time at which the segment (x0, y0, t0) --> (x1, y1, t1) crosses the boundary of target `which`.
+
+        Solves |p0 + s * (p1 - p0) - c|^2 = r^2 for s in [0, 1]: the first root when entering, the last when leaving.
+        Falls back to t1 when there is no previous sample time or the segment does not reach the boundary.
+        """
+        if t0 is None or t1 is None or t1 <= t0:
+            return t1
+        cx, cy = self._c[which]
+        dx, dy = x1 - x0, y1 - y0
+        ex, ey = x0 - cx, y0 - cy
+        a = dx * dx + dy * dy
+        b = 2.0 * (ex * dx + ey * dy)
+        c = ex * ex + ey * ey - self._r2
+        disc = b * b - 4.0 * a * c
+        if a == 0 or disc < 0:
+            return t1
+        s = (-b - math.sqrt(disc)) / (2.0 * a) if entering else (-b + math.sqrt(disc)) / (2.0 * a)
+        return t0 + min(max(s, 0.0), 1.0) * (t1 - t0)
+
+    def _update_centers(self):
+        """ Caches the current T1/T2 centers (call whenever target, direction or target locations change). """
+        self._c = (tuple(self._t[self.direction[0].value, self.target].tolist()),
+                   tuple(self._t[self.direction[1].value, self.target].tolist()))
 
     def _precompute_target_locations(self):
         """ Precomputes target locations (should be called any time target parameters are changed). """
-        n = int(self.p['N Targets'])
-        r = self.p['Outer Target Circle Radius']
-        o = math.radians(self.p['Target Angle Offset'])
-        self._t[TaskDirection.IN] = [(self.w/2, self.h/2)] * n
-        self._t[TaskDirection.OUT] = [(None, None)] * n
-        for i in range(n):
-            theta_rad = i * math.pi / n + o
-            self._t[TaskDirection.OUT][i] = (self.w/2 + round(r * math.cos(theta_rad)), self.h/2 + round(r * math.sin(theta_rad)))
+        n = int(self.p.n_targets)
+        r = self.p.outer_target_circle_radius
+        o = math.radians(self.p.target_angle_offset)
+        theta_rad = np.arange(n) * math.pi / n + o
+        self._t = np.empty((len(TaskDirection), n, 2))
+        self._t[TaskDirection.IN.value] = (self.w/2, self.h/2)
+        self._t[TaskDirection.OUT.value, :, 0] = self.w/2 + np.round(r * np.cos(theta_rad))
+        self._t[TaskDirection.OUT.value, :, 1] = self.h/2 + np.round(r * np.sin(theta_rad))
+        self._update_centers()
+
+    def _precompute_target_radius(self):
+        """ Precomputes the hit radius (cursor center within target + cursor size). """
+        self._r = self.p.target_size + self.p.cursor_size
+        self._r2 = self._r * self._r
 
     def _precompute_state_timeouts(self):
         """ Precomputes state timeouts. """
-        self.machine.states[TaskState.t1_hold_1.name].timeout = randomize(self.p['Min T1_HOLD_1 Time'], self.p['Max T1_HOLD_1 Time'])
-        self.machine.states[TaskState.t1_hold_2.name].timeout = randomize(self.p['Min T1_HOLD_2 Time'], self.p['Max T1_HOLD_2 Time'])
-        self.machine.states[TaskState.go.name].timeout = self.p['Fixed GO Limit']
-        self.machine.states[TaskState.move.name].timeout = self.p['Fixed MOVE Limit']
-        self.machine.states[TaskState.t2_hold_1.name].timeout = self.p['Fixed T2_HOLD_1 Limit']
-        self.machine.states[TaskState.reward.name].timeout = self.p['Fixed REWARD Delay']            
+        self.machine.states[TaskState.t1_hold_1.name].timeout = randomize(self.p.min_t1_hold_1_time, self.p.max_t1_hold_1_time, generator=self.rng)
+        self.machine.states[TaskState.t1_hold_2.name].timeout = randomize(self.p.min_t1_hold_2_time, self.p.max_t1_hold_2_time, generator=self.rng)
+        self.machine.states[TaskState.go.name].timeout = self.p.fixed_go_limit
+        self.machine.states[TaskState.move.name].timeout = self.p.fixed_move_limit
+        self.machine.states[TaskState.t2_hold_1.name].timeout = self.p.fixed_t2_hold_1_limit
+        self.machine.states[TaskState.reward.name].timeout = self.p.fixed_reward_delay
 
     def randomize_t1_hold_1(self):
-        self.machine.states[TaskState.t1_hold_1.name].timeout = randomize(self.p['Min T1_HOLD_1 Time'], self.p['Max T1_HOLD_1 Time'])
+        self.machine.states[TaskState.t1_hold_1.name].timeout = randomize(self.p.min_t1_hold_1_time, self.p.max_t1_hold_1_time, generator=self.rng)
 
     def randomize_t1_hold_2(self):
-        self.machine.states[TaskState.t1_hold_2.name].timeout = randomize(self.p['Min T1_HOLD_2 Time'], self.p['Max T1_HOLD_2 Time'])
+        self.machine.states[TaskState.t1_hold_2.name].timeout = randomize(self.p.min_t1_hold_2_time, self.p.max_t1_hold_2_time, generator=self.rng)
 
     def increment_overshoot(self):
         self.n['overshoots'] += 1
+        self.snapshot.invalidate('score')
 
     def announce_leaving_reset(self):
         self.n['overshoots'] = 0
         self.n['total'] = 0
         self.n['successful'] = 0
         self.n['unsuccessful'] = 0
-        self.logging.info(f"LEFT::{self.state.name}::RESET")
-
-    def update_parameters(self, fname: str):
-        with open(fname, 'r') as f:
-            tsv_file = csv.reader(f, delimiter="\t")
-            for line in tsv_file:
-                if line[2]=="None":
-                    self.p[line[0]] = line[1]
-                elif line[2]=="bool":
-                    self.p[line[0]] = line[1] == "True"
-                else:
-                    self.p[line[0]] = float(line[1])
-        self._r = self.p['Target Size'] + self.p['Cursor Size']
-        self._precompute_target_locations()
-        self._precompute_state_timeouts()
+        self._update_block()
+        self.stats.reset()
+        self.snapshot.invalidate('score', 'recent', 'stats')
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info('LEFT::%s::RESET', self.state.name)
+
+    def apply_parameters(self, values: dict, force: bool = False) -> set:
+        """ Applies {name: value} and reruns only the precomputations that depend on a changed parameter.
+
+        The values are validated first, including the filter pipeline they configure: on ValueError nothing changes.
+        """
+        candidate = TaskParams(dict(self.p.as_dict(), **values))
+        Pipeline(parse_stages(candidate.filter_pipeline), candidate, self.w, self.h)
+        changed = self.p.update(values)
+        for method, names in CenterOut.derived.items():
+            if force or not changed.isdisjoint(names):
+                getattr(self, method)()
+        if force or changed:
+            self.snapshot.invalidate('params')
+        return changed
+
+    def update_parameters(self, fname: str) -> set:
+        """ Loads a params file (blocking); returns the names of the parameters that changed. """
+        return self.apply_parameters(self._params_loader.load(fname))
+
+    async def reload_parameters(self, fname: str) -> set:
+        """ Loads a params file on the default executor, then applies it on the loop. """
+        values = await asyncio.get_running_loop().run_in_executor(None, self._params_loader.load, fname)
+        return self.apply_parameters(values)
+
+    def _block_trials(self) -> tuple:
+        return (self.p.n_trials_baseline, self.p.n_trials_perturbation, self.p.n_trials_washout)
+
+    def _precompute_filters(self):
+        """ Rebuilds the filter pipeline when its stages changed (starting from the cursor), else reconfigures it in place. """
+        stages = parse_stages(self.p.filter_pipeline)
+        if self.filters is None or self.filters.names[1:] != stages:
+            self.filters = Pipeline(stages, self.p, self.w, self.h)
+            self.filters.reset(self.x, self.y)
+        else:
+            self.filters.configure(self.p)
+
+    def _precompute_schedule(self):
+        """ Relabels the schedule's blocks (same targets, same position) after the block trial counts changed. """
+        self.schedule = self.schedule.relabel(self._block_trials())
+        self._update_block()
+
+    def swap_schedule(self, schedule: TrialSchedule):
+        """ Replaces the trial schedule in one step; the current target changes now only between trials. """
+        self.schedule = schedule
+        self._update_block()
+        if self.state in (TaskState.idle, TaskState.t1_pre):
+            self.next_target()
 
     def update_targets(self, fname: str):
-        del self._target
-        self._target = CenterOut._next_line(fname)
-        self.target = next(self.target)
+        self.swap_schedule(TrialSchedule.from_file(fname, self._block_trials()))
+
+    async def reload_targets(self, fname: str):
+        """ Loads a targets file on the default executor, then swaps it in on the loop. """
+        targets = await asyncio.get_running_loop().run_in_executor(None, load_targets, fname)
+        self.swap_schedule(TrialSchedule(targets, self._block_trials()))
 
     def users_event(self):
         return json.dumps({"event": "none", "type": "users", "count": len(self._users)})
 
+    def shown(self) -> tuple:
+        """ Displayed cursor position (whole pixels): the task position led by the display filter stages. """
+        x, y = self.filters.shown
+        return int(x), int(y)
+
     def cursor_event(self):
-        return json.dumps({"event": "none", "type": "cursor", "x": int(self.x), "y": int(self.y), "target": self.target, "state": self.state.name, "direction": str(self.direction[1].name).lower()})
-
-    def params_event(self):
-        return json.dumps({
-            "event": "none", 
-            "type": "params", 
-            "BaselineTrials": self.p['N Trials Baseline'], 
-            "PeturbationTrials": self.p['N Trials Perturbation'], 
-            "WashoutTrials": self.p['N Trials Washout'], 
-            "VMR_Rotation": self.p['VMR Rotation Angle'],
-            "Mode": self.p['Mode'], 
-            "TargetRingRadius": self.p['Outer Target Circle Radius'], 
-            "TargetSize": self.p['Target Size'], 
-            "CursorSize": self.p['Cursor Size'], 
-            "JitterAngularVar": self.p['Jitter Angular Variance'], 
-            "Alpha": self.p['EMA Alpha'], 
-            "ADCLeft": self.p['ADC Left'], 
-            "ADCRight": self.p['ADC Right'],
-            "ADCTop": self.p['ADC Top'], 
-            "ADCBottom": self.p['ADC Bottom']
-        })
+        x, y = self.shown()
+        return json.dumps({"event": "none", "type": "cursor", "x": x, "y": y, "target": self.target, "state": self.state.name, "direction": str(self.direction[1].name).lower()})
+
+    def binary_cursor_event(self):
+        return protocol.encode_display(*self.shown(), self.target, self.state, self.direction[1])
+
+    def position_event(self):
+        """ Position frame of the 'delta' encoding, or None if the quantized position was already published. """
+        position = self.shown()
+        if position == self._published:
+            return None
+        self._published = position
+        return protocol.encode_position(*position)
+
+    def keyframe(self, encoding: str):
+        """ Full cursor/state frame in `encoding` ('delta' keyframes are binary display frames). """
+        return self.cursor_event() if encoding == 'json' else self.binary_cursor_event()
+
+    def display_params(self, changed: set = None) -> dict:
+        """ {field: value} of all display parameters, or only of those in `changed`. """
+        return {field: self.p[name] for field, name in CenterOut.params_fields.items() if changed is None or name in changed}
+
+    def params_event(self, changed: set = None):
+        """ All display parameters, or only those in `changed` (None if none of them changed). """
+        params = self.display_params(changed)
+        return json.dumps(dict({"event": "none", "type": "params"}, **params)) if params else None
+
+    def snapshot_event(self, token: str = None):
+        """ Snapshot frame: cached sections, plus the current cursor/state, users count and the client's resume token. """
+        x, y = self.shown()
+        cursor = {"x": x, "y": y, "target": self.target, "block": self.block, "state": self.state.name,
+                  "direction": str(self.direction[1].name).lower()}
+        return self.snapshot.encode(cursor=cursor, users=len(self._users), token=token)
+
+    def trace_event(self, probe: int):
+        return json.dumps({"event": "none", "type": "trace", "id": probe})
+
+    def latency_event(self):
+        return json.dumps({"event": "none", "type": "latency", "stages": self.tracer.summary(), "timeouts": self.timers.summary(),
+                           "filters": {"delay": self.filters.group_delay(), "cost": self.filters.cost()}})
+
+    def stats_event(self, record=None):
+        """ The trial `record` with the summaries it updated, or every summary (no record). """
+        event = self.stats.summary() if record is None else self.stats.update(record)
+        return json.dumps(dict({"event": "none", "type": "stats"}, **event))
+
+    def collect_metrics(self, out: Exposition):
+        """ Adds this session's counters to a metrics exposition (see component/metrics.py). """
+        base = {} if self.session is None else {'session': self.session}
+        connections = self.connections
+        rates = connections.rates()
+        for slot, client in enumerate(connections.labels):
+            if client is None or (client == connections.OVERFLOW and connections.messages[slot] == 0):
+                continue
+            labels = dict(base, client=client)
+            out.add('centerout_inbound_messages_total', 'counter', 'Messages received per connection.', connections.messages[slot], labels)
+            out.add('centerout_inbound_samples_total', 'counter', 'Cursor samples received per connection.', connections.samples[slot], labels)
+            if slot in rates:
+                out.add('centerout_inbound_messages_per_second', 'gauge', 'Messages per second per connection since the previous scrape.', rates[slot], labels)
+        out.add('centerout_display_clients', 'gauge', 'Connected clients.', len(self._users), base)
+        out.add('centerout_display_detached_clients', 'gauge', 'Disconnected clients that may still resume.', self._users.detached, base)
+        for channel in self._users:
+            labels = dict(base, client=channel.label, encoding=channel.encoding)
+            out.add('centerout_display_queue_depth', 'gauge', 'Frames queued for a client.', len(channel), labels)
+            out.add('centerout_display_dropped_total', 'counter', 'Cursor frames dropped for a slow client.', channel.dropped, labels)
+        out.add('centerout_state', 'gauge', 'Current task state (TaskState value).', self.state.value, base)
+        for state in TaskState:
+            out.add('centerout_transitions_total', 'counter', 'Entries into each task state.', self.transition_counts[state.value], dict(base, state=state.name))
+        for outcome in ('successful', 'unsuccessful'):
+            out.add('centerout_trials_total', 'counter', 'Completed trials by outcome.', self.n[outcome], dict(base, outcome=outcome))
+        if self.n['total']:
+            out.add('centerout_success_ratio', 'gauge', 'Successful / total trials.', self.n['successful'] / self.n['total'], base)
+        delays = self.filters.group_delay()
+        for stage, cost in self.filters.cost().items():
+            labels = dict(base, stage=stage)
+            out.add('centerout_filter_seconds_per_sample', 'gauge', 'CPU time per cursor sample of each filter stage.', cost, labels)
+            out.add('centerout_filter_group_delay_seconds', 'gauge', 'Low-frequency group delay of each filter stage.', delays[stage], labels)
+        now = self.timers.time()
+        out.add('centerout_trials_per_minute', 'gauge', 'Trials completed in the last 60 s.', int(np.count_nonzero(self._trial_ends > now - 60.0)), base)
+        for label, drift in self.timers.summary().items():
+            if label == 'all' or not drift['n']:
+                continue
+            for q, key in (('0.5', 'p50'), ('0.99', 'p99'), ('1', 'max')):
+                out.add('centerout_timeout_drift_seconds', 'gauge', 'Actual - planned firing time of state timeouts.', drift[key], dict(base, state=label, quantile=q))
 
     async def notify_users(self):
-        if self._users:  # asyncio.wait doesn't accept an empty list
-            message = self.users_event()
-            await asyncio.wait([user.send(message) for user in self._users])
-
-    async def notify_cursor(self):
         if self._users:
-            message = self.cursor_event()
-            await asyncio.wait([user.send(message) for user in self._users])
+            self._users.publish(self.users_event(), 'users')
 
-    async def notify_params(self):
+    async def notify_cursor(self, keyframe: bool = False):
+        """ Publishes the cursor; keyframes (state changes) carry the full state to every encoding and are never dropped. """
         if self._users:
-            message = self.params_event()
-            await asyncio.wait([user.send(message) for user in self._users])
+            encodings = self._users.encodings
+            frames = {}
+            if 'json' in encodings:
+                frames['json'] = self.cursor_event()
+            if 'binary' in encodings or (keyframe and 'delta' in encodings):
+                frames['binary'] = self.binary_cursor_event()
+            if 'delta' in encodings:
+                if keyframe:
+                    frames['delta'] = frames['binary']
+                    self._published = self.shown()
+                else:
+                    frames['delta'] = self.position_event()
+            self._users.publish(frames, 'state' if keyframe else 'cursor')
 
-    async def register(self, websocket):
-        self._users.add(websocket)
+    async def notify_params(self, changed: set = None):
+        if self._users:
+            frame = self.params_event(changed)
+            if frame is not None:
+                self._users.publish(frame, 'params')
+
+    async def register(self, websocket, path: str = '/'):
+        """ Adds a display client. A client reconnecting with ?resume=<token>&received=<frames received on its previous
+        connection> gets the frames it missed, if they are all still in the replay buffer; any other gets the snapshot
+        (later params events only carry changes) and a new resume token. """
+        encoding = protocol.encoding(websocket) # negotiated subprotocol, 'json' by default
+        channel = self._users.add(websocket, encoding)
+        query = parse_qs(urlsplit(path).query)
+        replayed = None
+        if 'resume' in query:
+            try:
+                replayed = self._users.resume(websocket, query['resume'][0], int(query.get('received', ['0'])[0]))
+            except ValueError:
+                pass
+            self.logger.debug('RESUME::%s::%s', client_label(websocket), 'SNAPSHOT' if replayed is None else f'{replayed} frames')
+        if replayed is None:
+            channel.token = secrets.token_hex(8)
+            self._users.send(websocket, self.snapshot_event(channel.token), 'state')
+            self._published = None # the next position frame goes out even if it matches the snapshot's cursor
+        self._ensure_background_tasks()
         await self.notify_users()
 
+    def send_keyframe(self, websocket, encoding: str):
+        self._users.send(websocket, self.keyframe(encoding), 'state')
+        self._published = None # the next position frame goes out even if it matches the last published one
+
     async def unregister(self, websocket):
         self._users.remove(websocket)
         await self.notify_users()
 
+    async def ingest(self, x: float, y: float, t: float = None):
+        """ Filters one raw ADC sample into cursor coordinates, runs the state machine and notifies displays. """
+        await self.ingest_sample(x, y, t)
+        await self.cursor_moved()
+
+    async def ingest_frame(self, t, xs, ys, client: str, same_host: bool = True):
+        """ Ingests a frame stamped with the acquisition's wall-clock sample times t (s), from any transport.
+
+        The serial-to-server latency of every sample is traced for `client` if it runs on this host (same clock);
+        the last sample is aligned to receipt.
+        """
+        t = np.asarray(t, dtype=float)
+        if same_host:
+            self.tracer.record_many('serial', client, time.time() - t)
+        await self.ingest_batch(xs, ys, self.timers.time() - (t[-1] - t))
+
+    async def ingest_batch(self, xs, ys, ts=None):
+        """ Runs a multi-sample frame through the state machine, then notifies displays once.
+
+        The state's target test runs on the whole remaining frame at once (in_target_batch), so only the sample
+        at which it fires is handled on its own. `ts` are the sample times (monotonic s); without them every
+        sample is taken to have arrived now.
+        """
+        n = len(xs)
+        ts = np.full(n, self.timers.time()) if ts is None else np.asarray(ts, dtype=float)
+        fx, fy = self.filters.process(xs, ys, ts)
+        i = 0
+        while i < n:
+            check = self._checks[self.state.value]
+            k = n
+            if check is not None:
+                hits = np.flatnonzero(self.in_target_batch(check[0], fx[i:], fy[i:]) == check[1])
+                if len(hits):
+                    k = i + int(hits[0])
+            self._record_samples(xs, ys, fx, fy, ts, i, min(k + 1, n))
+            self.stats.samples(fx[i:k + 1], fy[i:k + 1], ts[i:k + 1])
+            if k == n:
+                break
+            if k > 0:
+                self._prev = (float(fx[k - 1]), float(fy[k - 1]), float(ts[k - 1]))
+            else:
+                self._prev = (self.x, self.y, self.t_sample)
+            self.x, self.y, self.t_sample = float(fx[k]), float(fy[k]), float(ts[k])
+            await self._fire(check)
+            i = k + 1
+        if n:
+            if n > 1:
+                self._prev = (float(fx[-2]), float(fy[-2]), float(ts[-2]))
+            elif i < n: # the only sample did not fire a check
+                self._prev = (self.x, self.y, self.t_sample)
+            self.x, self.y, self.t_sample = float(fx[-1]), float(fy[-1]), float(ts[-1])
+        await self.cursor_moved()
+
+    def _record_samples(self, xs, ys, fx, fy, ts, start: int, stop: int):
+        if self.recorder is not None:
+            write = self.recorder.write
+            state, target, direction = self.state.value, self.target, self.direction[1].value
+            for k in range(start, stop):
+                write(SAMPLE, state, target, direction, float(xs[k]), float(ys[k]), fx[k], fy[k], ts[k])
+
+    async def ingest_sample(self, x: float, y: float, t: float = None):
+        """ Filters one raw ADC sample (taken at monotonic time t, default now) into cursor coordinates and runs the state machine. """
+        self._prev = (self.x, self.y, self.t_sample)
+        self.t_sample = self.timers.time() if t is None else t
+        self.x, self.y = self.filters.step(x, y, self.t_sample)
+        if self.recorder is not None:
+            self.recorder.write(SAMPLE, self.state.value, self.target, self.direction[1].value, x, y, self.x, self.y, self.t_sample)
+        self.stats.sample(self.x, self.y, self.t_sample)
+        await self.check_state()
+
+    async def cursor_moved(self):
+        if self.p.render_rate > 0:
+            self._dirty = True
+        else:
+            await self.notify_cursor()
+
+    async def push_state(self):
+        """ Pushes the new state to displays immediately instead of waiting for the next render tick. """
+        self._dirty = False
+        await self.notify_cursor(keyframe=True)
+
+    async def render_tick(self):
+        """ Broadcasts the latest coalesced cursor/state snapshot at `Render Rate` Hz. """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while self.p.render_rate > 0:
+            deadline += 1.0 / self.p.render_rate
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else: # Fell behind: skip the missed ticks rather than bursting to catch up.
+                deadline = loop.time()
+            if self._dirty:
+                self._dirty = False
+                await self.notify_cursor()
+        self._render_task = None
+
+    async def trace_probe(self):
+        """ Publishes a trace probe every trace_interval seconds; displays acknowledge it once rendered. """
+        loop = asyncio.get_running_loop()
+        rotated = loop.time()
+        while self._trace_interval > 0:
+            await asyncio.sleep(self._trace_interval)
+            if loop.time() - rotated >= self._trace_window:
+                self.tracer.rotate()
+                rotated = loop.time()
+            if self._users:
+                self._users.publish(self.trace_event(self.tracer.probe()), 'trace')
+        self._trace_task = None
+
+    def _ensure_background_tasks(self):
+        if self._render_task is None and self.p.render_rate > 0:
+            self._render_task = asyncio.ensure_future(self.render_tick())
+        if self._trace_task is None and self._trace_interval > 0:
+            self._trace_task = asyncio.ensure_future(self.trace_probe())
+
     async def cursor_and_task_state_messages(self, websocket, path):
-        # register(websocket) sends user_event() to websocket
-        await self.register(websocket)
+        # register(websocket) sends the snapshot (or the frames missed since a resumed connection) to websocket;
+        # acquisition sources never read, so they are not registered as displays
+        source = protocol.is_source(websocket)
+        if not source:
+            await self.register(websocket, path)
+        client = client_label(websocket)
+        local = same_host(websocket)
+        slot = self.connections.open(client)
+        messages, samples = self.connections.messages, self.connections.samples
         try:
             # await websocket.send(state_event())
             async for message in websocket:
+                received = time.perf_counter()
+                messages[slot] += 1
+                if isinstance(message, bytes): # Binary frames only ever carry cursor samples.
+                    if message[0] == protocol.FRAME_CURSOR_BATCH:
+                        t, xs, ys = protocol.decode_cursor_batch(message)
+                        samples[slot] += len(xs)
+                        await self.ingest_frame(t, xs, ys, client, local)
+                    else:
+                        samples[slot] += 1
+                        await self.ingest(*protocol.decode_cursor(message))
+                    self.tracer.record('ingest', client, time.perf_counter() - received)
+                    continue
                 data = json.loads(message)
                 if data["event"] == "cursor":
-                    self.x = ema(self.p['EMA Alpha'], 
-                                    linear_map(data["x"], self.p['ADC Left'], self.p['ADC Right'], 0, self.w), 
-                                    self.x)
-                    self.y = ema(self.p['EMA Alpha'], 
-                                    linear_map(data["y"], self.p['ADC Bottom'], self.p['ADC Top'], 0, self.h), 
-                                    self.y)
-                    await self.check_state()
-                    await self.notify_cursor()
+                    samples[slot] += 1
+                    await self.ingest(data["x"], data["y"])
+                    self.tracer.record('ingest', client, time.perf_counter() - received)
+                elif data["event"] == "cursor_batch":
+                    samples[slot] += len(data["x"])
+                    if "t" in data:
+                        await self.ingest_frame(data["t"], data["x"], data["y"], client, local)
+                    else:
+                        await self.ingest_batch(data["x"], data["y"])
+                    self.tracer.record('ingest', client, time.perf_counter() - received)
+                elif data["event"] == "ack":
+                    self.tracer.ack(client, data["id"])
+                elif data["event"] == "latency" and not source:
+                    self._users.send(websocket, self.latency_event())
+                elif data["event"] == "stats" and not source:
+                    self._users.send(websocket, self.stats_event(), 'stats')
+                elif data["event"] == "encoding" and not source:
+                    if data["encoding"] in protocol.ENCODINGS:
+                        self._users.set_encoding(websocket, data["encoding"])
+                        self.send_keyframe(websocket, data["encoding"])
+                    else:
+                        self.logger.warning('ENCODING::UNSUPPORTED::%s', data["encoding"])
                 elif data["event"] == "params":
-                    self.update_parameters(data["filename"])
-                    await self.notify_params()
+                    try:
+                        changed = await self.reload_parameters(data["filename"])
+                    except (OSError, ValueError) as e:
+                        self.logger.error('PARAMS::%s', e)
+                        continue
+                    if changed:
+                        self.logger.info('PARAMS::CHANGED::%s', ', '.join(sorted(changed)))
+                        self._ensure_background_tasks()
+                        await self.notify_params(changed)
                 elif data["event"] == "targets":
-                    self.update_targets(data["filename"])
+                    try:
+                        if data.get("generate"): # seeded, balanced pseudo-random order
+                            self.swap_schedule(TrialSchedule.balanced(int(self.p.n_targets), self._block_trials(), data.get("seed")))
+                        else:
+                            await self.reload_targets(data["filename"])
+                    except (OSError, ValueError) as e:
+                        self.logger.error('TARGETS::%s', e)
                 elif data["event"] == "start":
+                    self.open_session()
                     await self.start()
                 elif data["event"] == "pause":
                     await self.pause()
                 elif data["event"] == "stop":
                     await self.stop()
+                    self.close_session()
                 elif data["event"] == "reset":
                     await self.reset()
                 elif data["event"] == "resume":
                     await self.resume()
         except (websockets.ConnectionClosed, websockets.exceptions.ConnectionClosedOK, websockets.ConnectionClosedError):
-            self.logging.debug('CLOSED::WS::OK')
+            self.logger.debug('CLOSED::WS::OK')
         finally:
-            await self.unregister(websocket)
-
-    @staticmethod
-    def _next_line(fname):
-        while True:
-            with open(fname, 'r') as file:
-                for line in file:
-                    yield int(line)
-                file.close()
\ No newline at end of file
+            self.connections.close(slot)
+            if not source:
+                await self.unregister(websocket)
+            self.tracer.forget(client)
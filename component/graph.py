@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the cached state diagram renderer.
+
+Note:
+    - The diagram is a function of the states/transitions definition only, so it is rendered (graphviz 'dot')
+      only when the SHA-1 of that definition differs from the one stored next to the image (<fname>.sha1).
+    - The diagram extension of `transitions` and the graphviz backend are imported only when a render is needed;
+      rendering needs pygraphviz or graphviz (optional dependencies of the server).
+"""
+import hashlib, json, os
+from enum import Enum
+
+
+def definition(states: list, transitions: list) -> str:
+    """ Canonical text of a states/transitions definition (enum members by name, keys sorted). """
+    default = lambda value: value.name if isinstance(value, Enum) else str(value)
+    return json.dumps({'states': states, 'transitions': transitions}, default=default, sort_keys=True)
+
+
+def definition_hash(states: list, transitions: list, fmt: str = 'png') -> str:
+    return hashlib.sha1(f'{fmt}\n{definition(states, transitions)}'.encode('utf-8')).hexdigest()
+
+
+def render_graph(fname: str = 'state_machine.png', states: list = None, transitions: list = None, fmt: str = None, force: bool = False) -> bool:
+    """ Draws the state diagram (default: CenterOut's) to fname unless it is up to date; returns whether it was drawn. """
+    if states is None or transitions is None:
+        from .fsm import CenterOut
+        states, transitions = CenterOut.states, CenterOut.transitions
+    fmt = fmt or os.path.splitext(fname)[1].lstrip('.') or 'png'
+    digest = definition_hash(states, transitions, fmt)
+    stamp = fname + '.sha1'
+    if not force and os.path.exists(fname) and os.path.exists(stamp):
+        with open(stamp, 'r') as f:
+            if f.read().strip() == digest:
+                return False
+    from transitions.extensions.diagrams import GraphMachine # optional: only needed to (re)draw
+    from transitions.extensions.states import add_state_features, Timeout
+    model = type('Model', (object,), {})()
+    machine = add_state_features(Timeout)(GraphMachine)(model=model, states=states, transitions=transitions, initial=states[0]['name'])
+    if machine.graph_cls.__module__.endswith('mermaid'): # neither pygraphviz nor graphviz is installed
+        raise ImportError('Rendering the state diagram requires pygraphviz or graphviz.')
+    with open(fname + '.tmp', 'bw') as f:
+        model.get_graph().draw(f, format=fmt, prog='dot')
+    os.replace(fname + '.tmp', fname)
+    with open(stamp, 'w') as f:
+        f.write(digest)
+    return True
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the session host that serves many independent CenterOut sessions (one per rig).
+
+Note:
+    - Displays and acquisition clients connect to ws://<address>:<port>/session/<id>; the root path '/'
+      is the 'default' session, so existing clients keep working unchanged.
+    - Every session has its own params, targets, users, recordings (data_dir/<id>) and state machine.
+    - Only the 'default' session is created on first connection; other sessions must be created through '/host'
+      unless autocreate is set. Autocreated sessions are destroyed once they have had no connection for
+      idle_timeout seconds, so clients probing random session paths cannot pile up state machines.
+    - Sessions are created and destroyed at runtime through the '/host' control path:
+        {"event": "create", "session": "<id>", "targets": "<file>", "params": "<file>"}
+        {"event": "destroy", "session": "<id>"}
+        {"event": "list"}
+      Every control message is answered with {"type": "sessions", "sessions": {<id>: {...}}} or {"type": "error"}
+      (also for messages that are not JSON objects).
+      Control connections must come from this machine or present the host's control token ('/host?token=<token>');
+      others are closed (1008) before any message is read, as they can create sessions from arbitrary files.
+    - ShardedHost runs sessions in worker processes (one event loop per core, one port per worker). The front
+      process assigns each session to the least loaded worker once and relays every connection for that session to
+      the same worker, so one busy rig's state machine never shares a loop with another's. Browsers do not follow
+      redirects on websocket handshakes, so relaying is the default; redirect=True answers HTTP 307 instead (one
+      hop less, for clients that follow it). The '/host' list reply has each session's worker port either way.
+"""
+import asyncio, hmac, ipaddress, json, logging, multiprocessing, os, re, secrets, websockets
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+from . import protocol
+from .fsm import CenterOut
+from .logs import configure_logging
+from .metrics import start_metrics
+
+CONTROL_PATH = '/host'
+DEFAULT_SESSION = 'default'
+_SESSION_PATH = re.compile(r'^/session/([A-Za-z0-9_.-]+)/?$')
+
+
+def session_id(path: str) -> str:
+    """ Session id addressed by a request path, or None if the path does not address a session. """
+    path = path.split('?', 1)[0] # e.g. a display's ?resume=<token>&received=<n>
+    if path in ('', '/'):
+        return DEFAULT_SESSION
+    match = _SESSION_PATH.match(path)
+    return match.group(1) if match else None
+
+
+def is_control(path: str) -> bool:
+    return path.split('?', 1)[0] == CONTROL_PATH
+
+
+def authorized(websocket, path: str, token: str = None) -> bool:
+    """ Whether a control connection may create or destroy sessions: from a loopback address, or with `token`. """
+    if token is not None and hmac.compare_digest(parse_qs(urlsplit(path).query).get('token', [''])[0], token):
+        return True
+    try:
+        return ipaddress.ip_address(websocket.remote_address[0]).is_loopback
+    except (TypeError, ValueError):
+        return False
+
+
+def sessions_event(sessions: dict) -> str:
+    return json.dumps({"event": "none", "type": "sessions", "sessions": sessions})
+
+
+def error_event(message: str) -> str:
+    return json.dumps({"event": "none", "type": "error", "message": message})
+
+
+def parse_control(message) -> dict:
+    """ Control message as a dict (None if it is not a JSON object). """
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class SessionHost(object):
+    """ Routes websocket connections by path to independent CenterOut sessions in this process. """
+
+    def __init__(self, targets_file: str = 'config/targets.txt', params_file: str = 'config/params.txt', autocreate: bool = False, data_dir: str = 'data', control_token: str = None, idle_timeout: float = 300.0, **options):
+        '''Constructor for SessionHost object.
+
+        targets_file and params_file are the defaults for sessions created without their own files.
+        autocreate creates unknown sessions on first connection (otherwise the handshake is refused with 404);
+        the 'default' session is always created on first connection. Sessions created this way (except 'default')
+        are destroyed after idle_timeout seconds without connections (None: never).
+        control_token lets '/host' clients on other machines in (None: loopback clients only).
+        options are passed on to every CenterOut (engine, queue_size, log_dir, ...).
+        '''
+        self.targets_file = targets_file
+        self.params_file = params_file
+        self.autocreate = autocreate
+        self.control_token = control_token
+        self.data_dir = data_dir
+        self.options = options
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.connections = {} # session id --> open connections
+        self.reaped = set() # autocreated sessions (destroyed when idle)
+        self.idle = {} # reaped session id --> loop time of its last disconnection (while it has none)
+        self._reaper = None
+        self.logger = logging.getLogger('SESSION-HOST')
+
+    def create(self, sid: str, targets_file: str = None, params_file: str = None) -> CenterOut:
+        if sid in self.sessions:
+            raise ValueError(f"Session '{sid}' already exists.")
+        if session_id(f'/session/{sid}') != sid:
+            raise ValueError(f"Invalid session id '{sid}'.")
+        game = CenterOut(targets_file=targets_file or self.targets_file,
+                         params_file=params_file or self.params_file,
+                         data_dir=os.path.join(self.data_dir, sid),
+                         session=sid,
+                         **self.options)
+        self.sessions[sid] = game
+        self.logger.info('CREATE::%s', sid)
+        return game
+
+    async def destroy(self, sid: str):
+        game = self.sessions.pop(sid) # KeyError for unknown sessions
+        self.reaped.discard(sid)
+        self.idle.pop(sid, None)
+        await game.shutdown()
+        self.logger.info('DESTROY::%s', sid)
+
+    def collect_metrics(self, out):
+        """ Adds the metrics of every session (labeled by session) to an exposition (see component/metrics.py). """
+        out.add('centerout_sessions', 'gauge', 'Sessions served by this process.', len(self.sessions))
+        for game in self.sessions.values():
+            game.collect_metrics(out)
+
+    def describe(self) -> dict:
+        return {sid: {"users": len(game._users), "state": game.state.name} for sid, game in self.sessions.items()}
+
+    async def control(self, data: dict) -> str:
+        """ Applies one control message and returns the reply. """
+        if data is None:
+            return error_event("malformed control message (expected a JSON object)")
+        try:
+            if data["event"] == "create":
+                self.create(data["session"], data.get("targets"), data.get("params"))
+            elif data["event"] == "destroy":
+                await self.destroy(data["session"])
+            elif data["event"] != "list":
+                return error_event(f"unsupported event: {data['event']}")
+        except KeyError as e:
+            return error_event(f"unknown session or missing field: {e}")
+        except (ValueError, OSError) as e:
+            return error_event(str(e))
+        return sessions_event(self.describe())
+
+    def creatable(self, sid: str) -> bool:
+        """ Whether a connection may create session `sid` (the default session, or any with autocreate). """
+        return self.autocreate or sid == DEFAULT_SESSION
+
+    async def reap(self):
+        """ Destroys autocreated sessions that have had no connection for idle_timeout seconds. """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            now = loop.time()
+            for sid in [sid for sid, since in self.idle.items() if now - since >= self.idle_timeout]:
+                self.logger.info('REAP::%s', sid)
+                await self.destroy(sid)
+
+    async def process_request(self, path: str, request_headers):
+        """ Refuses handshakes for paths that do not address a session (or unknown sessions that may not be created). """
+        if is_control(path):
+            return None
+        sid = session_id(path)
+        if sid is None or (sid not in self.sessions and not self.creatable(sid)):
+            return HTTPStatus.NOT_FOUND, [], b'Unknown session\n'
+        return None
+
+    async def handler(self, websocket, path):
+        if is_control(path):
+            if not authorized(websocket, path, self.control_token):
+                self.logger.warning('CONTROL::REFUSED::%s', websocket.remote_address)
+                await websocket.close(1008, 'forbidden')
+                return
+            async for message in websocket:
+                await websocket.send(await self.control(parse_control(message)))
+            return
+        sid = session_id(path)
+        game = self.sessions.get(sid)
+        if game is None:
+            if not self.creatable(sid):
+                await websocket.close(4404, 'unknown session')
+                return
+            game = self.create(sid)
+            if sid != DEFAULT_SESSION and self.idle_timeout:
+                self.reaped.add(sid)
+                if self._reaper is None:
+                    self._reaper = asyncio.ensure_future(self.reap())
+        self.connections[sid] = self.connections.get(sid, 0) + 1
+        self.idle.pop(sid, None)
+        try:
+            await game.cursor_and_task_state_messages(websocket, path)
+        finally:
+            self.connections[sid] -= 1
+            if not self.connections[sid]:
+                del self.connections[sid]
+                if sid in self.reaped and self.sessions.get(sid) is game:
+                    self.idle[sid] = asyncio.get_running_loop().time()
+
+    def serve(self, address: str, port: int, **kwargs):
+        """ websockets.serve() for this host (await it, or use it as an async context manager). """
+        options = dict(protocol.serve_options(), **kwargs) # display subprotocols and permessage-deflate
+        return websockets.serve(self.handler, address, port, process_request=self.process_request, **options)
+
+
+def _run_worker(address: str, port: int, host_options: dict, ready, metrics: tuple = None):
+    """ Worker process entry point: serves a SessionHost on its own port and event loop (metrics: (address, port) or None). """
+    configure_logging(host_options.get('log_dir', 'logs'), f'center_out_{port}')
+    async def main():
+        host = SessionHost(**host_options)
+        if metrics is not None:
+            await start_metrics([host.collect_metrics], *metrics, labels={'worker': str(port)})
+        async with host.serve(address, port):
+            ready.set()
+            await asyncio.Future()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+class ShardedHost(object):
+    """ Front process that pins each session to one of `workers` SessionHost processes (ports port+1 ... port+workers). """
+
+    def __init__(self, address: str, port: int, workers: int = os.cpu_count(), metrics: tuple = None, redirect: bool = False, control_token: str = None, **host_options):
+        '''Constructor for ShardedHost object.
+
+        metrics is the (address, port) of the metrics endpoint: worker i serves its own on port+1+i (None: no metrics).
+        redirect answers session handshakes with a 307 to the worker instead of relaying them (not for browsers).
+        control_token lets '/host' clients on other machines in (None: loopback clients only); the workers only
+        accept control connections from this process (with a token of their own).
+        host_options are passed on to every worker's SessionHost.
+        '''
+        self.address = address
+        self.port = port
+        self.metrics = metrics
+        self.redirect = redirect
+        self.control_token = control_token
+        self.autocreate = host_options.get('autocreate', False)
+        self.host_options = dict(host_options, control_token=secrets.token_hex(16))
+        self.ports = [port + 1 + i for i in range(workers)]
+        self.assigned = {} # session id --> worker index (sticky)
+        self._processes = []
+        self.logger = logging.getLogger('SESSION-HOST')
+
+    def start(self, timeout: float = 30.0):
+        """ Starts the worker processes and waits until all of them accept connections. """
+        context = multiprocessing.get_context('spawn') # never fork a running event loop
+        for i, port in enumerate(self.ports):
+            ready = context.Event()
+            metrics = None if self.metrics is None else (self.metrics[0], self.metrics[1] + 1 + i)
+            process = context.Process(target=_run_worker, args=(self.address, port, self.host_options, ready, metrics),
+                                      name=f'session-worker-{port}', daemon=True)
+            process.start()
+            if not ready.wait(timeout):
+                raise RuntimeError(f'Session worker on port {port} did not start.')
+            self._processes.append(process)
+        return self
+
+    def stop(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        self._processes = []
+
+    def worker(self, sid: str) -> int:
+        """ Worker index serving `sid`; new sessions go to the worker with the fewest sessions. """
+        index = self.assigned.get(sid)
+        if index is None:
+            load = [0] * len(self.ports)
+            for i in self.assigned.values():
+                load[i] += 1
+            index = self.assigned[sid] = load.index(min(load))
+            self.logger.info('ASSIGN::%s::%d', sid, self.ports[index])
+        return index
+
+    def _worker_uri(self, index: int, path: str = None) -> str:
+        """ URI of a session path on a worker (default: its control path, with the workers' token). """
+        address = 'localhost' if self.address in ('', '0.0.0.0', '::') else self.address
+        if path is None:
+            path = f"{CONTROL_PATH}?token={self.host_options['control_token']}"
+        return f'ws://{address}:{self.ports[index]}{path}'
+
+    async def _forward(self, index: int, data: dict) -> dict:
+        async with websockets.connect(self._worker_uri(index)) as ws:
+            await ws.send(json.dumps(data))
+            return json.loads(await ws.recv())
+
+    async def control(self, data: dict) -> str:
+        """ Applies one control message on the owning worker(s) and returns the reply. """
+        if data is None:
+            return error_event("malformed control message (expected a JSON object)")
+        event, sid = data.get("event"), data.get("session")
+        if event in ("create", "destroy"):
+            if sid is None:
+                return error_event("missing field: 'session'")
+            if event == "destroy" and sid not in self.assigned:
+                return error_event(f"unknown session: '{sid}'")
+            existed = sid in self.assigned
+            reply = await self._forward(self.worker(sid), data)
+            if reply["type"] == "error":
+                if not existed:
+                    del self.assigned[sid]
+                return json.dumps(reply)
+            if event == "destroy":
+                del self.assigned[sid]
+        elif event != "list":
+            return error_event(f"unsupported event: {event}")
+        sessions = {}
+        for index in sorted(set(self.assigned.values())):
+            for s, info in (await self._forward(index, {"event": "list"}))["sessions"].items():
+                sessions[s] = dict(info, port=self.ports[index])
+        return sessions_event(sessions)
+
+    async def process_request(self, path: str, request_headers):
+        """ Refuses paths that do not address a session (or unknown sessions that may not be created); redirects
+        session connections to their worker if `redirect`. """
+        if is_control(path):
+            return None
+        sid = session_id(path)
+        if sid is None or (sid not in self.assigned and not (self.autocreate or sid == DEFAULT_SESSION)):
+            return HTTPStatus.NOT_FOUND, [], b'Unknown session\n'
+        if self.redirect:
+            hostname = request_headers.get('Host', self.address).rsplit(':', 1)[0]
+            location = f'ws://{hostname}:{self.ports[self.worker(sid)]}{path}'
+            return HTTPStatus.TEMPORARY_REDIRECT, [('Location', location)], b''
+        return None
+
+    async def relay(self, websocket, path):
+        """ Relays a session connection to its worker frame by frame, with the subprotocol the client negotiated. """
+        options = {'subprotocols': [websocket.subprotocol]} if websocket.subprotocol else {}
+        try:
+            async with websockets.connect(self._worker_uri(self.worker(session_id(path)), path), compression=None, **options) as upstream:
+                pumps = [asyncio.ensure_future(_pump(websocket, upstream)), asyncio.ensure_future(_pump(upstream, websocket))]
+                try:
+                    await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for pump in pumps:
+                        pump.cancel()
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+            self.logger.error('RELAY::%s::%s', path, e)
+            await websocket.close(1011, 'session worker unavailable')
+
+    async def handler(self, websocket, path):
+        if not is_control(path):
+            return await self.relay(websocket, path)
+        if not authorized(websocket, path, self.control_token):
+            self.logger.warning('CONTROL::REFUSED::%s', websocket.remote_address)
+            await websocket.close(1008, 'forbidden')
+            return
+        async for message in websocket:
+            await websocket.send(await self.control(parse_control(message)))
+
+    def serve(self, **kwargs):
+        options = dict(protocol.serve_options(), **kwargs) # relayed clients negotiate their subprotocol here
+        return websockets.serve(self.handler, self.address, self.port, process_request=self.process_request, **options)
+
+
+async def _pump(source, destination):
+    """ Forwards every message from one websocket to the other until either closes. """
+    try:
+        async for message in source:
+            await destination.send(message)
+    except websockets.ConnectionClosed:
+        pass
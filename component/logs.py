@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the off-loop logging pipeline used by the servers.
+
+Note:
+    - Records are queued unformatted; formatting and file writes happen on the QueueListener thread. Only records
+      whose %-args are all immutable are deferred; others are formatted on the calling thread, since a dict or
+      array could change before the listener renders it. Queued records are copies (other handlers share them).
+    - Each process (and each recorded session) gets its own timestamped file instead of overwriting one log.
+      configure_logging() is called by the server entry points (and host worker processes), never by library classes.
+    - Per-logger token buckets keep chatty loggers (e.g. `transitions`, several INFO lines per state change) bounded.
+"""
+import atexit, copy, enum, logging, os, queue, time
+from logging.handlers import QueueHandler, QueueListener
+
+FORMAT = '%(asctime)s::%(name)s::%(levelname)s::%(message)s'
+
+# Records per second (burst of the same size) by logger name prefix; None means unlimited.
+DEFAULT_RATE_LIMITS = {
+    'transitions': 20.0,
+    'websockets': 10.0
+}
+
+_listener = None
+_file_handler = None
+_IMMUTABLE = (str, int, float, complex, bytes, bool, type(None), enum.Enum)
+
+
+def _immutable(value) -> bool:
+    return isinstance(value, _IMMUTABLE) or (type(value) is tuple and all(_immutable(v) for v in value))
+
+
+class RateLimitFilter(logging.Filter):
+    """ Token-bucket rate limit per logger name prefix. Suppressed records are counted in `dropped`. """
+
+    def __init__(self, limits: dict):
+        super().__init__()
+        self.limits = dict(limits)
+        self.dropped = {}
+        self._buckets = {} # prefix --> [tokens, last refill time]
+        self._prefix = {} # logger name --> matching prefix (or None)
+
+    def _match(self, name: str):
+        prefix = None
+        for p in self.limits:
+            if (name == p or name.startswith(p + '.')) and (prefix is None or len(p) > len(prefix)):
+                prefix = p
+        self._prefix[name] = prefix
+        return prefix
+
+    def filter(self, record) -> bool:
+        prefix = self._prefix[record.name] if record.name in self._prefix else self._match(record.name)
+        if prefix is None or self.limits[prefix] is None:
+            return True
+        rate = self.limits[prefix]
+        now = time.monotonic()
+        bucket = self._buckets.get(prefix)
+        if bucket is None:
+            bucket = self._buckets[prefix] = [rate, now]
+        bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] < 1.0:
+            self.dropped[prefix] = self.dropped.get(prefix, 0) + 1
+            return False
+        bucket[0] -= 1.0
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """ Queues a copy of the record so that %-formatting happens on the listener thread (immutable args only). """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.args and not _immutable(record.args):
+            record.msg, record.args = record.getMessage(), None
+        if record.exc_info: # Tracebacks have to be rendered before the frames go away.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SessionFileHandler(logging.FileHandler):
+    """ File handler that switches to a new file on the listener thread when `rotate` is called. """
+
+    def __init__(self, fname: str):
+        super().__init__(fname, mode='a', delay=True)
+        self._pending = None
+
+    def rotate(self, fname: str):
+        self._pending = os.path.abspath(fname)
+
+    def emit(self, record):
+        if self._pending is not None: # Called with the handler lock held.
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename, self._pending = self._pending, None
+        super().emit(record)
+
+
+def configure_logging(log_dir: str = 'logs', name: str = 'server', level: int = logging.INFO, rate_limits: dict = None) -> QueueListener:
+    """ Routes the root logger through a queue to a background file writer (once per process). """
+    global _listener, _file_handler
+    if _listener is not None:
+        return _listener
+    os.makedirs(log_dir, exist_ok=True)
+    _file_handler = SessionFileHandler(os.path.join(log_dir, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.log"))
+    _file_handler.setFormatter(logging.Formatter(FORMAT))
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(RateLimitFilter(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits))
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(level)
+    _listener = QueueListener(records, _file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def rotate_log(fname: str):
+    """ Continues logging in `fname` (e.g. one file per recorded session). """
+    if _file_handler is not None:
+        _file_handler.rotate(fname)
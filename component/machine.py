@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the `transitions`-based state machine engine of CenterOut.
+
+Note:
+    - Imported by CenterOut only when engine='transitions', so the compiled engine never loads `transitions`.
+    - TimeoutMachine is a plain AsyncMachine; diagram support (get_graph) is opt-in through graph_machine(),
+      which imports the diagram extension and builds the graph markup only when it is asked for.
+"""
+import functools
+from transitions.extensions.asyncio import AsyncMachine, AsyncTimeout
+from transitions.extensions.states import add_state_features
+from .timers import TimerScheduler
+
+
+class ScheduledTimeout(AsyncTimeout):
+    """ AsyncTimeout armed on the machine's TimerScheduler instead of a new task per state entry. """
+
+    def create_timer(self, event_data):
+        return event_data.machine.timers.call_later(self.timeout, self._expired, event_data, label=self.name)
+
+    def _expired(self, event_data):
+        event_data.machine.timers.spawn(self._process_timeout(event_data))
+
+
+@add_state_features(ScheduledTimeout)
+class TimeoutMachine(AsyncMachine):
+
+    def __init__(self, *args, timers: TimerScheduler = None, **kwargs):
+        self.timers = timers if timers is not None else TimerScheduler()
+        super().__init__(*args, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def graph_machine() -> type:
+    """ TimeoutMachine with diagram support (model.get_graph()); the diagram extension is imported on first call. """
+    from transitions.extensions.diagrams import GraphMachine
+    from transitions.extensions.asyncio import AsyncTransition
+
+    class TimeoutGraphMachine(GraphMachine, TimeoutMachine):
+        transition_cls = AsyncTransition
+
+    return TimeoutGraphMachine
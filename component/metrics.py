@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the runtime metrics (preallocated counters, loop lag, process usage) and their HTTP endpoint.
+
+Note:
+    - Hot-path counters are slots of preallocated arrays (array('Q')), so counting a message or a transition is
+      one indexed increment; nothing is formatted or logged until the endpoint is scraped.
+    - serve_metrics() answers GET /metrics with the Prometheus text format (version 0.0.4) built by `collect`,
+      on its own port (bind it to localhost: there is no authentication).
+    - Rates (messages/s, trials/min) are computed at scrape time from the counters; Prometheus can also derive
+      them from the *_total counters with rate().
+"""
+import asyncio, os, time
+from array import array
+import numpy as np
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    text = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels.items())
+    return '{' + text + '}'
+
+
+class Exposition(object):
+    """ Builds a Prometheus text exposition; every metric family is declared once with its samples. """
+
+    def __init__(self):
+        self._families = {} # name --> (kind, help, [lines])
+
+    def add(self, name: str, kind: str, help: str, value: float, labels: dict = None):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (kind, help, [])
+        family[2].append(f'{name}{_labels(labels)} {float(value):.9g}')
+
+    def text(self) -> str:
+        out = []
+        for name, (kind, help, lines) in self._families.items():
+            out.append(f'# HELP {name} {help}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+class ConnectionCounters(object):
+    """ Inbound message/sample counters in preallocated slots, one slot per open connection. """
+
+    OVERFLOW = '*' # label of the slot shared by connections past max_connections
+
+    def __init__(self, max_connections: int = 64):
+        self.messages = array('Q', bytes(8 * (max_connections + 1)))
+        self.samples = array('Q', bytes(8 * (max_connections + 1)))
+        self.labels = [None] * max_connections + [ConnectionCounters.OVERFLOW]
+        self._free = list(range(max_connections - 1, -1, -1))
+        self._last = {} # slot --> (time, messages) at the previous scrape
+
+    def open(self, label: str) -> int:
+        """ Slot of a new connection; its counters start at zero. """
+        if not self._free:
+            return len(self.labels) - 1
+        slot = self._free.pop()
+        self.messages[slot] = self.samples[slot] = 0
+        self.labels[slot] = label
+        return slot
+
+    def close(self, slot: int):
+        if slot < len(self.labels) - 1 and self.labels[slot] is not None:
+            self.labels[slot] = None
+            self._last.pop(slot, None)
+            self._free.append(slot)
+
+    def rates(self) -> dict:
+        """ {slot: messages/s since the previous call (or since the connection opened)}. """
+        now, out = time.monotonic(), {}
+        for slot, label in enumerate(self.labels):
+            if label is None:
+                continue
+            t, n = self._last.get(slot, (None, 0))
+            count = self.messages[slot]
+            if t is not None and now > t:
+                out[slot] = (count - n) / (now - t)
+            self._last[slot] = (now, count)
+        return out
+
+
+class LoopMonitor(object):
+    """ Measures event-loop lag: how late a periodic `interval` sleep wakes up (ring of the last `history` lags). """
+
+    def __init__(self, interval: float = 0.1, history: int = 600):
+        self.interval = interval
+        self.lags = np.zeros(history)
+        self.count = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags[self.count % len(self.lags)] = loop.time() - t - self.interval
+            self.count += 1
+
+    def collect(self, out: Exposition, labels: dict = None):
+        lags = self.lags[:min(self.count, len(self.lags))]
+        if len(lags) == 0:
+            return
+        for q, value in zip(('0.5', '0.99', '1'), np.percentile(lags, (50, 99, 100))):
+            out.add('event_loop_lag_seconds', 'gauge', 'Lateness of a periodic wakeup over the last minute.', value, dict(labels or {}, quantile=q))
+
+
+def process_stats() -> dict:
+    """ CPU seconds (user + system) and resident set size (bytes) of this process. """
+    cpu = time.process_time()
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource # not Linux: peak RSS is the best available
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if os.uname().sysname == 'Darwin' else 1024)
+    return {'cpu': cpu, 'rss': rss}
+
+
+def collect_process(out: Exposition, labels: dict = None):
+    stats = process_stats()
+    out.add('process_cpu_seconds_total', 'counter', 'User and system CPU time of the server process.', stats['cpu'], labels)
+    out.add('process_resident_memory_bytes', 'gauge', 'Resident set size of the server process.', stats['rss'], labels)
+
+
+async def serve_metrics(collect, host: str = '127.0.0.1', port: int = 9108):
+    """ Starts an HTTP server answering GET /metrics with collect() (a str); returns the asyncio server. """
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''): # skip headers
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', collect().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(f'HTTP/1.0 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('ascii') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+
+async def start_metrics(collectors: list, host: str = '127.0.0.1', port: int = 9108, labels: dict = None):
+    """ Serves the metrics of `collectors` (callables adding to an Exposition), the loop lag and the process usage. """
+    monitor = LoopMonitor().start()
+    def collect() -> str:
+        out = Exposition()
+        for collector in collectors:
+            collector(out)
+        monitor.collect(out, labels)
+        collect_process(out, labels)
+        return out.text()
+    return await serve_metrics(collect, host, port)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the typed task parameters and the cached params file loader.
+
+Note:
+    - Params files are tab-separated lines: <name> <value> <unit>; unit 'None' marks text, 'bool' a flag,
+      anything else a number (see config/params.txt).
+    - TaskParams has one slot per known parameter (attribute = snake_case name, e.g. 'EMA Alpha' --> ema_alpha),
+      so hot-path reads are attribute loads instead of string-keyed dict lookups. p['EMA Alpha'] still works.
+    - ParamsLoader re-reads a file only when its mtime or size changed, and re-parses it only when its content
+      hash changed; load() is blocking, so call it through run_in_executor from the event loop.
+"""
+import csv, hashlib, io, os, re
+
+# Known parameters: (name in params file, type, default)
+SCHEMA = (
+    ('Subject', str, 'Unknown'),
+    ('Mode', str, 'standard'),
+    ('Orientation', str, 'MID'),
+    ('Task', str, 'standard'),
+    ('Tag', str, ''),
+    ('Trials', float, 2500.0),
+    ('Allowed Overshoots', float, 1.0),
+    ('N Targets', float, 8.0),
+    ('Target Size', float, 40.0),
+    ('Cursor Size', float, 8.0),
+    ('Cursor Line Width', float, 5.0),
+    ('Target Line Width', float, 5.0),
+    ('Outer Target Circle Radius', float, 200.0),
+    ('Target Angle Jitter', float, 0.0),
+    ('Target Angle Offset', float, 0.0),
+    ('Monitor Width', float, 15.0),
+    ('Monitor X Pixels', float, 1024.0),
+    ('Monitor Height', float, 15.0),
+    ('Monitor Y Pixels', float, 768.0),
+    ('Min T1_HOLD_1 Time', float, 0.5),
+    ('Max T1_HOLD_1 Time', float, 0.75),
+    ('Min T1_HOLD_2 Time', float, 0.5),
+    ('Max T1_HOLD_2 Time', float, 0.75),
+    ('Min INTERTRIAL Time', float, 0.15),
+    ('Max INTERTRIAL Time', float, 0.15),
+    ('Fixed GO Limit', float, 0.5),
+    ('Fixed MOVE Limit', float, 1.5),
+    ('Fixed OVERSHOOT Limit', float, 0.5),
+    ('Fixed T2_HOLD_1 Limit', float, 0.5),
+    ('Fixed REWARD Delay', float, 0.3),
+    ('Dispense Volume', float, 0.1),
+    ('Volume Increase', float, 0.0075),
+    ('N Trials Before Increase', float, 300.0),
+    ('Cursor Fill Color', str, 'white'),
+    ('Cursor Outline Color', str, 'white'),
+    ('Target Base Color', str, 'black'),
+    ('Target Hold Color', str, '#555'),
+    ('Target Error Color', str, 'black'),
+    ('Target Overshoot Color', str, 'black'),
+    ('Target Success Color', str, 'black'),
+    ('Color Markers', bool, False),
+    ('Enable Sound', bool, True),
+    ('Cursor Override', bool, False),
+    ('Save Data', bool, False),
+    ('N Trials Baseline', float, 5.0),
+    ('N Trials Perturbation', float, 5.0),
+    ('N Trials Washout', float, 5.0),
+    ('Jitter Angular Variance', float, 10.0),
+    ('VMR Rotation Angle', float, 30.0),
+    ('EMA Alpha', float, 0.1),
+    ('Filter Pipeline', str, 'ema'),
+    ('Sample Rate', float, 500.0),
+    ('One Euro Min Cutoff', float, 1.0),
+    ('One Euro Beta', float, 0.007),
+    ('One Euro D Cutoff', float, 1.0),
+    ('Biquad Cutoff', float, 10.0),
+    ('Biquad Q', float, 0.7071),
+    ('Dead Zone', float, 0.0),
+    ('Extrapolation Horizon', float, 0.0),
+    ('Extrapolation Alpha', float, 0.2),
+    ('Render Rate', float, 0.0),
+    ('ADC Left', float, 500.0),
+    ('ADC Right', float, 180.0),
+    ('ADC Top', float, 120.0),
+    ('ADC Bottom', float, 575.0)
+)
+
+
+def attribute(name: str) -> str:
+    """ Slot name for a params file name ('Min T1_HOLD_1 Time' --> 'min_t1_hold_1_time'). """
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+_TYPES = {name: kind for name, kind, _ in SCHEMA}
+_ATTRIBUTES = {name: attribute(name) for name, _, _ in SCHEMA}
+
+
+def coerce(name: str, value, kind=None):
+    """ Validates `value` as parameter `name` (unknown names keep the given kind, or their own type). """
+    kind = _TYPES.get(name, kind or type(value))
+    if kind is bool:
+        if isinstance(value, str):
+            if value not in ("True", "False"):
+                raise ValueError(f"Parameter '{name}' expects True or False, got '{value}'.")
+            return value == "True"
+        return bool(value)
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Parameter '{name}' expects {kind.__name__}, got '{value}'.") from None
+
+
+def parse(text: str, fname: str = '<params>') -> dict:
+    """ Parses params file contents into {name: typed value}. """
+    values = {}
+    for i, line in enumerate(csv.reader(io.StringIO(text), delimiter="\t"), 1):
+        if not line:
+            continue
+        if len(line) < 3:
+            raise ValueError(f"{fname}:{i}: expected <name> <value> <unit>, got {line}.")
+        kind = str if line[2] == "None" else bool if line[2] == "bool" else float
+        try:
+            values[line[0]] = coerce(line[0], line[1], kind)
+        except ValueError as e:
+            raise ValueError(f"{fname}:{i}: {e}") from None
+    return values
+
+
+class TaskParams(object):
+    """ Typed task parameters with one slot per known parameter; unknown file entries are kept in `extra`. """
+
+    __slots__ = tuple(_ATTRIBUTES.values()) + ('extra',)
+
+    def __init__(self, values: dict = None):
+        for name, _, default in SCHEMA:
+            setattr(self, _ATTRIBUTES[name], default)
+        self.extra = {}
+        if values:
+            self.update(values)
+
+    def __repr__(self):
+        return f'TaskParams({self.as_dict()})'
+
+    def __getitem__(self, name: str):
+        attr = _ATTRIBUTES.get(name)
+        return getattr(self, attr) if attr is not None else self.extra[name]
+
+    def __setitem__(self, name: str, value):
+        self.update({name: value})
+
+    def __contains__(self, name: str):
+        return name in _ATTRIBUTES or name in self.extra
+
+    def get(self, name: str, default=None):
+        return self[name] if name in self else default
+
+    def update(self, values: dict) -> set:
+        """ Validates and applies {name: value}; returns the names whose value changed. """
+        typed = {name: coerce(name, value) for name, value in values.items()} # all or nothing
+        changed = set()
+        for name, value in typed.items():
+            attr = _ATTRIBUTES.get(name)
+            if attr is None:
+                if self.extra.get(name) != value:
+                    self.extra[name] = value
+                    changed.add(name)
+            elif getattr(self, attr) != value:
+                setattr(self, attr, value)
+                changed.add(name)
+        return changed
+
+    def as_dict(self) -> dict:
+        return dict({name: getattr(self, attr) for name, attr in _ATTRIBUTES.items()}, **self.extra)
+
+
+class ParamsLoader(object):
+    """ Loads params files, skipping unchanged files by (mtime, size) and unchanged content by SHA-1. """
+
+    def __init__(self):
+        self._cache = {} # absolute path --> ((mtime_ns, size), digest, values)
+
+    def load(self, fname: str) -> dict:
+        """ Returns {name: typed value} for `fname` (blocking; the returned dict must not be modified). """
+        path = os.path.abspath(fname)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[2]
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).digest()
+        if cached is not None and cached[1] == digest:
+            values = cached[2]
+        else:
+            values = parse(data.decode('utf-8'), fname)
+        self._cache[path] = (stamp, digest, values)
+        return values
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the compact binary frame layouts used on the cursor channel.
+
+Note:
+    - Control events (`params`, `start`, `pause`, ...) stay JSON text frames.
+    - Binary frames are little-endian and always start with a one-byte frame code.
+    - A display client picks its encoding ('json', 'binary' or 'delta') with the websocket subprotocol it offers
+      (SUBPROTOCOLS), or later by sending {"event": "encoding", "encoding": "binary"}.
+    - Acquisition clients offer SOURCE: they only send samples and events, and are never registered as displays
+      (no display frames are queued for a client that does not read them).
+    - 'delta' clients get a display frame (keyframe) on connect and on every state change, and in between only
+      position frames, quantized to whole pixels and skipped while the position does not change. Positions are
+      absolute, so a dropped frame (drop-oldest queues) never leaves a display off by an accumulated error.
+    - permessage-deflate is negotiated per client (clients that do not offer it get uncompressed frames);
+      DEFLATE sets small windows and memory levels, as frames are small and the context lives per connection.
+    - Batch frames carry several samples with per-sample timestamps: a header <code, count, t0 (wall-clock s)>
+      followed by `count` records <dt (us since t0), x, y>.
+"""
+import struct
+import numpy as np
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from .enumerations import TaskState, TaskDirection
+
+# Frame codes (first byte of every binary frame)
+FRAME_CURSOR = 0x01   # inbound: one raw ADC sample  <code, x, y>
+FRAME_CURSOR_BATCH = 0x02  # inbound: timestamped raw ADC samples <code, count, t0> + count * <dt, x, y>
+FRAME_DISPLAY = 0x10  # outbound: cursor position + task state <code, x, y, target, state, direction>
+FRAME_POSITION = 0x11 # outbound ('delta' encoding): cursor position only <code, x, y>
+
+CURSOR_FRAME = struct.Struct('<Bhh')
+DISPLAY_FRAME = struct.Struct('<BhhBBB')
+POSITION_FRAME = struct.Struct('<Bhh')
+BATCH_HEADER = struct.Struct('<BHd')
+BATCH_SAMPLE = struct.Struct('<Ihh')
+BATCH_DTYPE = np.dtype([('dt', '<u4'), ('x', '<i2'), ('y', '<i2')])
+
+ENCODINGS = ('json', 'binary', 'delta')
+SUBPROTOCOLS = {'center-out.json': 'json', 'center-out.binary': 'binary', 'center-out.delta': 'delta'} # offered --> encoding
+SOURCE = 'center-out.source' # offered by acquisition clients (inbound only)
+
+# permessage-deflate settings offered to clients (see websockets.serve(extensions=...))
+DEFLATE = [ServerPerMessageDeflateFactory(server_max_window_bits=11, client_max_window_bits=11, compress_settings={'memLevel': 4})]
+
+# Lookup tables so that decoding never goes through Enum constructors.
+STATES = tuple(sorted(TaskState, key=lambda s: s.value))
+DIRECTIONS = tuple(sorted(TaskDirection, key=lambda d: d.value))
+
+
+def encode_cursor(x: int, y: int) -> bytes:
+    """Packs one raw ADC sample into an inbound cursor frame."""
+    return CURSOR_FRAME.pack(FRAME_CURSOR, x, y)
+
+
+def decode_cursor(frame: bytes):
+    """Unpacks an inbound cursor frame into (x, y) raw ADC values."""
+    code, x, y = CURSOR_FRAME.unpack(frame)
+    if code != FRAME_CURSOR:
+        raise ValueError(f'Not a cursor frame (code {code:#04x}).')
+    return x, y
+
+
+def encode_cursor_batch(samples) -> bytes:
+    """Packs a sequence of (t, x, y) samples (t in wall-clock seconds) into an inbound batch frame."""
+    t0 = min(t for t, _, _ in samples)
+    frame = bytearray(BATCH_HEADER.size + len(samples) * BATCH_SAMPLE.size)
+    BATCH_HEADER.pack_into(frame, 0, FRAME_CURSOR_BATCH, len(samples), t0)
+    offset = BATCH_HEADER.size
+    for t, x, y in samples:
+        BATCH_SAMPLE.pack_into(frame, offset, round((t - t0) * 1e6), x, y)
+        offset += BATCH_SAMPLE.size
+    return bytes(frame)
+
+
+def decode_cursor_batch(frame: bytes):
+    """Unpacks an inbound batch frame into (t, x, y) arrays; t is in wall-clock seconds."""
+    code, count, t0 = BATCH_HEADER.unpack_from(frame)
+    if code != FRAME_CURSOR_BATCH:
+        raise ValueError(f'Not a cursor batch frame (code {code:#04x}).')
+    samples = np.frombuffer(frame, dtype=BATCH_DTYPE, count=count, offset=BATCH_HEADER.size)
+    return t0 + samples['dt'] * 1e-6, samples['x'], samples['y']
+
+
+def encode_display(x: int, y: int, target: int, state: TaskState, direction: TaskDirection) -> bytes:
+    """Packs the outbound cursor/state frame sent to display clients."""
+    return DISPLAY_FRAME.pack(FRAME_DISPLAY, x, y, target, state.value, direction.value)
+
+
+def encode_position(x: int, y: int) -> bytes:
+    """Packs the outbound position frame of the 'delta' encoding."""
+    return POSITION_FRAME.pack(FRAME_POSITION, x, y)
+
+
+def decode_position(frame: bytes):
+    """Unpacks an outbound position frame into (x, y)."""
+    code, x, y = POSITION_FRAME.unpack(frame)
+    if code != FRAME_POSITION:
+        raise ValueError(f'Not a position frame (code {code:#04x}).')
+    return x, y
+
+
+def encoding(websocket) -> str:
+    """Encoding a client negotiated through its subprotocol ('json' if none)."""
+    return SUBPROTOCOLS.get(getattr(websocket, 'subprotocol', None), 'json')
+
+
+def is_source(websocket) -> bool:
+    """Whether a client connected as an acquisition source (SOURCE subprotocol) rather than a display."""
+    return getattr(websocket, 'subprotocol', None) == SOURCE
+
+
+def serve_options(compression: bool = True) -> dict:
+    """websockets.serve() keyword arguments: display and source subprotocols and (optionally) permessage-deflate."""
+    return {'subprotocols': list(SUBPROTOCOLS) + [SOURCE], 'extensions': DEFLATE if compression else [], 'compression': None}
+
+
+def decode_display(frame: bytes):
+    """Unpacks an outbound cursor/state frame into (x, y, target, state, direction)."""
+    code, x, y, target, state, direction = DISPLAY_FRAME.unpack(frame)
+    if code != FRAME_DISPLAY:
+        raise ValueError(f'Not a display frame (code {code:#04x}).')
+    return x, y, target, STATES[state], DIRECTIONS[direction]
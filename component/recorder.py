@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the session recorder (fixed-width binary records in a memory-mapped file).
+
+Note:
+    - Every record is 32 bytes: <t (f8, monotonic s), kind (u1), state (u1), target (u1), direction (u1), a, b, c, d (f4),
+      4 pad bytes>, so the timestamps of a memory-mapped file stay 8-byte aligned (the header is 64 bytes).
+      Version 1 files (28-byte records, no padding) still load.
+    - SAMPLE:     a, b = raw ADC x, y (bits);  c, d = filtered cursor x, y (pixels);  t = sample time
+    - TRANSITION: state = new state;  a = previous state;  t = event time (interpolated target boundary crossing)
+    - OUTCOME:    a = OutcomeState value;  b = overshoots;  c = total trials
+    - The file is preallocated and grows by doubling, so writes are plain stores into the mapping.
+      A background thread periodically updates the record count in the header and msyncs the file.
+"""
+import mmap, os, struct, threading, time
+import numpy as np
+
+MAGIC = b'CNTROUT1'
+HEADER = struct.Struct('<8sIIQd') # magic, version, record size, record count, session start (monotonic s)
+HEADER_SIZE = 64
+RECORD = struct.Struct('<dBBBBffff4x')
+VERSION = 2
+
+SAMPLE = 0
+TRANSITION = 1
+OUTCOME = 2
+
+_FIELDS = [('t', '<f8'), ('kind', 'u1'), ('state', 'u1'), ('target', 'u1'), ('direction', 'u1'),
+           ('a', '<f4'), ('b', '<f4'), ('c', '<f4'), ('d', '<f4')]
+DTYPE = np.dtype({'names': [name for name, _ in _FIELDS], 'formats': [kind for _, kind in _FIELDS], 'itemsize': RECORD.size})
+DTYPES = {1: np.dtype(_FIELDS), VERSION: DTYPE} # by file version
+
+
+class Recorder(object):
+    """ Appends fixed-width records to a preallocated memory-mapped session file. """
+
+    def __init__(self, fname: str, capacity: int = 1 << 20, flush_interval: float = 1.0):
+        self.fname = fname
+        self.flush_interval = flush_interval
+        self.t0 = time.monotonic()
+        self._n = 0
+        self._capacity = capacity
+        self._pack = RECORD.pack_into
+        self._size = RECORD.size
+        self._lock = threading.Lock() # held while flushing or remapping, never per record
+        self._f = open(fname, 'w+b')
+        self._f.truncate(HEADER_SIZE + capacity * RECORD.size)
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, RECORD.size, 0, self.t0)
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='recorder-flusher', daemon=True)
+        self._flusher.start()
+
+    def __len__(self):
+        return self._n
+
+    def write(self, kind: int, state: int, target: int, direction: int, a: float = 0.0, b: float = 0.0, c: float = 0.0, d: float = 0.0, t: float = None):
+        """ Stores one record, timestamped `t` (monotonic s, defaults to now). """
+        n = self._n
+        if n == self._capacity:
+            self._grow()
+        self._pack(self._mm, HEADER_SIZE + n * self._size, time.monotonic() if t is None else t, kind, state, target, direction, a, b, c, d)
+        self._n = n + 1
+
+    def _grow(self):
+        with self._lock:
+            self._capacity *= 2
+            self._mm.close()
+            self._f.truncate(HEADER_SIZE + self._capacity * RECORD.size)
+            self._mm = mmap.mmap(self._f.fileno(), 0)
+
+    def flush(self):
+        """ Publishes the current record count in the header and writes dirty pages to disk. """
+        with self._lock:
+            if self._mm.closed:
+                return
+            struct.pack_into('<Q', self._mm, 16, self._n)
+            self._mm.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """ Stops the flusher and trims the file to the records actually written. """
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        with self._lock:
+            self._mm.close()
+            self._f.truncate(HEADER_SIZE + self._n * RECORD.size)
+            self._f.close()
+
+
+def load_session(fname: str) -> np.ndarray:
+    """ Loads a session file into a structured array (see DTYPE), including files from unclean shutdowns. """
+    with open(fname, 'rb') as f:
+        magic, version, size, n, t0 = HEADER.unpack(f.read(HEADER.size))
+    dtype = DTYPES.get(version)
+    if magic != MAGIC or dtype is None or size != dtype.itemsize:
+        raise ValueError(f'{fname} is not a CenterOut session file.')
+    n = min(n, (os.path.getsize(fname) - HEADER_SIZE) // size)
+    return np.fromfile(fname, dtype=dtype, count=n, offset=HEADER_SIZE)
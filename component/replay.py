@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the deterministic replay engine (recorded cursor streams through CenterOut on a virtual clock).
+
+Note:
+    - VirtualTimers replaces the TimerScheduler: time only moves when the replay advances it to the next
+      sample, timeouts fire in order at exactly their due time, and the coroutines they start are run to
+      completion before the next sample. Nothing waits on wall time and no websocket is opened.
+    - The EMA filter, boundary crossings, reaction/movement times and timeouts all run on sample time, and
+      hold times are drawn from a seeded generator, so the same stream, params and seed always produce
+      the same records (compare Replay.digest() across code changes; tests/check_replay.py pins the digests of a
+      committed recording for both engines).
+    - Samples are (t, x, y) with t in seconds and x, y raw ADC values, e.g. the SAMPLE records of a
+      session recording (load_samples) or any array triple.
+"""
+import asyncio, hashlib, heapq, logging
+from collections import deque
+import numpy as np
+from .fsm import CenterOut
+from .recorder import DTYPE, SAMPLE, TRANSITION, OUTCOME, load_session
+from .timers import Timer, TimerScheduler
+
+
+class _Handle(object):
+    __slots__ = ('cancelled',)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualTimers(TimerScheduler):
+    """ TimerScheduler on a virtual clock that only moves in advance(). """
+
+    def __init__(self, t0: float = 0.0, history: int = 4096):
+        super().__init__(lead=0.0, history=history)
+        self.now = t0
+        self._heap = [] # (when, sequence, handle, timer)
+        self._sequence = 0
+        self._spawned = deque()
+
+    def time(self) -> float:
+        return self.now
+
+    def call_at(self, when: float, callback, *args, label: str = '') -> Timer:
+        timer = Timer(when, label, callback, args)
+        timer._handle = _Handle()
+        heapq.heappush(self._heap, (when, self._sequence, timer._handle, timer))
+        self._sequence += 1
+        return timer
+
+    def call_later(self, delay: float, callback, *args, label: str = '') -> Timer:
+        return self.call_at(self.now + delay, callback, *args, label=label)
+
+    def spawn(self, coro):
+        self._spawned.append(coro)
+
+    async def drain(self):
+        """ Runs the coroutines started by fired timers, in order. """
+        while self._spawned:
+            await self._spawned.popleft()
+
+    async def advance(self, t: float):
+        """ Fires every timer due up to t (at its due time), then sets the clock to t. """
+        heap = self._heap
+        while heap and heap[0][0] <= t:
+            when, _, handle, timer = heapq.heappop(heap)
+            if handle.cancelled:
+                continue
+            self.now = max(self.now, when)
+            timer._handle = None
+            timer.fired = True
+            i = self.count % self.history
+            self._planned[i] = when
+            self._actual[i] = self.now
+            self._label[i] = self._labels.setdefault(timer.label, len(self._labels))
+            self.count += 1
+            timer.callback(*timer.args)
+            await self.drain()
+        self.now = max(self.now, t)
+
+
+class MemoryRecorder(object):
+    """ In-memory stand-in for Recorder (same write() signature); records() returns the recorder DTYPE. """
+
+    def __init__(self, samples: bool = True):
+        self.samples = samples
+        self._rows = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def write(self, kind: int, state: int, target: int, direction: int, a: float = 0.0, b: float = 0.0, c: float = 0.0, d: float = 0.0, t: float = None):
+        if kind != SAMPLE or self.samples:
+            self._rows.append((t, kind, state, target, direction, a, b, c, d))
+
+    def records(self) -> np.ndarray:
+        records = np.zeros(len(self._rows), dtype=DTYPE) # zeroed padding: digests depend on the fields only
+        records[:] = self._rows
+        return records
+
+
+def load_samples(fname: str):
+    """ (t, x, y) raw samples from a session recording (.rec) or a text file with 't,x,y' lines. """
+    if fname.endswith('.rec'):
+        records = load_session(fname)
+        samples = records[records['kind'] == SAMPLE]
+        return samples['t'].astype(float), samples['a'].astype(float), samples['b'].astype(float)
+    data = np.loadtxt(fname, delimiter=',', ndmin=2)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+class Replay(object):
+    """ Runs a recorded cursor stream through a fresh CenterOut as fast as the CPU allows. """
+
+    def __init__(self, targets_file: str = 'config/targets.txt', params_file: str = 'config/params.txt', params: dict = None, engine: str = 'compiled', seed: int = 0, samples: bool = False, log_dir: str = 'logs'):
+        '''Constructor for Replay object.
+
+        params overrides entries of params_file (e.g. {'Target Size': 30, 'Fixed MOVE Limit': 1.0}).
+        samples keeps the SAMPLE records in the result (transitions and outcomes are always kept).
+        '''
+        self.timers = VirtualTimers()
+        self.game = CenterOut(targets_file=targets_file, params_file=params_file, engine=engine, log_dir=log_dir,
+                              trace_interval=0, timers=self.timers, seed=seed)
+        self.game.logger.setLevel(logging.WARNING) # per-trial INFO lines would dominate the replay time
+        if params:
+            self.game.apply_parameters(params)
+        self.game.recorder = MemoryRecorder(samples)
+
+    async def start(self, t0: float):
+        """ Sets the clock to t0 and starts the task. """
+        self.timers.now = t0
+        await self.game.start()
+        await self.timers.drain()
+
+    async def feed(self, t, x, y):
+        """ Ingests one frame of samples at the time of its last sample (timeouts due by then fire first). """
+        await self.timers.advance(t[-1])
+        await self.game.ingest_batch(x, y, t)
+        await self.timers.drain()
+
+    async def finish(self) -> np.ndarray:
+        """ Stops the task and returns the records. """
+        await self.game.stop()
+        await self.timers.drain()
+        return self.game.recorder.records()
+
+    async def run(self, t, x, y, batch: int = 1) -> np.ndarray:
+        """ Starts the task at t[0], feeds the samples (batch at a time) and returns the records. """
+        t, x, y = np.asarray(t, dtype=float), np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        game, timers = self.game, self.timers
+        await self.start(t[0])
+        if batch > 1:
+            for i in range(0, len(t), batch):
+                await self.feed(t[i:i + batch], x[i:i + batch], y[i:i + batch])
+        else:
+            for ti, xi, yi in zip(t.tolist(), x.tolist(), y.tolist()):
+                await timers.advance(ti)
+                await game.ingest_sample(xi, yi, ti)
+                await timers.drain()
+        return await self.finish()
+
+    def digest(self) -> str:
+        """ SHA-1 of the records so far (identical streams, params and seed give identical digests). """
+        return hashlib.sha1(self.game.recorder.records().tobytes()).hexdigest()
+
+    def summary(self) -> dict:
+        records = self.game.recorder.records()
+        outcomes = records[records['kind'] == OUTCOME]
+        transitions = records[records['kind'] == TRANSITION]
+        return {'trials': len(outcomes), 'successful': int((outcomes['a'] == 1).sum()),
+                'unsuccessful': int((outcomes['a'] == 0).sum()), 'transitions': len(transitions),
+                'timeouts': self.timers.count}
+
+
+def replay(t, x, y, batch: int = 1, **kwargs) -> Replay:
+    """ Replays one stream synchronously; returns the Replay (see Replay.summary() and Replay.game). """
+    r = Replay(**kwargs)
+    asyncio.run(r.run(t, x, y, batch))
+    return r
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the trial schedule (whole target sequence preloaded into compact arrays).
+
+Note:
+    - One entry per scheduled target, plus the block labels (baseline, perturbation, washout) of the trials.
+    - Targets come from a targets file (one integer per line) or are generated as seeded, balanced
+      pseudo-random orders: whole cycles in which every target appears once, in shuffled order.
+    - Blocks are looked up by trial count, not by position in the target sequence: block(n) is the block of the
+      trial after n counted trials (the first (baseline) trials, then (perturbation) trials, then washout). The
+      task counts successful trials, like the display, and advances the target sequence at its own pace.
+    - The whole target sequence is always used; it wraps around at its end (like the targets file used to), but
+      the block labels do not (there is no return to baseline after washout).
+    - next() is O(1) and never touches the filesystem. Load files off the event loop, then swap schedules by assignment.
+"""
+from array import array
+import numpy as np
+
+BASELINE = 0
+PERTURBATION = 1
+WASHOUT = 2
+BLOCKS = ('baseline', 'perturbation', 'washout')
+
+
+def load_targets(fname: str) -> array:
+    """ Reads a targets file (one target index per line, blank lines ignored). """
+    with open(fname, 'r') as f:
+        return array('B', (int(line) for line in f if line.strip()))
+
+
+def block_labels(n: int, block_trials=None) -> array:
+    """ Block of each of n trials given (baseline, perturbation, washout) trial counts; trials past the last block are washout. """
+    blocks = array('B', bytes(n)) # all baseline
+    if block_trials:
+        start = 0
+        for block, count in enumerate(block_trials):
+            stop = min(start + int(count), n)
+            blocks[start:stop] = array('B', [block]) * (stop - start)
+            start = stop
+        if start < n:
+            blocks[start:] = array('B', [WASHOUT]) * (n - start)
+    return blocks
+
+
+class TrialSchedule(object):
+    """ Preloaded target/block sequence with O(1) next-trial lookup. """
+
+    def __init__(self, targets, block_trials=None):
+        '''Constructor for TrialSchedule object.
+
+        targets is the target sequence (any iterable of ints < 256).
+        block_trials are the (baseline, perturbation, washout) trial counts; when given, every trial is labeled
+        with its block by trial count (trials past the blocks are washout), else every trial is baseline.
+        '''
+        targets = self.targets = array('B', targets)
+        if not targets:
+            raise ValueError('Empty trial schedule.')
+        self.block_trials = block_trials
+        self.blocks = block_labels(int(sum(block_trials)) if block_trials else 0, block_trials) # labels of the trials in blocks
+        self.after = WASHOUT if block_trials else BASELINE # label of every later trial
+        self.trial = 0 # index of the next target (counted across passes through the targets)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __repr__(self):
+        return f'TrialSchedule({len(self)} targets, next={self.position}, cycles={self.cycles})'
+
+    @property
+    def position(self) -> int:
+        """ Index of the next target in the target sequence. """
+        return self.trial % len(self.targets)
+
+    @property
+    def cycles(self) -> int:
+        """ Completed passes through the target sequence. """
+        return self.trial // len(self.targets)
+
+    @classmethod
+    def from_file(cls, fname: str, block_trials=None):
+        return cls(load_targets(fname), block_trials)
+
+    @classmethod
+    def balanced(cls, n_targets: int, block_trials, seed: int = None):
+        """ Seeded pseudo-random order of whole cycles (every target once per cycle of n_targets trials), enough
+        cycles to cover the blocks; never truncated, so every target appears equally often. """
+        n = max(int(sum(block_trials)), n_targets)
+        rng = np.random.default_rng(seed)
+        cycles = [rng.permutation(n_targets) for _ in range(-(-n // n_targets))]
+        return cls(np.concatenate(cycles).tolist(), block_trials)
+
+    def next(self) -> int:
+        """ Returns the next target. """
+        i = self.trial
+        self.trial = i + 1
+        return self.targets[i % len(self.targets)]
+
+    def block(self, trials: int) -> int:
+        """ Block of the trial after `trials` counted trials. """
+        return self.blocks[trials] if trials < len(self.blocks) else self.after
+
+    def seek(self, trial: int):
+        """ Continues from target `trial` (e.g. to keep a session's place after rebuilding its schedule). """
+        self.trial = trial
+        return self
+
+    def relabel(self, block_trials):
+        """ Same target sequence with new block counts, continuing at the same target. """
+        return TrialSchedule(self.targets, block_trials).seek(self.trial)
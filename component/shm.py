@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the shared-memory cursor sample transport (acquisition process --> CenterOut on the same host).
+
+Note:
+    - SampleRing is a single-producer/single-consumer ring of (t, x, y) float64 records in a named shared memory
+      segment. The writer and reader positions are free-running uint64 counters on separate cache lines; only the
+      producer stores the write position and only the consumer the read position, so neither side takes a lock.
+      A record is published by storing the write position after the record (aligned 8-byte stores, which are atomic
+      and not reordered with earlier stores on x86-64; the wakeup syscall that follows is a barrier elsewhere).
+    - The producer never overwrites unread records: when the ring is full, the newest samples are dropped and
+      counted in the header (`dropped`). The default capacity holds several seconds at 500 Hz.
+    - Wakeups go through a named pipe next to the segment: the producer writes one byte per published frame and
+      the consumer's event loop watches the pipe (loop.add_reader), then drains every pending record at once.
+      An eventfd would need fd passing between these unrelated processes; a FIFO gives the same single-syscall wakeup.
+    - RingConsumer.serve(game) hands each drained frame to CenterOut.ingest_frame, the same ingestion as the
+      websocket's binary cursor batches; sample times are the producer's wall clock (time.time()), as on the wire.
+    - POSIX only (named pipes and loop.add_reader on them): check AVAILABLE before creating a RingConsumer.
+      A segment left by a crashed server is replaced, but not one whose creating process is still running.
+"""
+import asyncio, errno, os, tempfile, time
+from multiprocessing import shared_memory
+import numpy as np
+
+MAGIC = int.from_bytes(b'CURRING1', 'little')
+SAMPLE_DTYPE = np.dtype([('t', '<f8'), ('x', '<f8'), ('y', '<f8')])
+HEADER_SIZE = 192 # magic, capacity, dropped, owner pid | write position (own cache line) | read position (own cache line)
+_MAGIC, _CAPACITY, _DROPPED, _OWNER, _WRITE, _READ = 0, 1, 2, 3, 8, 16 # uint64 slots of the header
+
+AVAILABLE = hasattr(os, 'mkfifo') # the wakeup pipe needs POSIX named pipes
+
+
+def fifo_path(name: str) -> str:
+    """ Wakeup pipe of the ring `name`. """
+    return os.path.join(tempfile.gettempdir(), f'{name}.fifo')
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # exists, owned by another user
+        return True
+    return True
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """ Opens an existing segment without registering it for cleanup (only its creator unlinks it). """
+    try:
+        return shared_memory.SharedMemory(name, track=False) # Python >= 3.13
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        from multiprocessing import resource_tracker # before 3.13, every attached segment is unlinked at exit
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SampleRing(object):
+    """ Shared-memory SPSC ring of cursor samples; create() on the consumer side, attach() on the producer side. """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray(HEADER_SIZE // 8, dtype='<u8', buffer=shm.buf)
+        if self.header[_MAGIC] != MAGIC:
+            raise ValueError(f"Shared memory '{shm.name}' is not a sample ring.")
+        self.capacity = int(self.header[_CAPACITY])
+        self.records = np.ndarray(self.capacity, dtype=SAMPLE_DTYPE, buffer=shm.buf, offset=HEADER_SIZE)
+
+    @classmethod
+    def create(cls, name: str, capacity: int = 4096) -> 'SampleRing':
+        """ Creates the segment `name`, replacing a stale one left by a crashed server (FileExistsError if it is in use). """
+        size = HEADER_SIZE + capacity * SAMPLE_DTYPE.itemsize
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            owner = 0
+            if stale.size >= HEADER_SIZE:
+                header = np.ndarray(HEADER_SIZE // 8, dtype='<u8', buffer=stale.buf)
+                owner = int(header[_OWNER]) if header[_MAGIC] == MAGIC else 0
+                del header
+            if owner and owner != os.getpid() and _running(owner):
+                stale.close()
+                raise FileExistsError(f"Sample ring '{name}' is in use by process {owner}.")
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        header = np.ndarray(HEADER_SIZE // 8, dtype='<u8', buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_OWNER] = os.getpid()
+        header[_MAGIC] = MAGIC
+        del header # no exported buffers may remain when the segment is closed
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SampleRing':
+        return cls(_attach(name), owner=False)
+
+    @property
+    def dropped(self) -> int:
+        return int(self.header[_DROPPED])
+
+    def __len__(self):
+        return int(self.header[_WRITE] - self.header[_READ])
+
+    def write(self, t, x, y) -> int:
+        """ Producer: appends samples (arrays or sequences); returns how many fit (the rest are dropped). """
+        header, capacity = self.header, self.capacity
+        w = int(header[_WRITE])
+        n = len(t)
+        free = capacity - (w - int(header[_READ]))
+        if n > free:
+            header[_DROPPED] += n - free
+            n = free
+        if n <= 0:
+            return 0
+        i = w % capacity
+        first = min(n, capacity - i)
+        for field, values in (('t', t), ('x', x), ('y', y)):
+            values = np.asarray(values, dtype=float)
+            self.records[field][i:i + first] = values[:first]
+            self.records[field][:n - first] = values[first:n]
+        header[_WRITE] = w + n # publish
+        return n
+
+    def read(self, limit: int = None) -> np.ndarray:
+        """ Consumer: returns (a copy of) the unread records, at most `limit`, and releases their slots. """
+        header, capacity = self.header, self.capacity
+        r = int(header[_READ])
+        n = int(header[_WRITE]) - r
+        if limit is not None:
+            n = min(n, limit)
+        i = r % capacity
+        first = min(n, capacity - i)
+        out = np.concatenate([self.records[i:i + first], self.records[:n - first]]) if n > first else self.records[i:i + n].copy()
+        header[_READ] = r + n
+        return out
+
+    def close(self):
+        self.header = self.records = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingWriter(object):
+    """ Producer side: writes frames into the ring `name` and wakes the consumer; reattaches when the server restarts. """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ring = None
+        self._fd = None
+
+    def _connect(self) -> bool:
+        try:
+            fd = os.open(fifo_path(self.name), os.O_WRONLY | os.O_NONBLOCK)
+        except OSError: # no server (ENOENT), or no reader on the pipe (ENXIO)
+            return False
+        try:
+            self.ring = SampleRing.attach(self.name)
+        except (FileNotFoundError, ValueError):
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def _disconnect(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def write(self, t, x, y) -> int:
+        """ Publishes one frame; returns the samples written (0 while no server is running). """
+        if self.ring is None and not self._connect():
+            return 0
+        n = self.ring.write(t, x, y)
+        try:
+            os.write(self._fd, b'\x01')
+        except BlockingIOError: # pipe full: the consumer has wakeups pending already
+            pass
+        except OSError as e: # the server went away: its segment is gone, attach to the next one
+            self._disconnect()
+            if e.errno != errno.EPIPE:
+                raise
+            return 0
+        return n
+
+    def close(self):
+        self._disconnect()
+
+
+class RingConsumer(object):
+    """ Consumer side: creates the ring and its wakeup pipe, and feeds drained frames to a CenterOut. """
+
+    def __init__(self, name: str = 'centerout_cursor', capacity: int = 4096, max_frame: int = 256):
+        self.name = name
+        self.max_frame = max_frame
+        self.ring = SampleRing.create(name, capacity)
+        path = fifo_path(name)
+        if os.path.exists(path):
+            os.unlink(path)
+        os.mkfifo(path, 0o600)
+        self._fd = os.open(path, os.O_RDWR | os.O_NONBLOCK) # read-write: never sees EOF while no producer is attached
+        self._wakeup = asyncio.Event()
+
+    def __repr__(self):
+        return f'RingConsumer({self.name}, {len(self.ring)}/{self.ring.capacity} pending, {self.ring.dropped} dropped)'
+
+    def _on_readable(self):
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        self._wakeup.set()
+
+    async def serve(self, game):
+        """ Ingests every published frame into `game` (at most max_frame samples per ingest_frame call). """
+        loop = asyncio.get_running_loop()
+        label = f'shm:{self.name}'
+        slot = game.connections.open(label)
+        messages, samples = game.connections.messages, game.connections.samples
+        loop.add_reader(self._fd, self._on_readable)
+        self._wakeup.set() # samples written before the reader was registered
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while len(self.ring):
+                    received = time.perf_counter()
+                    frame = self.ring.read(self.max_frame)
+                    messages[slot] += 1
+                    samples[slot] += len(frame)
+                    await game.ingest_frame(frame['t'], frame['x'], frame['y'], label)
+                    game.tracer.record('ingest', label, time.perf_counter() - received)
+        finally:
+            loop.remove_reader(self._fd)
+            game.connections.close(slot)
+            game.tracer.forget(label)
+
+    def close(self):
+        os.close(self._fd)
+        os.unlink(fifo_path(self.name))
+        self.ring.close()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the display snapshot sent to every newly connected (or resynchronized) display client.
+
+Note:
+    - A Snapshot is one JSON frame made of named sections (params, score, recent trials, stats), each built by a
+      callable. Sections keep their encoded JSON until invalidate() marks them changed; encode() re-encodes only
+      those and reuses the joined frame otherwise, so registering a client costs one string join per connection.
+    - Live values (cursor position and state, connected users, resume token) are passed to encode() and never cached.
+    - The frame is sent alone, before any published frame, so a new client starts from one consistent state
+      instead of assembling it from separate params/cursor/users events.
+"""
+import json
+
+
+class Snapshot(object):
+    """ JSON frame of the display state, cached and re-encoded section by section as sections change. """
+
+    def __init__(self, sections: dict, kind: str = 'snapshot'):
+        '''Constructor for Snapshot object.
+
+        sections maps each section name to a callable returning its (JSON-serializable) value; the frame keeps
+        their order.
+        '''
+        self.kind = kind
+        self._sections = sections
+        self._encoded = {} # section --> its JSON
+        self._frame = None # joined sections (without the enclosing braces)
+        self.encodes = 0 # section encodings so far
+
+    def invalidate(self, *names):
+        """ Marks sections changed (all of them if none is named); they are re-encoded by the next encode(). """
+        for name in names or tuple(self._encoded):
+            self._encoded.pop(name, None)
+        self._frame = None
+
+    def encode(self, **live) -> str:
+        """ The snapshot frame, with `live` values added as extra fields. """
+        if self._frame is None:
+            for name, build in self._sections.items():
+                if name not in self._encoded:
+                    self._encoded[name] = json.dumps(build())
+                    self.encodes += 1
+            self._frame = ', '.join(f'"{name}": {self._encoded[name]}' for name in self._sections)
+        extra = ''.join(f', "{name}": {json.dumps(value)}' for name, value in live.items())
+        return f'{{"event": "none", "type": "{self.kind}", {self._frame}{extra}}}'
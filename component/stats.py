@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the online trial statistics (kinematics and outcomes accumulated while the task runs).
+
+Note:
+    - The trial in progress is summarized by O(1)-per-sample accumulators that run from the go cue to the
+      outcome: path length, peak speed and the largest distance past the T2 edge while overshooting.
+      Reaction time (go --> move), movement time (move --> first T2 entry) and trial duration (t1_pre --> outcome)
+      come from the transition times (interpolated boundary crossings, see CenterOut.record_state).
+    - Every outcome finalizes one TRIAL_DTYPE record and updates running per-target and per-block summaries:
+      trial and success counts, success over the last `window` trials, and Welford mean/SD of every metric,
+      so summary() is available at any point of a session without a pass over its trials.
+    - Metrics that do not apply to a trial are NaN in its record and left out of the means (e.g. no reaction
+      time before the go cue; overshoot_distance is only set on trials that overshot).
+"""
+import math
+import numpy as np
+from .enumerations import TaskState
+
+METRICS = ('reaction_time', 'movement_time', 'path_length', 'peak_speed', 'overshoot_distance', 'duration')
+
+TRIAL_DTYPE = np.dtype([('trial', '<u4'), ('target', 'u1'), ('block', 'u1'), ('direction', 'u1'), ('outcome', 'u1'),
+                        ('overshoots', '<u2'), ('t_end', '<f8')] + [(name, '<f4') for name in METRICS])
+
+_TRACKED = (TaskState.go, TaskState.move, TaskState.t2_hold_1, TaskState.overshoot) # states whose samples are accumulated
+
+
+class RunningSummary(object):
+    """ Trial/success counts, recent success and Welford mean/variance of METRICS for each of `groups` groups. """
+
+    def __init__(self, groups: int, window: int = 20):
+        self.trials = np.zeros(groups, dtype=np.int64)
+        self.successes = np.zeros(groups, dtype=np.int64)
+        self.recent = np.full((groups, window), -1, dtype=np.int8) # ring of the latest outcomes (-1: empty)
+        self.n = np.zeros((groups, len(METRICS)), dtype=np.int64)
+        self.mean = np.zeros((groups, len(METRICS)))
+        self.m2 = np.zeros((groups, len(METRICS)))
+
+    def __len__(self):
+        return len(self.trials)
+
+    def grow(self, groups: int):
+        if groups > len(self):
+            extra = groups - len(self)
+            for name in ('trials', 'successes', 'n', 'mean', 'm2', 'recent'):
+                a = getattr(self, name)
+                pad = np.full((extra,) + a.shape[1:], -1 if name == 'recent' else 0, dtype=a.dtype)
+                setattr(self, name, np.concatenate([a, pad]))
+
+    def add(self, group: int, success: bool, values: np.ndarray):
+        trials = self.trials[group]
+        self.recent[group, trials % self.recent.shape[1]] = success
+        self.trials[group] = trials + 1
+        self.successes[group] += success
+        finite = np.isfinite(values)
+        n = self.n[group] + finite
+        delta = np.where(finite, values - self.mean[group], 0.0)
+        self.mean[group] += np.divide(delta, n, out=np.zeros(len(METRICS)), where=n > 0)
+        self.m2[group] += np.where(finite, delta * (values - self.mean[group]), 0.0)
+        self.n[group] = n
+
+    def describe(self, group: int) -> dict:
+        trials = int(self.trials[group])
+        recent = self.recent[group][self.recent[group] >= 0]
+        out = {'trials': trials,
+               'success_rate': float(self.successes[group] / trials) if trials else None,
+               'recent_success_rate': float(recent.mean()) if len(recent) else None}
+        for i, name in enumerate(METRICS):
+            n = self.n[group, i]
+            out[name] = {'n': int(n), 'mean': float(self.mean[group, i]) if n else None,
+                         'sd': math.sqrt(self.m2[group, i] / (n - 1)) if n > 1 else None}
+        return out
+
+
+class SessionStats(object):
+    """ Accumulates the kinematics of the trial in progress and summarizes completed trials per target and block. """
+
+    def __init__(self, n_targets: int = 8, n_blocks: int = 3, window: int = 20, capacity: int = 1024):
+        self._sizes = (n_targets, n_blocks, window, capacity)
+        self.reset()
+
+    def reset(self):
+        """ Drops every completed trial and the trial in progress. """
+        n_targets, n_blocks, window, capacity = self._sizes
+        self.by_target = RunningSummary(n_targets, window)
+        self.by_block = RunningSummary(n_blocks, window)
+        self.all = RunningSummary(1, window)
+        self._trials = np.zeros(capacity, dtype=TRIAL_DTYPE)
+        self._n = 0
+        self._begin_trial(math.nan)
+
+    def __len__(self):
+        return self._n
+
+    def _begin_trial(self, t: float):
+        self.active = False # accumulating samples (go cue --> outcome)
+        self.overshooting = False
+        self.t_start = t
+        self.t_go = self.t_move = self.t_reach = math.nan
+        self.path_length = 0.0
+        self.peak_speed = 0.0
+        self.overshoot_distance = math.nan
+        self._last = None # (x, y, t) of the latest accumulated sample
+        self._center = (0.0, 0.0)
+        self._radius = 0.0
+
+    def trials(self) -> np.ndarray:
+        """ Records of the completed trials (a view; copy it to keep it). """
+        return self._trials[:self._n]
+
+    def transition(self, state: TaskState, t: float, x: float, y: float, center: tuple, radius: float):
+        """ Called on every state entry with the cursor position and the current T2 (center, radius). """
+        if state is TaskState.t1_pre:
+            if self.active or not math.isnan(self.t_go): # left without an outcome (reset, pause): discard
+                self._begin_trial(t)
+            elif math.isnan(self.t_start):
+                self.t_start = t
+        elif state is TaskState.go:
+            self.active = True
+            self.t_go = t
+            self._last = (x, y, t)
+            self._center, self._radius = center, radius
+        elif state is TaskState.move:
+            self.t_move = t
+        elif state is TaskState.t2_hold_1 and math.isnan(self.t_reach):
+            self.t_reach = t
+        elif state is TaskState.idle:
+            self._begin_trial(math.nan)
+        self.overshooting = state is TaskState.overshoot
+        if self.active and state not in _TRACKED:
+            self.active = False
+
+    def sample(self, x: float, y: float, t: float):
+        """ O(1) update with one cursor sample (pixels, monotonic s). """
+        if not self.active:
+            return
+        x0, y0, t0 = self._last
+        step = math.hypot(x - x0, y - y0)
+        self.path_length += step
+        if t > t0 and step / (t - t0) > self.peak_speed:
+            self.peak_speed = step / (t - t0)
+        if self.overshooting:
+            d = math.hypot(x - self._center[0], y - self._center[1]) - self._radius
+            if not d <= self.overshoot_distance:
+                self.overshoot_distance = d
+        self._last = (x, y, t)
+
+    def samples(self, xs: np.ndarray, ys: np.ndarray, ts: np.ndarray):
+        """ Same as sample() for a frame of samples, vectorized. """
+        if not self.active or len(xs) == 0:
+            return
+        x0, y0, t0 = self._last
+        steps = np.hypot(np.diff(xs, prepend=x0), np.diff(ys, prepend=y0))
+        dts = np.diff(ts, prepend=t0)
+        self.path_length += float(steps.sum())
+        moving = dts > 0
+        if moving.any():
+            self.peak_speed = max(self.peak_speed, float((steps[moving] / dts[moving]).max()))
+        if self.overshooting:
+            d = float(np.hypot(xs - self._center[0], ys - self._center[1]).max()) - self._radius
+            if not d <= self.overshoot_distance:
+                self.overshoot_distance = d
+        self._last = (float(xs[-1]), float(ys[-1]), float(ts[-1]))
+
+    def finish(self, success: bool, target: int, block: int, direction: int, overshoots: int, t: float) -> np.void:
+        """ Finalizes the trial in progress into a record and the running summaries; returns the record. """
+        if self._n == len(self._trials):
+            self._trials = np.concatenate([self._trials, np.zeros(len(self._trials), dtype=TRIAL_DTYPE)])
+        cued = not math.isnan(self.t_go) # no kinematics for trials failed before the go cue
+        values = np.array([self.t_move - self.t_go, self.t_reach - self.t_move,
+                           self.path_length if cued else math.nan, self.peak_speed if cued else math.nan,
+                           self.overshoot_distance, t - self.t_start])
+        record = self._trials[self._n]
+        record['trial'], record['target'], record['block'], record['direction'] = self._n, target, block, direction
+        record['outcome'], record['overshoots'], record['t_end'] = success, overshoots, t
+        for name, value in zip(METRICS, values):
+            record[name] = value
+        self._n += 1
+        self.by_target.grow(target + 1)
+        self.by_target.add(target, success, values)
+        self.by_block.grow(block + 1)
+        self.by_block.add(block, success, values)
+        self.all.add(0, success, values)
+        self._begin_trial(math.nan)
+        return record
+
+    def summary(self) -> dict:
+        """ Whole-session, per-target and per-block summaries (targets/blocks without trials are left out). """
+        return {'session': self.all.describe(0),
+                'targets': {int(g): self.by_target.describe(g) for g in np.flatnonzero(self.by_target.trials)},
+                'blocks': {int(g): self.by_block.describe(g) for g in np.flatnonzero(self.by_block.trials)}}
+
+    @staticmethod
+    def describe(record: np.void) -> dict:
+        """ JSON-ready trial record (NaN metrics are None). """
+        trial = {name: (None if math.isnan(record[name]) else float(record[name])) for name in METRICS}
+        trial.update({name: int(record[name]) for name in ('trial', 'target', 'block', 'direction', 'outcome', 'overshoots')})
+        return trial
+
+    def recent(self, n: int = 20) -> list:
+        """ JSON-ready records of the latest `n` completed trials, oldest first. """
+        return [self.describe(record) for record in self._trials[max(0, self._n - n):self._n]]
+
+    def update(self, record: np.void) -> dict:
+        """ JSON-ready trial record with the summaries it changed (its target, its block and the session). """
+        trial = self.describe(record)
+        return {'trial': trial, 'session': self.all.describe(0),
+                'targets': {trial['target']: self.by_target.describe(trial['target'])},
+                'blocks': {trial['block']: self.by_block.describe(trial['block'])}}
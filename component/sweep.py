@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the parameter sweep simulator (a grid of task parameters x a corpus of reach trajectories).
+
+Note:
+    - Every configuration is scored by replaying the corpus through a fresh CenterOut on a virtual clock
+      (see component/replay.py), so the task logic is exactly the one that runs the rig.
+    - Synthetic corpus: a closed-loop SyntheticSubject that reaches for the targets the task presents with
+      minimum-jerk movements, reaction/movement time variability, endpoint scatter (overshoots) and sensor
+      noise. It is seeded per trial, so every configuration sees the same subject (common random numbers).
+    - Recorded corpus: the raw ADC samples of session recordings (.rec) or 't,x,y' text files, replayed as is.
+    - Configurations are spread over a process pool in chunks; inside a worker, trajectories are generated as
+      arrays and ingested a frame at a time (ingest_batch tests every sample of a frame in one call).
+"""
+import asyncio, itertools, math, os, tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .enumerations import TaskState, OutcomeState
+from .recorder import TRANSITION, OUTCOME
+from .replay import Replay, load_samples
+from .schedule import TrialSchedule
+
+
+def grid(axes: dict) -> list:
+    """ Every combination of {parameter: [values]} as a list of {parameter: value}. """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def min_jerk(p0, p1, n: int) -> np.ndarray:
+    """ n points (n x 2) of the minimum-jerk path from p0 to p1 (10 s^3 - 15 s^4 + 6 s^5 profile). """
+    s = np.linspace(0.0, 1.0, n)[:, None]
+    return np.asarray(p0) + (np.asarray(p1) - np.asarray(p0)) * (s ** 3 * (10.0 - 15.0 * s + 6.0 * s * s))
+
+
+class SyntheticSubject(object):
+    """ Closed-loop model subject that performs the center-out task presented by a Replay. """
+
+    def __init__(self, rate: float = 500.0, frame: int = 10, reaction=(0.25, 0.05), movement=(0.35, 0.07),
+                 endpoint_sd: float = 12.0, correction: float = 0.15, noise_sd: float = 0.5, seed: int = 0):
+        '''Constructor for SyntheticSubject object.
+
+        rate (Hz) and frame (samples per ingested frame) model the acquisition client.
+        reaction and movement are (mean, sd) seconds; endpoint_sd (pixels) scatters the end of each reach,
+        reaches that end outside the target are corrected after `correction` seconds. noise_sd is ADC noise (bits).
+        '''
+        self.rate = rate
+        self.frame = frame
+        self.reaction = reaction
+        self.movement = movement
+        self.endpoint_sd = endpoint_sd
+        self.correction = correction
+        self.noise_sd = noise_sd
+        self.seed = seed
+
+    def _to_adc(self, game, xy: np.ndarray, rng) -> tuple:
+        """ Inverse of CenterOut's ADC --> pixel map, plus sensor noise. """
+        p = game.p
+        x = p.adc_left + xy[:, 0] * (p.adc_right - p.adc_left) / game.w
+        y = p.adc_bottom + xy[:, 1] * (p.adc_top - p.adc_bottom) / game.h
+        if self.noise_sd > 0:
+            x, y = x + rng.normal(0.0, self.noise_sd, len(xy)), y + rng.normal(0.0, self.noise_sd, len(xy))
+        return x, y
+
+    async def _emit(self, replay: Replay, rng, path: np.ndarray, until=None) -> np.ndarray:
+        """ Feeds `path` (pixels) frame by frame; stops early once until(state) holds. Returns the last position. """
+        timers = replay.timers
+        x, y = self._to_adc(replay.game, path, rng)
+        dt = 1.0 / self.rate
+        for i in range(0, len(path), self.frame):
+            j = min(i + self.frame, len(path))
+            t = timers.now + dt * np.arange(1, j - i + 1)
+            await replay.feed(t, x[i:j], y[i:j])
+            if until is not None and until(replay.game.state):
+                return path[j - 1]
+        return path[-1]
+
+    async def _hold(self, replay: Replay, rng, at, until, limit: float) -> np.ndarray:
+        return await self._emit(replay, rng, np.repeat(np.asarray(at, dtype=float)[None, :], max(1, int(limit * self.rate)), axis=0), until)
+
+    async def run(self, replay: Replay, trials: int):
+        """ Performs `trials` trials (successful or not). """
+        game = replay.game
+        position = np.array([game.w / 2, game.h / 2])
+        await replay.start(0.0)
+        dt = 1.0 / self.rate
+        while game.n['total'] < trials:
+            rng = np.random.default_rng((self.seed, game.n['total'], game.n['successful']))
+            total = game.n['total']
+            ended = lambda state: game.n['total'] != total
+            t1, t2 = np.array(game._c[0]), np.array(game._c[1])
+            # Reach T1 (if not there) and hold until the go cue
+            if np.hypot(*(position - t1)) > 1.0:
+                n = max(2, int(max(0.1, rng.normal(*self.movement)) * self.rate))
+                position = await self._emit(replay, rng, min_jerk(position, t1, n), ended)
+            hold = game.p.max_t1_hold_1_time + game.p.max_t1_hold_2_time + 1.0
+            position = await self._hold(replay, rng, position, lambda state: state is TaskState.go or ended(state), hold)
+            if ended(None) or game.state is not TaskState.go:
+                continue
+            # React, then reach for T2 with endpoint scatter; correct misses
+            position = await self._hold(replay, rng, position, ended, max(dt, rng.normal(*self.reaction)))
+            if ended(None):
+                continue
+            end = t2 + rng.normal(0.0, self.endpoint_sd, 2)
+            n = max(2, int(max(0.1, rng.normal(*self.movement)) * self.rate))
+            position = await self._emit(replay, rng, min_jerk(position, end, n), ended)
+            if not ended(None) and np.hypot(*(end - t2)) > game._r:
+                position = await self._hold(replay, rng, position, ended, self.correction)
+                n = max(2, int(max(0.1, rng.normal(*self.movement)) / 2 * self.rate))
+                position = await self._emit(replay, rng, min_jerk(position, t2, n), ended)
+            # Stay until the trial ends (reward or failure); re-center if the cursor keeps dithering at the edge
+            hold = game.p.fixed_t2_hold_1_limit + game.p.fixed_reward_delay + self.correction
+            for _ in range(3):
+                position = await self._hold(replay, rng, position, ended, hold)
+                if ended(None) or game.state is TaskState.go or game.state is TaskState.t1_pre:
+                    break
+                n = max(2, int(max(0.1, rng.normal(*self.movement)) / 2 * self.rate))
+                position = await self._emit(replay, rng, min_jerk(position, t2, n), ended)
+            else:
+                position = await self._hold(replay, rng, position, ended, game.p.fixed_move_limit + 1.0)
+        return await replay.finish()
+
+
+def _tally(records: np.ndarray) -> np.ndarray:
+    """ Totals of one replay's records: trials, successes, overshoots, duration, RT sum/count, MT sum/count. """
+    outcomes = records[records['kind'] == OUTCOME]
+    transitions = records[records['kind'] == TRANSITION]
+    state, previous, t = transitions['state'], transitions['a'], transitions['t']
+    react = np.flatnonzero((state == TaskState.move.value) & (previous == TaskState.go.value))
+    reach = np.flatnonzero((state == TaskState.t2_hold_1.value) & (previous == TaskState.move.value))
+    react, reach = react[react > 0], reach[reach > 0]
+    return np.array([len(outcomes), (outcomes['a'] == OutcomeState.success.value).sum(), (state == TaskState.overshoot.value).sum(),
+                     t[-1] - t[0] if len(t) else 0.0, (t[react] - t[react - 1]).sum(), len(react), (t[reach] - t[reach - 1]).sum(), len(reach)], dtype=float)
+
+
+def score(records) -> dict:
+    """ Success rate, overshoots, time per trial and mean reaction/movement times from replay records.
+
+    records is one replay's records, or a list of them (e.g. one per recorded file): each is tallied on its own
+    clock, then the totals are pooled (a session's duration never spans two recordings).
+    """
+    streams = records if isinstance(records, (list, tuple)) else [records]
+    n, successes, overshoots, duration, rt, n_rt, mt, n_mt = np.sum([_tally(r) for r in streams], axis=0)
+    n, overshoots = int(n), int(overshoots)
+    return {
+        'trials': n,
+        'success_rate': float(successes / n) if n else math.nan,
+        'overshoots': overshoots,
+        'overshoots_per_trial': overshoots / n if n else math.nan,
+        'time_per_trial': float(duration / n) if n else math.nan,
+        'reaction_time': float(rt / n_rt) if n_rt else math.nan,
+        'movement_time': float(mt / n_mt) if n_mt else math.nan
+    }
+
+
+_SAMPLES = {} # per worker process: file --> (t, x, y)
+
+
+def evaluate(config: dict, corpus: dict) -> dict:
+    """ Scores one configuration on a corpus: {'synthetic': {subject options}, 'trials': n} or {'recorded': [files]}. """
+    options = dict(targets_file=corpus.get('targets_file', 'config/targets.txt'), params_file=corpus.get('params_file', 'config/params.txt'),
+                   params=config, seed=corpus.get('seed', 0), log_dir=corpus.get('log_dir', tempfile.gettempdir()))
+    if 'recorded' in corpus:
+        records = []
+        for fname in corpus['recorded']:
+            if fname not in _SAMPLES:
+                _SAMPLES[fname] = load_samples(fname)
+            replay = Replay(**options)
+            records.append(asyncio.run(replay.run(*_SAMPLES[fname], batch=corpus.get('frame', 10))))
+        result = score(records)
+    else:
+        replay = Replay(**options)
+        game = replay.game
+        block_trials = (corpus['trials'], 0, 0)
+        game.swap_schedule(TrialSchedule.balanced(int(game.p.n_targets), block_trials, corpus.get('seed', 0)))
+        subject = SyntheticSubject(seed=corpus.get('seed', 0), **corpus.get('synthetic', {}))
+        result = score(asyncio.run(subject.run(replay, corpus['trials'])))
+    return dict(config, **result)
+
+
+def _evaluate_chunk(args) -> list:
+    configs, corpus = args
+    return [evaluate(config, corpus) for config in configs]
+
+
+def sweep(configs: list, corpus: dict, workers: int = None, chunksize: int = 4, progress=None) -> list:
+    """ Scores every configuration on a process pool; results are in the order of `configs`. """
+    chunks = [(configs[i:i + chunksize], corpus) for i in range(0, len(configs), chunksize)]
+    results = []
+    if workers == 1:
+        for chunk in chunks:
+            results.extend(_evaluate_chunk(chunk))
+            if progress is not None:
+                progress(len(results), len(configs))
+        return results
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for out in pool.map(_evaluate_chunk, chunks):
+            results.extend(out)
+            if progress is not None:
+                progress(len(results), len(configs))
+    return results
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the target service (current target and per-target counts, request/reply over a websocket).
+
+Note:
+    - Requests are JSON objects with an "event" and an optional "id"; replies echo the id and go only to the
+      requester, through its queued channel (see component/broadcast.py). A client may keep any number of
+      requests in flight on one connection (pipelining): replies come back in request order.
+        {"event": "get", "id": 1}           --> {"event": "none", "type": "tgt", "tgt": 3, "id": 1}
+        {"event": "set", "tgt": 5, "id": 2} --> {"event": "none", "type": "ack", "tgt": 5, "count": 12, "id": 2}
+        {"event": "stats", "id": 3}         --> {"event": "none", "type": "stats", "count": [...], "total": 96, "id": 3}
+        {"event": "subscribe"}              --> every later get is also pushed to this client as a "tgt" event
+      A set without an id is not acknowledged (as before); errors are replied as {"type": "error", "error": ...}.
+    - Counts are one int64 per target (N Targets) in a memory-mapped file: a set is one store into the mapping,
+      so counts survive restarts (and crashes of the process); a background thread msyncs the file periodically.
+"""
+import json, mmap, os, struct, threading, websockets
+import numpy as np
+from .broadcast import Broadcaster
+
+MAGIC = b'TGTCOUNT'
+HEADER = struct.Struct('<8sI') # magic, number of counters
+HEADER_SIZE = 16
+
+
+class TargetCounts(object):
+    """ Per-target counters in a memory-mapped file (created, or grown to n_targets, on open). """
+
+    def __init__(self, fname: str, n_targets: int, flush_interval: float = 1.0):
+        self.fname = fname
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+        exists = os.path.exists(fname) and os.path.getsize(fname) >= HEADER_SIZE
+        self._f = open(fname, 'r+b' if exists else 'w+b')
+        size = 0
+        if exists:
+            magic, size = HEADER.unpack(self._f.read(HEADER.size))
+            if magic != MAGIC:
+                self._f.close()
+                raise ValueError(f'{fname} is not a target counts file.')
+        size = max(size, n_targets) # keep counters of targets beyond the current N Targets
+        self._f.truncate(HEADER_SIZE + 8 * size)
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        HEADER.pack_into(self._mm, 0, MAGIC, size)
+        self._all = np.frombuffer(self._mm, dtype='<i8', count=size, offset=HEADER_SIZE)
+        self.counts = self._all[:n_targets]
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='target-counts-flusher', daemon=True)
+        self._flusher.start()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def increment(self, target: int) -> int:
+        counts = self.counts
+        counts[target] += 1
+        return int(counts[target])
+
+    def flush(self):
+        with self._lock:
+            if not self._mm.closed:
+                self._mm.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        with self._lock:
+            del self.counts, self._all # release the buffer exports before unmapping
+            self._mm.close()
+            self._f.close()
+
+
+class TargetService(object):
+    """ Current target, per-target counts and subscribers, served as request/reply over websockets. """
+
+    def __init__(self, n_targets: int = 8, counts_file: str = 'data/target_counts.bin', flush_interval: float = 1.0):
+        self.target = 0
+        self.counts = TargetCounts(counts_file, int(n_targets), flush_interval)
+        self._users = Broadcaster()
+        self._subscribers = set()
+
+    def close(self):
+        self.counts.close()
+
+    def request(self, data: dict, websocket=None) -> dict:
+        """ Handles one request; returns the reply (None for un-acknowledged sets and subscriptions). """
+        event = data["event"]
+        if event == "get":
+            reply = {"event": "none", "type": "tgt", "tgt": self.target}
+            if self._subscribers:
+                self._notify(json.dumps(reply), websocket)
+        elif event == "set":
+            target = data["tgt"]
+            if not (isinstance(target, int) and 0 <= target < len(self.counts)):
+                return self._error(data, f"target {target!r} out of range [0, {len(self.counts)})")
+            self.target = target
+            count = self.counts.increment(target)
+            if "id" not in data:
+                return None
+            reply = {"event": "none", "type": "ack", "tgt": target, "count": count}
+        elif event == "stats":
+            reply = {"event": "none", "type": "stats", "count": self.counts.counts.tolist(), "total": int(self.counts.counts.sum())}
+        elif event == "subscribe":
+            self._subscribers.add(websocket)
+            return None
+        else:
+            return self._error(data, f"unsupported event {event!r}")
+        if "id" in data:
+            reply["id"] = data["id"]
+        return reply
+
+    def _error(self, data: dict, error: str) -> dict:
+        reply = {"event": "none", "type": "error", "error": error}
+        if "id" in data:
+            reply["id"] = data["id"]
+        return reply
+
+    def _notify(self, frame: str, requester):
+        for websocket in self._subscribers:
+            if websocket is not requester:
+                self._users.send(websocket, frame)
+
+    async def handler(self, websocket, path):
+        self._users.add(websocket)
+        try:
+            async for message in websocket:
+                try:
+                    reply = self.request(json.loads(message), websocket)
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {"event": "none", "type": "error", "error": f'bad request: {e}'}
+                if reply is not None:
+                    self._users.send(websocket, json.dumps(reply))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._subscribers.discard(websocket)
+            self._users.remove(websocket)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the state timeout scheduler (one-shot timers with planned vs actual firing times).
+
+Note:
+    - Timers run on the event loop's monotonic clock (loop.time()) as plain loop handles: arming is one
+      call_at(), cancelling marks the handle, and no task is created per state entry.
+    - The selector sleeps with millisecond granularity (plus OS timer slack), so timers are armed `lead`
+      seconds early and then yield with call_soon() until their due time. This bounds the lateness of an
+      idle loop to one loop iteration; a busy loop adds its callback latency.
+    - Every firing is kept (planned, actual, label) in a ring of the last `history` timers; summary()
+      reports the drift (actual - planned) distribution per label, e.g. per state.
+"""
+import asyncio, json
+import numpy as np
+
+
+class Timer(object):
+    """ Handle of one armed timer. """
+
+    __slots__ = ('when', 'label', 'callback', 'args', 'fired', '_handle')
+
+    def __init__(self, when: float, label: str, callback, args: tuple):
+        self.when = when
+        self.label = label
+        self.callback = callback
+        self.args = args
+        self.fired = False
+        self._handle = None
+
+    def __repr__(self):
+        return f'Timer({self.label}, when={self.when:.6f}, fired={self.fired})'
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def cancelled(self) -> bool:
+        return self._handle is None and not self.fired
+
+    def done(self) -> bool:
+        return self._handle is None
+
+
+class TimerScheduler(object):
+    """ Arms, cancels and accounts for one-shot timers on the loop's monotonic clock. """
+
+    def __init__(self, loop=None, lead: float = 0.002, history: int = 4096):
+        self._loop = loop
+        self.lead = lead
+        self.history = history
+        self.count = 0 # timers fired so far
+        self._planned = np.zeros(history)
+        self._actual = np.zeros(history)
+        self._label = np.zeros(history, dtype=np.uint8)
+        self._labels = {} # label --> id
+
+    @property
+    def loop(self):
+        return self._loop or asyncio.get_running_loop()
+
+    def time(self) -> float:
+        return self.loop.time()
+
+    def spawn(self, coro):
+        """ Runs a coroutine started by a timer callback (e.g. the timeout's trigger). """
+        return asyncio.ensure_future(coro)
+
+    def call_later(self, delay: float, callback, *args, label: str = '') -> Timer:
+        return self.call_at(self.loop.time() + delay, callback, *args, label=label)
+
+    def call_at(self, when: float, callback, *args, label: str = '') -> Timer:
+        timer = Timer(when, label, callback, args)
+        timer._handle = self.loop.call_at(when - self.lead, self._fire, timer)
+        return timer
+
+    def _fire(self, timer: Timer):
+        loop = self.loop
+        now = loop.time()
+        if now < timer.when: # armed early on purpose: yield to other callbacks until due
+            timer._handle = loop.call_soon(self._fire, timer)
+            return
+        timer._handle = None
+        timer.fired = True
+        i = self.count % self.history
+        self._planned[i] = timer.when
+        self._actual[i] = now
+        self._label[i] = self._labels.setdefault(timer.label, len(self._labels))
+        self.count += 1
+        timer.callback(*timer.args)
+
+    def drift(self, label: str = None) -> np.ndarray:
+        """ Drift (actual - planned firing time, seconds) of the last `history` timers, optionally of one label. """
+        n = min(self.count, self.history)
+        drift = self._actual[:n] - self._planned[:n]
+        if label is not None:
+            drift = drift[self._label[:n] == self._labels.get(label, -1)]
+        return drift
+
+    def summary(self) -> dict:
+        """ {label: {n, mean, p50, p95, p99, max}, 'all': {...}} of the drift in seconds. """
+        out = {label: _describe(self.drift(label)) for label in self._labels}
+        out['all'] = _describe(self.drift())
+        return out
+
+    def save(self, fname: str):
+        with open(fname, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def _describe(drift: np.ndarray) -> dict:
+    if len(drift) == 0:
+        return {'n': 0}
+    p50, p95, p99 = np.percentile(drift, (50, 95, 99))
+    return {'n': len(drift), 'mean': float(drift.mean()), 'p50': float(p50), 'p95': float(p95),
+            'p99': float(p99), 'max': float(drift.max())}
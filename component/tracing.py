@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Module containing the end-to-end latency tracer (rolling histograms per stage and per client).
+
+Note:
+    Stages, in pipeline order:
+    - 'serial': serial line read in the acquisition client --> frame receipt on the server (wall clock, batch frames only;
+                only traced for clients on the server's host, as clocks of different hosts are not synchronized)
+    - 'ingest': frame receipt --> check_state completed for every sample of the frame
+    - 'send':   frame queued for a display client --> handed to its websocket (per display client)
+    - 'ack':    trace probe queued --> acknowledgment sent by the display after rendering (per display client)
+    Histograms are kept per connected client; forget(client) merges a closed connection's histograms into its
+    stage's 'closed' histogram, so reconnecting clients do not add histograms (they age out with the windows).
+"""
+import ipaddress, json, time
+from bisect import bisect_left
+import numpy as np
+
+STAGES = ('serial', 'ingest', 'send', 'ack')
+CLOSED = 'closed' # client label of the merged histograms of closed connections
+EDGES = np.geomspace(1e-5, 10.0, 121) # Bin edges in seconds (~6% wide bins from 10 us to 10 s)
+_EDGES = EDGES.tolist()
+
+
+def client_label(websocket) -> str:
+    """ Identifies a connection by its remote address. """
+    address = getattr(websocket, 'remote_address', None)
+    return f'{address[0]}:{address[1]}' if address else str(id(websocket))
+
+
+def same_host(websocket) -> bool:
+    """ Whether a connection comes from the server's own host (its wall clock is the server's). """
+    remote, local = getattr(websocket, 'remote_address', None), getattr(websocket, 'local_address', None)
+    if not remote:
+        return False
+    try:
+        return ipaddress.ip_address(remote[0]).is_loopback or (local is not None and remote[0] == local[0])
+    except ValueError:
+        return False
+
+
+class LatencyHistogram(object):
+    """ Log-binned histogram over the current and the previous window. """
+
+    def __init__(self):
+        self._counts = np.zeros((2, len(EDGES) + 1), dtype=np.int64)
+        self._current = 0
+
+    def add(self, dt: float):
+        self._counts[self._current, bisect_left(_EDGES, dt)] += 1
+
+    def add_many(self, dts: np.ndarray):
+        self._counts[self._current] += np.bincount(np.searchsorted(EDGES, dts), minlength=len(EDGES) + 1)
+
+    def rotate(self):
+        """ Starts a new window; the oldest window is forgotten. """
+        self._current ^= 1
+        self._counts[self._current] = 0
+
+    def merge(self, other: 'LatencyHistogram'):
+        """ Adds the counts of another histogram, window by window. """
+        self._counts[self._current] += other._counts[other._current]
+        self._counts[self._current ^ 1] += other._counts[other._current ^ 1]
+
+    def counts(self) -> np.ndarray:
+        return self._counts.sum(axis=0)
+
+
+def percentiles(counts: np.ndarray, qs=(50, 95, 99)) -> dict:
+    """ Percentiles (seconds, bin upper edge) of a histogram given as counts per bin. """
+    n = int(counts.sum())
+    out = {'n': n}
+    if n == 0:
+        return out
+    cumulative = np.cumsum(counts)
+    upper = np.append(EDGES, np.inf)
+    for q in qs:
+        out[f'p{q}'] = float(upper[np.searchsorted(cumulative, q / 100 * n)])
+    return out
+
+
+class LatencyTracer(object):
+    """ Rolling latency histograms keyed by (stage, client), plus bookkeeping for display trace probes. """
+
+    def __init__(self, max_probes: int = 64):
+        self._hists = {}
+        self._probes = {} # probe id --> perf_counter() when it was queued
+        self._next_probe = 0
+        self.max_probes = max_probes
+
+    def histogram(self, stage: str, client: str) -> LatencyHistogram:
+        hist = self._hists.get((stage, client))
+        if hist is None:
+            hist = self._hists[(stage, client)] = LatencyHistogram()
+        return hist
+
+    def record(self, stage: str, client: str, dt: float):
+        self.histogram(stage, client).add(dt)
+
+    def record_many(self, stage: str, client: str, dts: np.ndarray):
+        self.histogram(stage, client).add_many(dts)
+
+    def rotate(self):
+        for hist in self._hists.values():
+            hist.rotate()
+
+    def forget(self, client: str):
+        """ Merges the histograms of a closed connection into the CLOSED histogram of their stages. """
+        for key in [key for key in self._hists if key[1] == client]:
+            self.histogram(key[0], CLOSED).merge(self._hists.pop(key))
+
+    def probe(self) -> int:
+        """ Returns the id of a new trace probe and remembers when it was issued. """
+        probe = self._next_probe
+        self._next_probe += 1
+        self._probes[probe] = time.perf_counter()
+        if len(self._probes) > self.max_probes:
+            del self._probes[next(iter(self._probes))]
+        return probe
+
+    def ack(self, client: str, probe: int):
+        t = self._probes.get(probe)
+        if t is not None:
+            self.record('ack', client, time.perf_counter() - t)
+
+    def summary(self) -> dict:
+        """ {stage: {client: {n, p50, p95, p99}, 'all': {...}}} over the last two windows. """
+        out = {}
+        for (stage, client), hist in self._hists.items():
+            out.setdefault(stage, {})[client] = hist.counts()
+        for stage, clients in out.items():
+            total = sum(clients.values())
+            for client, counts in clients.items():
+                clients[client] = percentiles(counts)
+            clients['all'] = percentiles(total)
+        return out
+
+    def save(self, fname: str):
+        with open(fname, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
@@ -6,12 +6,20 @@ address = {
     'cursor': '128.2.244.29',  # Max 115L desktop
     'target': '128.2.244.29', 
     'demo': '128.2.244.29',
-    'touchscreen': '128.2.244.29'
+    'touchscreen': '128.2.244.29',
+    'metrics': '127.0.0.1'  # Prometheus text at http://<metrics>:<port>/metrics (local only)
 }
 
 port = {
     'cursor': 6789,
     'target': 6788,
     'demo': 6800,
-    'touchscreen': 6800
+    'touchscreen': 6800,
+    'metrics': 9108
+}
+
+# Shared-memory cursor ring of the cursor server, for acquisition on the same machine (POSIX only; None: disabled):
+#   set 'cursor': 'centerout_cursor', then python wrist_task_cursor_client.py <device> shm://centerout_cursor
+shm = {
+    'cursor': None
 }
\ No newline at end of file
@@ -1,23 +1,30 @@
 #!/usr/bin/env python
 
-# WS client example
+# WS client example: drives the demo server's counter and touch position from the keyboard
 
-import asyncio
-import websockets
+from component.client import PersistentClient
 from config import address, port
+import json
 
-IP = address['demo_server']
+IP = address['demo']
 PORT = port['demo']
 
-async def hello():
-    uri = f"ws://{IP}:{PORT}"
-    async with websockets.connect(uri) as websocket:
-        name = input("What's your name? ")
-
-        await websocket.send(name)
-        print(f"> {name}")
-
-        greeting = await websocket.recv()
-        print(f"< {greeting}")
-
-asyncio.get_event_loop().run_until_complete(hello())
\ No newline at end of file
+if __name__ == "__main__":
+    # Received state/users/touch events are printed from the client thread as they arrive.
+    with PersistentClient(f"ws://{IP}:{PORT}", on_message=lambda message: print(f"< {message}")) as client:
+        print("Commands: '+' or '-' (counter), '<x> <y>' (touch), empty line to quit.")
+        while True:
+            line = input().strip()
+            if not line:
+                break
+            if line in ('+', '-'):
+                data = {'event': 'plus' if line == '+' else 'minus'}
+            else:
+                try:
+                    x, y = (int(v) for v in line.split())
+                except ValueError:
+                    print(f"? {line}")
+                    continue
+                data = {'event': 'click', 'x': x, 'y': y}
+            client.send(json.dumps(data))
+            print(f"> {data}")
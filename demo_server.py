@@ -6,6 +6,7 @@ import asyncio
 import json
 import logging
 import websockets
+from component.broadcast import Broadcaster
 from config import address, port
 
 logging.basicConfig()
@@ -15,7 +16,7 @@ STATE = {"value": 0,
          "x": 0, 
          "y": 0}
 
-USERS = set()
+USERS = Broadcaster()
 IP = address['demo']
 PORT = port['demo']
 
@@ -29,19 +30,16 @@ def touch_event():
     return json.dumps({"event": "none", "type": "touch", "x": STATE["x"], "y": STATE["y"]})
 
 async def notify_state():
-    if USERS:  # asyncio.wait doesn't accept an empty list
-        message = state_event()
-        await asyncio.wait([user.send(message) for user in USERS])
+    if USERS:
+        USERS.publish(state_event(), 'state')
 
 async def notify_users():
-    if USERS:  # asyncio.wait doesn't accept an empty list
-        message = users_event()
-        await asyncio.wait([user.send(message) for user in USERS])
+    if USERS:
+        USERS.publish(users_event(), 'users')
 
 async def notify_touch():
     if USERS:
-        message = touch_event()
-        await asyncio.wait([user.send(message) for user in USERS])
+        USERS.publish(touch_event(), 'cursor')
 
 async def register(websocket):
     USERS.add(websocket)
@@ -76,7 +74,7 @@ async def packet_handler(websocket, path):
         await unregister(websocket)
 
 
-server = websockets.serve(packet_handler, IP, PORT)
-
-asyncio.get_event_loop().run_until_complete(server)
-asyncio.get_event_loop().run_forever()
\ No newline at end of file
+if __name__ == "__main__":
+    server = websockets.serve(packet_handler, IP, PORT)
+    asyncio.get_event_loop().run_until_complete(server)
+    asyncio.get_event_loop().run_forever()
@@ -1,6 +1,7 @@
 """
 1. Using PyQt5, make an application UI that is a black canvas. 
-2. Using asyncio and websockets, report the touch events to a websocket server at an arbitrary combination of IP address and port number.
+2. Report the touch events to a websocket server at an arbitrary combination of IP address and port number,
+   over one persistent connection (component/client.py) so the GUI thread never waits on the network.
 """
 
 import sys
@@ -8,9 +9,8 @@ from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QLineEdit, QVBoxLayou
 from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.QtCore import Qt, QSize
 from PyQt5.QtCore import QThread, pyqtSignal
-import asyncio
-import websockets
 import json
+from component.client import PersistentClient
 from config import address, port
 
 IP = address['touchscreen']
@@ -22,6 +22,7 @@ class MyWindow(QMainWindow):
         self.setGeometry(200, 200, 600, 400)
         self.setWindowTitle("MyWindow")
         self.setWindowIcon(QIcon('icon.png'))
+        self.client = PersistentClient(f"ws://{IP}:{PORT}").start()
         self.initUI()
 
     def initUI(self):
@@ -34,18 +35,17 @@ class MyWindow(QMainWindow):
         self.show()
 
     def mousePressEvent(self, event):
-        print("Mouse pressed")
-        self.statusBar().showMessage('Mouse pressed')
+        # Queued for the client thread; the demo server handles touches as 'click' events.
+        if self.client.send(json.dumps({'event': 'click', 'x': event.x(), 'y': event.y()})):
+            self.statusBar().showMessage(f"Data sent: [touch <{event.x()}, {event.y()}>]")
+        else:
+            self.statusBar().showMessage('Touch dropped: send queue full')
         self.update()
-        asyncio.get_event_loop().run_until_complete(self.send_event(event))
 
-    async def send_event(self, event):
-        print("Sending event")
-        async with websockets.connect(f"ws://{IP}:{PORT}") as websocket:
-            await websocket.send(json.dumps({'event': 'touch', 'x': event.x(), 'y': event.y()}))
-            self.statusBar().showMessage(f"Data sent: [touch <{event.x()}, {event.y()}>]")
-            self.update()
-        
+    def closeEvent(self, event):
+        self.client.close()
+        super(MyWindow, self).closeEvent(event)
+
 
 def main():
     app = QApplication(sys.argv)
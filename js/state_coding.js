@@ -24,6 +24,13 @@ const pars = {
     Top: 0        // Top-range value from microcontroller.
   }
 };
+// Encoding of cursor/state frames, negotiated as the center-out.<encoding> subprotocol: 'delta' (binary keyframes on
+// state changes, positions in between), 'binary' (every frame a keyframe) or 'json' (text frames).
+const displayEncoding = 'delta'; // see component/protocol.py
+const FRAME_DISPLAY = 0x10;
+const FRAME_POSITION = 0x11;
+const STATE_NAMES = ["idle", "t1_pre", "t1_hold_1", "t1_hold_2", "go", "move", "t2_hold_1", "overshoot", "reward"];
+const DIRECTION_NAMES = ["out", "in"];
 const HOLD_PERIOD = 1000;
 const TARGET_PERIOD = 500;
 
@@ -698,11 +705,87 @@ const event_data = {
     y: BoxWidth 
 };
 
-const ws_xy = new WebSocket(`ws://${address.cursor}:${port.cursor}/`);
+// The first message of a connection is a 'snapshot' (full state and a resume token). After a dropped connection,
+// reconnecting with the token and the number of messages received lets the server replay only the missed frames
+// (see component/broadcast.py); it sends a new snapshot instead when it cannot.
+let ws_xy = null;
+let resumeToken = null;
+let received = 0; // messages received on the current connection
+function connectDisplay() {
+    const query = resumeToken === null ? '' : `?resume=${resumeToken}&received=${received}`;
+    ws_xy = new WebSocket(`ws://${address.cursor}:${port.cursor}/${query}`, [`center-out.${displayEncoding}`]);
+    ws_xy.binaryType = "arraybuffer";
+    received = 0;
+    ws_xy.onopen = function () {
+        if (ws_xy.protocol === '' && displayEncoding !== 'json') { // server without subprotocols: ask for it instead
+            ws_xy.send(JSON.stringify({event: 'encoding', encoding: displayEncoding}));
+        }
+    };
+    ws_xy.onmessage = onDisplayMessage;
+    ws_xy.onclose = function () {
+        setTimeout(connectDisplay, 500);
+    };
+}
+
+// Decodes an outbound display frame: <u8 code, i16 x, i16 y, u8 target, u8 state, u8 direction>
+// or a position frame <u8 code, i16 x, i16 y>, which keeps the target/state/direction of the last display frame.
+let keyframe = {type: 'none'};
+let sessionStats = null; // latest 'stats' packet
+function decodeFrame(buffer) {
+    let view = new DataView(buffer);
+    switch (view.getUint8(0)) {
+        case FRAME_DISPLAY:
+            keyframe = {
+                type: 'cursor',
+                x: view.getInt16(1, true),
+                y: view.getInt16(3, true),
+                target: view.getUint8(5),
+                state: STATE_NAMES[view.getUint8(6)],
+                direction: DIRECTION_NAMES[view.getUint8(7)]
+            };
+            return keyframe;
+        case FRAME_POSITION:
+            return Object.assign({}, keyframe, {x: view.getInt16(1, true), y: view.getInt16(3, true)});
+        default:
+            return {type: 'none'};
+    }
+}
+
+function applyCursor(packet) {
+    if (state.running) {
+        state.taskState = packet.state;
+        state.direction = packet.direction;
+        state.target = packet.target;
+        // console.log(packet);
+        handleState(state.taskState, {x: packet.x, y: packet.y});
+    }
+}
 
-ws_xy.onmessage = function (event) {
-    let packet = JSON.parse(event.data);
+function applyParams(params) {
+    for (const key in params) {
+        if (key === 'event' || key === 'type') continue;
+        if (key.startsWith('ADC')) {
+            pars.ADC[key.slice(3)] = params[key];
+        } else {
+            pars[key] = params[key];
+        }
+    }
+    if ('Alpha' in params) pars.Beta = 1 - pars.Alpha;
+    if ('TargetRingRadius' in params) initPositions(BoxWidth, BoxHeight);
+}
+
+function onDisplayMessage(event) {
+    received++;
+    let packet = (event.data instanceof ArrayBuffer) ? decodeFrame(event.data) : JSON.parse(event.data);
     switch (packet.type) {
+        case 'snapshot': // on connect: params, score, recent trials, stats, cursor/state and users at once
+            resumeToken = packet.token;
+            applyParams(packet.params);
+            sessionStats = packet.stats;
+            keyframe = Object.assign({type: 'cursor'}, packet.cursor); // base of the 'delta' position frames
+            users.textContent = packet.users.toString() + " client" + (packet.users == 1 ? "" : "s");
+            applyCursor(packet.cursor);
+            break;
         case 'users':
             users.textContent = (
             packet.count.toString() + " client" +
@@ -712,14 +795,18 @@ ws_xy.onmessage = function (event) {
             handleState(state.taskState, data);
             break;
         case 'cursor':
-          if (state.running) {
-            state.taskState = packet.state;
-            state.direction = packet.direction;
-            state.target = packet.target;
-            // console.log(packet);
-            handleState(state.taskState, {x: packet.x, y: packet.y});
-          }
-            
+            applyCursor(packet);
+            break;
+        case 'trace':
+            // Acknowledge once the next frame has been rendered (see component/tracing.py).
+            requestAnimationFrame(() => ws_xy.send(JSON.stringify({event: 'ack', id: packet.id})));
+            break;
+        case 'latency':
+            console.log(packet.stages);
+            break;
+        case 'stats': // after every trial: that trial and the summaries it updated (see component/stats.py)
+            sessionStats = packet;
+            console.log(packet.session);
             break;
         case 'tgt': 
             // console.log(packet);
@@ -730,10 +817,13 @@ ws_xy.onmessage = function (event) {
             break;
         case 'none':
             break;
-        case 'params':
+        case 'params': // only the parameters that changed (the full set comes with the snapshot)
+            applyParams(packet);
             break;
         default:
             console.error("unsupported event", data);
             break;
       }
   };
+
+connectDisplay();
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# Re-scores a recorded session (data/*.rec, or a 't,x,y' text file) under the given params, faster than real time.
+#   python replay_session.py data/Spencer_20240101_120000.rec --set "Target Size=30" --set "Fixed MOVE Limit=1.0"
+from component.replay import Replay, load_samples
+import argparse, asyncio, json
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Deterministic CenterOut replay.')
+    parser.add_argument('samples', help='session recording (.rec) or text file with t,x,y lines')
+    parser.add_argument('--targets', default='config/targets.txt')
+    parser.add_argument('--params', default='config/params.txt')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='override a parameter')
+    parser.add_argument('--engine', default='compiled', choices=['transitions', 'compiled'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch', type=int, default=1, help='samples per ingested frame')
+    args = parser.parse_args()
+
+    overrides = dict(item.split('=', 1) for item in args.set)
+    replay = Replay(args.targets, args.params, overrides, args.engine, args.seed)
+    asyncio.run(replay.run(*load_samples(args.samples), batch=args.batch))
+    print(json.dumps(dict(replay.summary(), digest=replay.digest()), indent=2))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# Serves many CenterOut sessions (one per rig) on the cursor address/port: ws://<address>:<port>/session/<id>
+# Without --workers, every session runs in this process; with --workers N, sessions are pinned to N worker processes.
+from component.host import SessionHost, ShardedHost
+from component.logs import configure_logging
+from component.metrics import start_metrics
+from config import address, port
+import argparse, asyncio, os
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Multi-rig CenterOut session host.')
+    parser.add_argument('--targets', default='config/targets.txt', help='default targets file for new sessions')
+    parser.add_argument('--params', default='config/params.txt', help='default params file for new sessions')
+    parser.add_argument('--engine', default='transitions', choices=['transitions', 'compiled'])
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (0: serve sessions in this process)')
+    parser.add_argument('--autocreate', action='store_true', help="create unknown sessions on first connection (default: only '/host' creates them)")
+    parser.add_argument('--idle-timeout', type=float, default=300.0, help='destroy autocreated sessions after this long without connections (s)')
+    parser.add_argument('--metrics-port', type=int, default=port['metrics'], help='Prometheus endpoint (workers: port+1+i; 0 disables)')
+    parser.add_argument('--redirect', action='store_true', help='workers: redirect session connections instead of relaying them (not for browsers)')
+    parser.add_argument('--control-token', default=os.environ.get('CENTEROUT_CONTROL_TOKEN'),
+                        help="lets '/host?token=<token>' clients on other machines create/destroy sessions (default: localhost only)")
+    args = parser.parse_args()
+
+    options = dict(targets_file=args.targets, params_file=args.params, engine=args.engine, autocreate=args.autocreate, idle_timeout=args.idle_timeout)
+    metrics = (address['metrics'], args.metrics_port) if args.metrics_port else None
+    if args.workers > 0:
+        host = ShardedHost(address['cursor'], port['cursor'], args.workers, metrics, args.redirect, args.control_token, **options).start()
+        server = host.serve()
+    else: # workers configure their own logging (see component/host.py)
+        configure_logging('logs', 'center_out')
+        host = SessionHost(control_token=args.control_token, **options)
+        server = host.serve(address['cursor'], port['cursor'])
+        if metrics is not None:
+            asyncio.get_event_loop().run_until_complete(start_metrics([host.collect_metrics], *metrics))
+
+    asyncio.get_event_loop().run_until_complete(server)
+    asyncio.get_event_loop().run_forever()
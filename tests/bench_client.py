@@ -0,0 +1,78 @@
+"""
+Cost of sending events to a websocket server: a new connection per event (the old demo/target clients) against
+one PersistentClient (component/client.py).
+
+A local echo server acknowledges every message; reports the caller's time per send() and the time until all
+events have been acknowledged.
+
+    python tests/bench_client.py --events 500
+"""
+import argparse, asyncio, os, sys, threading, time
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+import websockets
+from component.client import PersistentClient
+
+
+async def echo(websocket, path):
+    async for message in websocket:
+        await websocket.send(message)
+
+
+def serve(port: int):
+    """ Runs the echo server on its own loop thread. """
+    ready = threading.Event()
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(websockets.serve(echo, '127.0.0.1', port))
+        ready.set()
+        loop.run_forever()
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+
+
+def per_event(uri: str, n: int) -> tuple:
+    async def send(message):
+        async with websockets.connect(uri) as websocket:
+            await websocket.send(message)
+            await websocket.recv()
+    loop = asyncio.new_event_loop()
+    t0 = time.perf_counter()
+    for i in range(n):
+        loop.run_until_complete(send(str(i)))
+    elapsed = time.perf_counter() - t0
+    return elapsed / n, elapsed
+
+
+def persistent(uri: str, n: int) -> tuple:
+    done = threading.Event()
+    acks = []
+    def on_message(message):
+        acks.append(message)
+        if len(acks) == n:
+            done.set()
+    with PersistentClient(uri, maxsize=n, on_message=on_message) as client:
+        client.connected.wait()
+        t0 = time.perf_counter()
+        for i in range(n):
+            client.send(str(i))
+        per_send = (time.perf_counter() - t0) / n
+        done.wait()
+        return per_send, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Connection-per-event vs persistent websocket client.')
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--port', type=int, default=8790)
+    args = parser.parse_args()
+
+    serve(args.port)
+    uri = f'ws://127.0.0.1:{args.port}'
+    print(f'{args.events} events to {uri}')
+    print(f'{"client":>12s} {"us/send":>10s} {"all acked (ms)":>15s}')
+    for name, run in (('per-event', per_event), ('persistent', persistent)):
+        per_send, total = run(uri, args.events)
+        print(f'{name:>12s} {per_send * 1e6:10.1f} {total * 1e3:15.1f}')
@@ -0,0 +1,76 @@
+"""
+CPU cost and group delay of the cursor filter stages (component/filters.py).
+
+Every stage runs after the calibration map on a synthetic ADC stream (slow sine plus noise) at the params
+file's 'Sample Rate', in frames of F samples. Reports each stage's CPU time per sample and its group delay,
+both measured (phase lag of the output against the noiseless input at the test frequency) and as the stage
+reports it (Pipeline.group_delay(), used by the metrics endpoint). Display stages (the extrapolator) are
+measured on the drawn cursor (Pipeline.led), since they do not change the task position. The one-euro filter reports its delay at
+rest, its largest; while moving, its cutoff rises and the measured delay is shorter.
+
+    python tests/bench_filters.py --frame 10
+    python tests/bench_filters.py --frame 1 --set "Extrapolation Horizon=0.03"
+"""
+import argparse, os, sys
+import numpy as np
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+from component.filters import Pipeline, STAGES
+from component.params import ParamsLoader, TaskParams
+
+W, H = 1200, 800 # canvas (see CenterOut)
+
+
+def stream(p: TaskParams, seconds: float, frequency: float, noise: float, seed: int = 0):
+    """ Sample times and raw ADC x, y tracing a circle at `frequency` Hz, with the noiseless cursor path. """
+    t = np.arange(int(seconds * p.sample_rate)) / p.sample_rate
+    phase = 2 * np.pi * frequency * t
+    cx, cy = W / 2 + 200 * np.cos(phase), H / 2 + 200 * np.sin(phase)
+    noisy = np.random.default_rng(seed).normal(0, noise, (2, len(t))) + (cx, cy)
+    xs = p.adc_left + noisy[0] * (p.adc_right - p.adc_left) / W
+    ys = p.adc_bottom + noisy[1] * (p.adc_top - p.adc_bottom) / H
+    return t, xs, ys, cx
+
+
+def lag(t: np.ndarray, x: np.ndarray, reference: np.ndarray, frequency: float) -> float:
+    """ Phase lag (s) of x behind reference at `frequency` (least-squares fit of both, after the first half). """
+    half = len(t) // 2
+    basis = np.stack([np.cos(2 * np.pi * frequency * t[half:]), np.sin(2 * np.pi * frequency * t[half:]), np.ones(len(t) - half)], axis=1)
+    (ax, bx, _), (ar, br, _) = (np.linalg.lstsq(basis, v[half:], rcond=None)[0] for v in (x, reference))
+    dphi = (np.arctan2(bx, ax) - np.arctan2(br, ar) + np.pi) % (2 * np.pi) - np.pi
+    return dphi / (2 * np.pi * frequency)
+
+
+def run(name: str, p: TaskParams, frame: int, t, xs, ys, reference, frequency) -> dict:
+    pipeline = Pipeline(() if name == 'calibration' else (name,), p, W, H)
+    fx0, fy0 = pipeline.stages[0].step(xs[0], ys[0], t[0])
+    pipeline.reset(fx0, fy0)
+    out = np.empty(len(t))
+    for i in range(0, len(t), frame):
+        fx, _ = pipeline.process(xs[i:i + frame], ys[i:i + frame], t[i:i + frame])
+        out[i:i + frame] = pipeline.led[0] if pipeline.stages[-1].display else fx
+    return {'cost': pipeline.cost()[name], 'measured': lag(t, out, reference, frequency), 'reported': pipeline.group_delay()[name],
+            'rms': float(np.sqrt(np.mean((out - reference)[len(t) // 2:] ** 2)))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CPU cost and group delay of each cursor filter stage.')
+    parser.add_argument('--params', default=os.path.join(ROOT, 'config', 'params.txt'))
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='override a parameter')
+    parser.add_argument('--frame', type=int, default=10, help='samples per frame')
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--frequency', type=float, default=0.5, help='test movement frequency (Hz)')
+    parser.add_argument('--noise', type=float, default=2.0, help='input noise SD (pixels)')
+    args = parser.parse_args()
+
+    p = TaskParams(ParamsLoader().load(args.params))
+    if p.extrapolation_horizon == 0:
+        p['Extrapolation Horizon'] = 0.03 # otherwise the extrapolator is a no-op
+    p.update(dict(item.split('=', 1) for item in args.set))
+    t, xs, ys, reference = stream(p, args.seconds, args.frequency, args.noise)
+    print(f'{len(t)} samples at {p.sample_rate:g} Hz in frames of {args.frame}; {args.frequency:g} Hz movement, noise SD {args.noise:g} px')
+    print(f'{"stage":>12s} {"us/sample":>10s} {"delay (ms)":>11s} {"reported":>9s} {"rms (px)":>9s}')
+    for name in ('calibration',) + tuple(STAGES):
+        r = run(name, p, args.frame, t, xs, ys, reference, args.frequency)
+        print(f'{name:>12s} {r["cost"] * 1e6:10.2f} {r["measured"] * 1e3:11.2f} {r["reported"] * 1e3:9.2f} {r["rms"]:9.2f}')
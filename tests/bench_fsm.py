@@ -0,0 +1,26 @@
+import asyncio, os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from component import CenterOut
+
+# One successful trial with an early release and an overshoot, then one failed trial.
+CYCLE = ['enter_t1', 'leave_t1', 'enter_t1', 'instruct', 'cue', 'react', 'enter_t2', 'overshoot', 'enter_t2', 'succeed', 'advance',
+         'enter_t1', 'instruct', 'fail']
+
+
+async def run(engine: str, n: int, targets_file: str, params_file: str) -> float:
+    game = CenterOut(targets_file=targets_file, params_file=params_file, engine=engine)
+    await game.start()
+    triggers = [getattr(game, name) for name in CYCLE]
+    t0 = time.perf_counter()
+    for _ in range(n):
+        for trigger in triggers:
+            await trigger()
+    return n * len(CYCLE) / (time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config')
+    for engine in ('transitions', 'compiled'):
+        rate = asyncio.run(run(engine, n, os.path.join(root, 'targets.txt'), os.path.join(root, 'params.txt')))
+        print(f'{engine:>12s}: {rate:12,.0f} transitions/s')
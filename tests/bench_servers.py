@@ -0,0 +1,301 @@
+"""
+Load and latency benchmark for the websocket servers.
+
+Starts one server (cursor = CenterOut, demo, target) on localhost in a subprocess, drives it with N synthetic
+publishers at a fixed rate, attaches M passive display clients (S of them slow) and reports inbound throughput,
+fan-out latency, server event-loop lag and server CPU per sample. With --serial, publisher 0 is the real
+wrist_task_cursor_client reading from a pty-based fake serial device instead of a synthetic publisher.
+
+    python tests/bench_servers.py cursor --publishers 1 --rate 500 --displays 4 --slow 1 --duration 10
+    python tests/bench_servers.py cursor --serial --compare <results>/cursor_<previous>.json
+    python tests/bench_servers.py cursor --encoding delta --deflate --rate 1000 --displays 8
+    python tests/bench_servers.py cursor --shm --batch 5    # publisher 0 writes into the shared-memory ring
+
+Displays negotiate --encoding through the websocket subprotocol (and permessage-deflate with --deflate); the bytes
+they receive on the wire are reported per display.
+
+Results are written as JSON to --results (default: <tmp>/centerout_bench) so that runs can be compared (--compare
+flags regressions). The server records into a temporary data directory (removed on exit) and nothing is written
+under the repository.
+"""
+import argparse, asyncio, json, os, shutil, subprocess, sys, tempfile, threading, time
+import numpy as np
+import websockets
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+from component import protocol
+
+RESULTS = os.path.join(tempfile.gettempdir(), 'centerout_bench')
+
+
+def summarize(values) -> dict:
+    if len(values) == 0:
+        return {'n': 0}
+    v = np.asarray(values)
+    return {'n': len(v), 'p50': float(np.percentile(v, 50)), 'p95': float(np.percentile(v, 95)),
+            'p99': float(np.percentile(v, 99)), 'max': float(v.max())}
+
+
+def process_cpu(pid: int) -> float:
+    """ User + system CPU seconds of a process (Linux /proc). """
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+# * * * Server side (runs in the subprocess) * * * #
+def serve(kind: str, port: int, engine: str, result: str, shm: str = None):
+    """ Serves `kind` on localhost:port (and the ring `shm`) until stdin closes, then writes loop lag statistics as JSON to `result`. """
+    os.chdir(ROOT)
+    scratch = tempfile.mkdtemp() # recordings (params.txt may set 'Save Data'), logs, target counts
+    async def main():
+        ring = game = None
+        if kind == 'cursor':
+            from component import CenterOut
+            game = CenterOut(targets_file='config/targets.txt', params_file='config/params.txt', engine=engine,
+                             data_dir=scratch, log_dir=scratch, trace_interval=0.1)
+            handler = game.cursor_and_task_state_messages
+            if shm:
+                from component.shm import RingConsumer
+                ring = RingConsumer(shm)
+                consumer = asyncio.ensure_future(ring.serve(game))
+        elif kind == 'demo':
+            import demo_server
+            handler = demo_server.packet_handler
+        else:
+            from component.targets import TargetService
+            service = TargetService(8, os.path.join(scratch, 'target_counts.bin'))
+            handler = service.handler
+        loop = asyncio.get_running_loop()
+        done = asyncio.Event()
+        threading.Thread(target=lambda: (sys.stdin.read(), loop.call_soon_threadsafe(done.set)), daemon=True).start()
+        lag = []
+        options = protocol.serve_options() if kind == 'cursor' else {}
+        async with websockets.serve(handler, 'localhost', port, **options):
+            print('ready', flush=True)
+            while not done.is_set():
+                t = loop.time()
+                await asyncio.sleep(0.005)
+                lag.append(loop.time() - t - 0.005)
+        if ring is not None:
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+            ring.close()
+        if game is not None:
+            await game.shutdown() # closes a recording left open
+        with open(result, 'w') as f:
+            json.dump({'loop_lag': summarize(lag)}, f)
+    try:
+        asyncio.run(main())
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+# * * * Client side (runs in the harness) * * * #
+class CountingProtocol(websockets.WebSocketClientProtocol):
+    """ Client protocol that counts the bytes received on the wire (after compression, with framing). """
+
+    received = 0
+
+    def data_received(self, data: bytes):
+        self.received += len(data)
+        super().data_received(data)
+
+
+class Bench(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.uri = f'ws://localhost:{args.port}'
+        self.sent = 0
+        self.sent_at = {} # (publisher, seq) --> perf_counter(), for demo touch events
+        self.fanout = {False: [], True: []} # by display slowness
+        self.rtt = []
+        self.frames = []
+        self.stages = None
+        self.running = True
+        self.elapsed = 0.0
+
+    async def publisher(self, i: int):
+        a = self.args
+        period = a.batch / a.rate
+        ring = None
+        if a.shm and i == 0:
+            from component.shm import RingWriter
+            ring = RingWriter(a.shm)
+        options = {'subprotocols': [protocol.SOURCE]} if a.kind == 'cursor' else {}
+        async with websockets.connect(self.uri, **options) as ws:
+            if a.kind == 'cursor' and i == 0:
+                await ws.send(json.dumps({'event': 'start'}))
+            loop = asyncio.get_running_loop()
+            deadline, seq = loop.time(), 0
+            while self.running:
+                if a.kind == 'cursor':
+                    now = time.time()
+                    samples = [(now - (a.batch - k - 1) / a.rate, 340 + (seq + k) % 50, 347) for k in range(a.batch)]
+                    if ring is not None:
+                        ring.write(*zip(*samples))
+                    else:
+                        await ws.send(protocol.encode_cursor_batch(samples) if a.batch > 1 else protocol.encode_cursor(*samples[0][1:]))
+                elif a.kind == 'demo':
+                    self.sent_at[(i, seq)] = time.perf_counter()
+                    await ws.send(json.dumps({'event': 'click', 'x': seq, 'y': i}))
+                else:
+                    t = time.perf_counter()
+                    await ws.send(json.dumps({'event': 'set', 'tgt': seq % 8}))
+                    await ws.send(json.dumps({'event': 'get'}))
+                    while json.loads(await ws.recv()).get('type') != 'tgt':
+                        pass
+                    self.rtt.append(time.perf_counter() - t)
+                self.sent += a.batch
+                seq += a.batch
+                deadline += period
+                await asyncio.sleep(max(0.0, deadline - loop.time()))
+            if a.kind == 'cursor' and i == 0:
+                await ws.send(json.dumps({'event': 'stop'})) # closes the session's recording
+
+    async def display(self, i: int, slow: bool):
+        a = self.args
+        frames = 0
+        options = {'create_protocol': CountingProtocol, 'compression': 'deflate' if a.deflate else None}
+        if a.kind == 'cursor':
+            options['subprotocols'] = [f'center-out.{a.encoding}']
+        async with websockets.connect(self.uri, **options) as ws:
+            try:
+                while self.running:
+                    message = await asyncio.wait_for(ws.recv(), 0.5)
+                    frames += 1
+                    if isinstance(message, str):
+                        packet = json.loads(message)
+                        if packet.get('type') == 'trace':
+                            await ws.send(json.dumps({'event': 'ack', 'id': packet['id']}))
+                        elif packet.get('type') == 'touch' and (packet['y'], packet['x']) in self.sent_at:
+                            self.fanout[slow].append(time.perf_counter() - self.sent_at[(packet['y'], packet['x'])])
+                        elif packet.get('type') == 'latency':
+                            self.stages = packet['stages']
+                    if slow:
+                        await asyncio.sleep(a.slow_delay)
+            except asyncio.TimeoutError:
+                pass
+            if a.kind == 'cursor' and i == 0 and not slow:
+                await ws.send(json.dumps({'event': 'latency'}))
+                while self.stages is None:
+                    packet = await ws.recv()
+                    if isinstance(packet, str) and json.loads(packet).get('type') == 'latency':
+                        self.stages = json.loads(packet)['stages']
+        self.frames.append({'slow': slow, 'frames': frames, 'bytes': ws.received, 'bytes_per_frame': ws.received / max(frames, 1)})
+
+    async def run(self):
+        a = self.args
+        displays = [asyncio.ensure_future(self.display(i, i >= a.displays - a.slow)) for i in range(a.displays)]
+        await asyncio.sleep(0.2)
+        publishers = [asyncio.ensure_future(self.publisher(i)) for i in range(1 if a.serial else 0, a.publishers)]
+        client = device = None
+        if a.serial:
+            from fake_serial import FakeSerialDevice
+            device = FakeSerialDevice(a.rate).start()
+            uri = f'shm://{a.shm}' if a.shm else self.uri
+            client = subprocess.Popen([sys.executable, os.path.join(ROOT, 'wrist_task_cursor_client.py'), device.port, uri], cwd=ROOT)
+        t0 = time.perf_counter()
+        await asyncio.sleep(a.duration)
+        self.running = False
+        self.elapsed = time.perf_counter() - t0
+        if client is not None:
+            client.terminate()
+            client.wait()
+            self.sent += device.lines
+            device.stop()
+        await asyncio.gather(*publishers, return_exceptions=True)
+        await asyncio.gather(*displays, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Websocket server load/latency benchmark.')
+    parser.add_argument('kind', choices=['cursor', 'demo', 'target'])
+    parser.add_argument('--publishers', type=int, default=1)
+    parser.add_argument('--rate', type=float, default=500.0, help='samples per second per publisher')
+    parser.add_argument('--batch', type=int, default=1, help='samples per cursor message')
+    parser.add_argument('--displays', type=int, default=4)
+    parser.add_argument('--slow', type=int, default=1, help='how many displays are slow')
+    parser.add_argument('--slow-delay', type=float, default=0.05, help='seconds a slow display spends per frame')
+    parser.add_argument('--encoding', default='json', choices=protocol.ENCODINGS, help='display encoding (cursor server)')
+    parser.add_argument('--binary', dest='encoding', action='store_const', const='binary', help='same as --encoding binary')
+    parser.add_argument('--deflate', action='store_true', help='displays offer permessage-deflate')
+    parser.add_argument('--serial', action='store_true', help='publisher 0 is wrist_task_cursor_client on a fake serial pty')
+    parser.add_argument('--shm', nargs='?', const='bench_cursor', help='publisher 0 uses the shared-memory ring (cursor server)')
+    parser.add_argument('--engine', default='transitions', choices=['transitions', 'compiled'])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--results', default=RESULTS, help='directory the result file is written to')
+    parser.add_argument('--compare', help='previous result file to compare against')
+    parser.add_argument('--serve', help=argparse.SUPPRESS) # internal: run the server, write loop lag to this file
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.kind, args.port, args.engine, args.serve, args.shm)
+
+    lag_file = tempfile.mktemp(suffix='.json')
+    server = subprocess.Popen([sys.executable, __file__, args.kind, '--serve', lag_file, '--port', str(args.port), '--engine', args.engine]
+                              + (['--shm', args.shm] if args.shm else []),
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    while server.stdout.readline().strip() != 'ready':
+        pass
+    cpu0 = process_cpu(server.pid)
+    bench = Bench(args)
+    asyncio.run(bench.run())
+    cpu = process_cpu(server.pid) - cpu0
+    server.stdin.close()
+    server.stdout.read()
+    server.wait()
+    with open(lag_file) as f:
+        lag = json.load(f)
+    os.remove(lag_file)
+
+    result = {
+        'kind': args.kind,
+        'config': {k: v for k, v in vars(args).items() if k not in ('compare', 'serve', 'port', 'results')},
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'throughput': bench.sent / bench.elapsed,
+        'server': {'cpu_s': cpu, 'cpu_per_sample_us': 1e6 * cpu / max(bench.sent, 1), **lag},
+        'displays': bench.frames,
+        'fanout': summarize(bench.fanout[False]),
+        'fanout_slow': summarize(bench.fanout[True]),
+        'rtt': summarize(bench.rtt),
+        'stages': bench.stages
+    }
+    os.makedirs(args.results, exist_ok=True)
+    fname = os.path.join(args.results, f"{args.kind}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(fname, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f'Saved: {fname}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+def flatten(d: dict, prefix: str = '') -> dict:
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out.update(flatten(v, f'{prefix}{k}.'))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[f'{prefix}{k}'] = v
+    return out
+
+
+def compare(old: dict, new: dict, tolerance: float = 0.10):
+    """ Prints metric changes; flags >tolerance regressions (throughput: lower is worse, everything else: higher). """
+    a, b = flatten({k: old.get(k) for k in ('throughput', 'server', 'fanout', 'fanout_slow', 'rtt', 'stages') if old.get(k)}), \
+           flatten({k: new.get(k) for k in ('throughput', 'server', 'fanout', 'fanout_slow', 'rtt', 'stages') if new.get(k)})
+    for key in sorted(set(a) & set(b)):
+        if key.endswith('.n') or a[key] == 0:
+            continue
+        change = (b[key] - a[key]) / abs(a[key])
+        worse = -change if key == 'throughput' else change
+        flag = 'REGRESSION' if worse > tolerance else ''
+        print(f'{key:60s} {a[key]:12.6g} -> {b[key]:12.6g} ({change:+7.1%}) {flag}')
+
+
+if __name__ == "__main__":
+    main()
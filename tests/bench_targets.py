@@ -0,0 +1,104 @@
+"""
+Throughput/latency benchmark of the target service (component/targets.py).
+
+Starts the service in a subprocess on localhost, then C connections each keep W requests in flight
+(pipelining; W = 1 is lockstep request/reply) with a get/set mix, for a fixed duration. Reports operations
+per second and reply latency, then restarts the service on the same counts file and checks that every
+acknowledged set survived the restart.
+
+    python tests/bench_targets.py --connections 4 --window 32 --duration 5
+    python tests/bench_targets.py --window 1     # lockstep, for comparison
+"""
+import argparse, asyncio, json, multiprocessing, os, sys, tempfile, time
+import numpy as np
+import websockets
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+
+def serve(port: int, counts_file: str, n_targets: int, ready, stop):
+    from component.targets import TargetService
+    async def main():
+        service = TargetService(n_targets, counts_file)
+        async with websockets.serve(service.handler, 'localhost', port, compression=None):
+            ready.set()
+            await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+        service.close()
+    asyncio.run(main())
+
+
+async def client(uri: str, window: int, n_targets: int, set_ratio: float, deadline: float, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    sent_at = {}
+    latency, sets = [], 0
+    async with websockets.connect(uri, compression=None) as ws:
+        next_id = 0
+        async def send():
+            nonlocal next_id
+            if rng.random() < set_ratio:
+                request = {'event': 'set', 'tgt': int(rng.integers(n_targets)), 'id': next_id}
+            else:
+                request = {'event': 'get', 'id': next_id}
+            sent_at[next_id] = time.perf_counter()
+            next_id += 1
+            await ws.send(json.dumps(request))
+        for _ in range(window):
+            await send()
+        while sent_at:
+            reply = json.loads(await ws.recv())
+            latency.append(time.perf_counter() - sent_at.pop(reply['id']))
+            sets += reply['type'] == 'ack'
+            if time.perf_counter() < deadline:
+                await send()
+    return {'latency': latency, 'sets': sets}
+
+
+async def stats(uri: str) -> dict:
+    async with websockets.connect(uri) as ws:
+        await ws.send(json.dumps({'event': 'stats', 'id': 0}))
+        return json.loads(await ws.recv())
+
+
+def start(port: int, counts_file: str, n_targets: int):
+    ctx = multiprocessing.get_context('spawn')
+    ready, stop = ctx.Event(), ctx.Event()
+    process = ctx.Process(target=serve, args=(port, counts_file, n_targets, ready, stop))
+    process.start()
+    ready.wait(10)
+    return process, stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Target service benchmark.')
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--window', type=int, default=32, help='requests in flight per connection')
+    parser.add_argument('--targets', type=int, default=8, help='N Targets')
+    parser.add_argument('--set-ratio', type=float, default=0.5, help='fraction of requests that are sets')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=8791)
+    args = parser.parse_args()
+
+    uri = f'ws://localhost:{args.port}'
+    counts_file = os.path.join(tempfile.mkdtemp(), 'target_counts.bin')
+    process, stop = start(args.port, counts_file, args.targets)
+    async def run():
+        deadline = time.perf_counter() + args.duration
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(client(uri, args.window, args.targets, args.set_ratio, deadline, i) for i in range(args.connections)))
+        return results, time.perf_counter() - t0
+    results, elapsed = asyncio.run(run())
+    stop.set()
+    process.join()
+
+    latency = np.concatenate([r['latency'] for r in results])
+    sets = sum(r['sets'] for r in results)
+    p50, p99 = np.percentile(latency, (50, 99)) * 1e3
+    print(f'{len(latency):,} requests in {elapsed:.2f} s: {len(latency) / elapsed:,.0f} ops/s '
+          f'({args.connections} connections x {args.window} in flight); latency p50 {p50:.3f} ms, p99 {p99:.3f} ms')
+
+    process, stop = start(args.port, counts_file, args.targets) # counts must survive the restart
+    total = asyncio.run(stats(uri))['total']
+    stop.set()
+    process.join()
+    print(f'{sets:,} acknowledged sets, {total:,} counted after restart: {"OK" if total == sets else "MISMATCH"}')
@@ -0,0 +1,47 @@
+"""
+Bit-for-bit regression check of the task logic (component/replay.py).
+
+Replays the committed recording tests/data/reach.rec (5 synthetic reaches at 200 Hz, 3 successful) with the
+pinned tests/data/replay_params.txt and replay_targets.txt through both state machine engines, one sample at a
+time and in frames of 4, and compares each run's Replay.digest() with the reference below. Both engines must
+produce the same records. A change to the task logic, filters, timeouts or record format changes the digests:
+if the change is intended, update DIGESTS with the printed values. Exits with status 1 on any mismatch.
+
+    python tests/check_replay.py
+"""
+import asyncio, os, sys, tempfile
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+from component.replay import Replay, load_samples
+
+DATA = os.path.join(ROOT, 'tests', 'data')
+DIGESTS = { # batch --> SHA-1 of the records
+    1: '73331ba7550cd5756198329f641b64371bd0a95f',
+    4: '698e698c14cfb30f3dc6fad2e1fe1a3057b370cd'
+}
+SUMMARY = {'trials': 5, 'successful': 3, 'unsuccessful': 2, 'transitions': 34, 'timeouts': 18}
+
+
+def main() -> int:
+    samples = load_samples(os.path.join(DATA, 'reach.rec'))
+    failures = []
+    for batch, expected in DIGESTS.items():
+        for engine in ('transitions', 'compiled'):
+            replay = Replay(os.path.join(DATA, 'replay_targets.txt'), os.path.join(DATA, 'replay_params.txt'),
+                            engine=engine, seed=0, log_dir=tempfile.gettempdir())
+            asyncio.run(replay.run(*samples, batch=batch))
+            digest, summary = replay.digest(), replay.summary()
+            print(f'{engine:>12s} batch={batch}  {digest}  {summary}')
+            if digest != expected:
+                failures.append(f'{engine}, batch={batch}: digest {digest} != {expected}')
+            if summary != SUMMARY:
+                failures.append(f'{engine}, batch={batch}: summary {summary} != {SUMMARY}')
+    for failure in failures:
+        print('FAIL', failure)
+    print('OK' if not failures else f'{len(failures)} failure(s)')
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Display resume through a SessionHost (component/host.py, component/broadcast.py).
+
+Serves a SessionHost on localhost and, for the default session ('/') and a named one ('/session/<id>'):
+connects a display (which gets the snapshot and its resume token), drives the cursor from a source client,
+disconnects the display, moves the cursor again, then reconnects with ?resume=<token>&received=<n>. The
+reconnected display must get exactly the frames published after the last one it received (no new snapshot),
+the same frames as a display that stayed connected. An unknown token must get a fresh snapshot.
+Exits with status 1 on the first failure.
+
+    python tests/check_resume.py
+"""
+import asyncio, json, os, sys, tempfile
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+import websockets
+from component import protocol
+from component.host import SessionHost
+
+
+async def pending(ws, timeout: float = 0.2) -> list:
+    """ Every message that arrives before `timeout` s of silence. """
+    out = []
+    while True:
+        try:
+            out.append(await asyncio.wait_for(ws.recv(), timeout))
+        except asyncio.TimeoutError:
+            return out
+
+
+async def move(source, x0: int, n: int = 20):
+    for i in range(n):
+        await source.send(json.dumps({'event': 'cursor', 'x': x0 + 5 * i, 'y': 300}))
+        await asyncio.sleep(0.005)
+
+
+async def check(base: str) -> list:
+    """ Failures of the resume scenario on the session at `base` (a ws:// URI ending with its path). """
+    failures = []
+    reference = await websockets.connect(base) # stays connected
+    display = await websockets.connect(base)
+    snapshot = json.loads(await display.recv())
+    if snapshot.get('type') != 'snapshot' or not snapshot.get('token'):
+        return [f'{base}: first frame is not a snapshot with a token: {snapshot}']
+    source = await websockets.connect(base, subprotocols=[protocol.SOURCE])
+    await source.send(json.dumps({'event': 'start'}))
+    await move(source, 300)
+    received = 1 + len(await pending(display))
+    await display.close()
+    before = await pending(reference)
+    await move(source, 400)
+    resumed = await websockets.connect(f"{base}?resume={snapshot['token']}&received={received}")
+    replayed = await pending(resumed)
+    missed = await pending(reference)
+    # The display also missed the users count published when it left (the reference got it in `before`), so the
+    # replay is that frame followed by everything the reference got since.
+    if not replayed or json.loads(replayed[0]).get('type') == 'snapshot':
+        failures.append(f'{base}: resume answered with a snapshot instead of the missed frames')
+    elif replayed[-len(missed):] != missed:
+        failures.append(f'{base}: replayed frames differ from the reference stream ({len(replayed)} vs {len(missed)} frames)')
+    unknown = await websockets.connect(f'{base}?resume=unknown&received=3')
+    if json.loads(await unknown.recv()).get('type') != 'snapshot':
+        failures.append(f'{base}: unknown token did not get a snapshot')
+    for ws in (reference, resumed, unknown, source):
+        await ws.close()
+    return failures
+
+
+async def main(port: int) -> int:
+    host = SessionHost(os.path.join(ROOT, 'config', 'targets.txt'), os.path.join(ROOT, 'config', 'params.txt'),
+                       autocreate=True, data_dir=tempfile.mkdtemp(), log_dir=tempfile.mkdtemp(), trace_interval=0)
+    failures = []
+    async with host.serve('localhost', port):
+        for path in ('/', '/session/rig2'):
+            failures += await check(f'ws://localhost:{port}{path}')
+        for sid in list(host.sessions):
+            await host.destroy(sid)
+    for failure in failures:
+        print('FAIL', failure)
+    print('OK' if not failures else f'{len(failures)} failure(s)')
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8797)))
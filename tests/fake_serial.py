@@ -0,0 +1,53 @@
+import math, os, pty, sys, threading, time, tty
+
+
+class FakeSerialDevice(object):
+    """ Pseudo-terminal that emits 'x,y' lines like the wrist ADC board, so serial.Serial can open `port`. """
+
+    def __init__(self, rate: float = 500.0, center=(340, 347), amplitude: float = 100.0, period: float = 2.0):
+        self.rate = rate
+        self.center = center
+        self.amplitude = amplitude
+        self.period = period
+        self.lines = 0
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave) # no echo or newline translation
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='fake-serial', daemon=True)
+
+    def __repr__(self):
+        return f'FakeSerialDevice({self.port} @ {self.rate} Hz)'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        t0 = time.perf_counter()
+        while not self._stop.is_set():
+            t = self.lines / self.rate
+            delay = t0 + t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            phase = 2 * math.pi * t / self.period
+            x = round(self.center[0] + self.amplitude * math.cos(phase))
+            y = round(self.center[1] + self.amplitude * math.sin(phase))
+            os.write(self._master, f'{x},{y}\n'.encode())
+            self.lines += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+
+if __name__ == "__main__":
+    device = FakeSerialDevice(float(sys.argv[1]) if len(sys.argv) > 1 else 500.0).start()
+    print(device.port, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        device.stop()
@@ -0,0 +1,77 @@
+"""
+Startup profile of the cursor server: where import and construction time goes before it can accept connections.
+
+Each measurement runs in a fresh interpreter (nothing cached in sys.modules):
+    - imports: cumulative `python -X importtime` of `component` and the top packages it pulls in
+    - construction: CenterOut(...) per engine, with and without graph support
+    - diagram: render_graph() with an up-to-date cache (what every launch pays) and forced (what a change costs)
+
+    python tests/profile_startup.py [--top 12] [--repeat 3]
+"""
+import argparse, os, subprocess, sys, tempfile
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+CONSTRUCT = """
+import time, tempfile
+t0 = time.perf_counter()
+from component import CenterOut
+t1 = time.perf_counter()
+game = CenterOut('config/targets.txt', 'config/params.txt', engine={engine!r}, graph={graph!r}, log_dir=tempfile.mkdtemp())
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+"""
+
+RENDER = """
+import time
+from component.graph import render_graph
+t0 = time.perf_counter()
+try:
+    drawn = render_graph({fname!r}, force={force!r})
+except ImportError:
+    drawn = None
+print(time.perf_counter() - t0, drawn)
+"""
+
+
+def python(code: str, *flags) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, '-c', code], cwd=ROOT, capture_output=True, text=True)
+
+
+def imports(top: int):
+    """ (cumulative us, package) of the slowest top-level imports below `component`. """
+    out = python('import component', '-X', 'importtime').stderr.splitlines()
+    rows = []
+    for line in out:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if name.count(' ') <= 4: # direct imports of component and of its modules
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CenterOut startup profile.')
+    parser.add_argument('--top', type=int, default=12, help='number of imports listed')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters per measurement (best is shown)')
+    args = parser.parse_args()
+
+    print('imports (cumulative ms):')
+    for us, name in imports(args.top):
+        print(f'  {us / 1000:8.1f}  {name}')
+
+    print('construction (best of %d, ms):' % args.repeat)
+    for engine, graph in (('compiled', False), ('transitions', False), ('transitions', True)):
+        runs = [tuple(map(float, python(CONSTRUCT.format(engine=engine, graph=graph)).stdout.split())) for _ in range(args.repeat)]
+        t_import, t_init = min(run[0] for run in runs), min(run[1] for run in runs)
+        print(f'  {engine:>12s} graph={graph!s:5s}  import {t_import * 1000:7.1f}  CenterOut() {t_init * 1000:7.1f}')
+
+    print('state diagram (ms):')
+    fname = os.path.join(tempfile.mkdtemp(), 'state_machine.png')
+    for label, force in (('first render', True), ('cached', False), ('cached', False)):
+        t, drawn = python(RENDER.format(fname=fname, force=force)).stdout.split()
+        if drawn == 'None':
+            print('  pygraphviz/graphviz not installed: no diagram')
+            break
+        print(f'  {label:>12s}  {float(t) * 1000:7.1f}  (drawn: {drawn})')
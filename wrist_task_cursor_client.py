@@ -6,30 +6,104 @@ import asyncio
 import websockets
 import json
 import serial
+import sys
+import threading
+import time
 from config import address, port
+from component.protocol import encode_cursor_batch, SOURCE
+from component.shm import RingWriter
 
 IP = address['cursor']
 PORT = port['cursor']
+BINARY = True # Send compact binary cursor frames instead of JSON (see component/protocol.py)
+BATCH_PERIOD = 0.010 # Seconds of samples collected into one websocket message
+MAX_BATCH = 256 # Samples per message at most (larger batches are split)
+MAX_AGE = 0.25 # Seconds: older samples are dropped instead of sent (e.g. queued while the server was down)
+MAX_QUEUED = 256 # Serial batches waiting to be sent at most (the oldest is dropped when full)
+
+def reader(s, emit):
+    """ Drains the serial port in bulk and hands timestamped [(t, x, y), ...] batches to emit(). """
+    byte_period = 10.0 / s.baudrate # 8N1: 10 bits on the wire per byte
+    pending = b''
+    last = 0.0 # Timestamps never go backwards, even if bytes arrive faster than the nominal baud rate.
+    while True:
+        chunk = s.read(max(1, s.in_waiting)) # Blocks for the first byte only.
+        t = time.time()
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        # Back-date each line by the wire time of the bytes that arrived after it.
+        after = len(pending) + sum(len(line) + 1 for line in lines)
+        batch = []
+        for line in lines:
+            after -= len(line) + 1
+            try:
+                x, y = line.split(b',')
+                last = max(last, t - after * byte_period)
+                batch.append((last, int(x), int(y)))
+            except ValueError: # Partial or garbled line
+                continue
+        if batch:
+            emit(batch)
+
+async def drain(websocket):
+    """ Discards anything the server sends, so that pongs are never stuck behind unread messages. """
+    async for _ in websocket:
+        pass
+
+def put_latest(queue, batch):
+    """ Queues a batch, dropping the oldest one if the queue is full. """
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(batch)
 
 async def publisher(s, uri):
-    async for websocket in websockets.connect(uri, ping_interval=None, ping_timeout=0.020):
+    loop = asyncio.get_running_loop()
+    samples = asyncio.Queue(MAX_QUEUED)
+    emit = lambda batch: loop.call_soon_threadsafe(put_latest, samples, batch)
+    threading.Thread(target=reader, args=(s, emit), daemon=True).start()
+    # Protocol-level pings keep the connection alive (and detect dead servers) without extra messages.
+    # As a source, the server sends no display frames to this client (older servers still do: they are drained).
+    async for websocket in websockets.connect(uri, ping_interval=1.0, ping_timeout=1.0, subprotocols=[SOURCE]):
+        draining = asyncio.ensure_future(drain(websocket))
         try:
-            task = asyncio.create_task(ping(websocket))
             while True:
-                line = s.readline()
-                vals = line.decode()
-                x, y = vals.split(',')
-                data = {'event': 'cursor', 'type': 'none', 'x': int(x), 'y': int(y)}
-                await websocket.send(json.dumps(data))
+                batch = await samples.get()
+                deadline = loop.time() + BATCH_PERIOD
+                while len(batch) < MAX_BATCH:
+                    try:
+                        batch += await asyncio.wait_for(samples.get(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+                stale = time.time() - MAX_AGE # sample times are wall-clock (see reader)
+                if batch[0][0] < stale:
+                    batch = [sample for sample in batch if sample[0] >= stale]
+                for i in range(0, len(batch), MAX_BATCH):
+                    if BINARY:
+                        await websocket.send(encode_cursor_batch(batch[i:i + MAX_BATCH]))
+                    else:
+                        t, x, y = zip(*batch[i:i + MAX_BATCH])
+                        data = {'event': 'cursor_batch', 'type': 'none', 't': t, 'x': x, 'y': y}
+                        await websocket.send(json.dumps(data))
         except (websockets.ConnectionClosed, websockets.ConnectionClosedOK, websockets.ConnectionClosedError):
             print("WS Connection Back-Pressure: Using New Websocket.")
             continue
+        finally:
+            draining.cancel()
 
-async def ping(websocket):
-    while True:
-        await websocket.send('2')
-        await asyncio.sleep(0.020)
-                
-with serial.Serial('/dev/ttyUSB0', 9600) as ser:
-    ser.readline()
-    asyncio.get_event_loop().run_until_complete(publisher(ser, f'ws://{IP}:{PORT}'))
+def shm_publisher(s, name):
+    """ Same-host transport: every batch goes straight into the server's shared-memory ring (see component/shm.py). """
+    writer = RingWriter(name)
+    reader(s, lambda batch: writer.write(*zip(*batch)))
+
+if __name__ == "__main__":
+    # Optional arguments: serial device (e.g. a pty from tests/fake_serial.py) and server URI,
+    # or shm://<name> to write into the shared-memory ring of a server on this machine.
+    device = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyUSB0'
+    uri = sys.argv[2] if len(sys.argv) > 2 else f'ws://{IP}:{PORT}'
+    with serial.Serial(device, 9600) as ser:
+        ser.readline()
+        if uri.startswith('shm://'):
+            shm_publisher(ser, uri[len('shm://'):])
+        else:
+            asyncio.run(publisher(ser, uri))
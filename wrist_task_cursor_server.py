@@ -1,8 +1,12 @@
 #!/usr/bin/env python
 # WS server example that synchronizes state across clients
-from component import CenterOut
-from config import address, port
-import asyncio, json, sys, websockets
+from component import CenterOut, protocol
+from component.graph import render_graph
+from component.logs import configure_logging
+from component.metrics import start_metrics
+from component import shm as shm_transport
+from config import address, port, shm
+import asyncio, json, logging, sys, websockets
 
 
 if __name__ == "__main__":
@@ -16,12 +20,30 @@ if __name__ == "__main__":
         t_file = 'config/targets.txt'
         p_file = 'config/params.txt'
 
+    configure_logging('logs', 'center_out') # once per process, before anything logs
     game = CenterOut(targets_file = 'config/targets.txt', params_file = 'config/params.txt')
-    with open('state_machine.png', 'bw') as f:
-        game.get_graph().draw(f, format='png', prog='dot')
+    try: # redrawn only when the states/transitions change
+        render_graph('state_machine.png')
+    except ImportError as e:
+        logging.getLogger('CENTER-OUT').warning(f'state_machine.png not updated: {e}')
     server = websockets.serve(game.cursor_and_task_state_messages, 
                             address['cursor'], 
-                            port['cursor'])
+                            port['cursor'],
+                            **protocol.serve_options()) # display encodings by subprotocol, permessage-deflate
+
+    ring = None # same-host acquisition (opt-in, see config.shm): wrist_task_cursor_client.py <device> shm://<name>
+    if shm.get('cursor'):
+        if shm_transport.AVAILABLE:
+            ring = shm_transport.RingConsumer(shm['cursor'])
+        else:
+            logging.getLogger('CENTER-OUT').warning('Shared-memory cursor transport is not available on this platform.')
 
     asyncio.get_event_loop().run_until_complete(server)
-    asyncio.get_event_loop().run_forever()
\ No newline at end of file
+    asyncio.get_event_loop().run_until_complete(start_metrics([game.collect_metrics], address['metrics'], port['metrics']))
+    if ring is not None:
+        asyncio.ensure_future(ring.serve(game))
+    try:
+        asyncio.get_event_loop().run_forever()
+    finally:
+        if ring is not None:
+            ring.close()
\ No newline at end of file
@@ -2,36 +2,26 @@
 
 # WS client example
 
-import asyncio
-import websockets
 import json
 import sys
 from config import address, port
+from component.client import PersistentClient
+from component.schedule import TrialSchedule
 
 IP = address['target']
 PORT = port['target']
 
-def next_line(fname):
-    while True:
-        with open(fname, 'r') as file:
-            for line in file:
-                yield int(line)
-            file.close()
-
-async def periodic_publisher(fname, uri):
-    target = next_line(fname)
-    async for websocket in websockets.connect(uri):
-        try:
-            message = await websocket.recv()
-            packet = json.loads(message)
-            # print(packet)
-            if packet['type'] == "tgt":
-                tgt = next(target)
-                data = {'event': 'set', 'tgt': tgt}
-                await websocket.send(json.dumps(data))              
-        except websockets.ConnectionClosed:
-                print("WS Connection Back-Pressure: Using New Websocket.")
-                continue
+def periodic_publisher(fname, uri):
+    schedule = TrialSchedule.from_file(fname) # read once; next() never touches the file
+    def on_message(message):
+        packet = json.loads(message)
+        # print(packet)
+        if packet['type'] == "tgt":
+            tgt = schedule.next()
+            client.send(json.dumps({'event': 'set', 'tgt': tgt}))
+    # Subscribed again on every (re)connection: pushed a "tgt" event whenever a client reads the target.
+    client = PersistentClient(uri, on_message=on_message, on_connect=lambda: [json.dumps({'event': 'subscribe'})]).start()
+    client.join() # runs until interrupted
 
 if (len(sys.argv) < 2) or (sys.argv[1] is None):
     name = 'config/targets.txt'
@@ -40,4 +30,4 @@ else:
     name = sys.argv[1]
     print(f'Looking for targets in: {name}')
 
-asyncio.get_event_loop().run_until_complete(periodic_publisher(name, f'ws://{IP}:{PORT}'))
+periodic_publisher(name, f'ws://{IP}:{PORT}')
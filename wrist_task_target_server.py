@@ -1,49 +1,27 @@
 #!/usr/bin/env python
 
-# WS server example that synchronizes state across clients
+# WS target service: replies to get/set/stats requests, counts every target set (see component/targets.py)
 
 import asyncio
-import json
+import sys
 import websockets
+from component.params import ParamsLoader
+from component.targets import TargetService
 from config import address, port
 
-TARGET = {"value": 0,  
-          "count": [0, 0, 0, 0, 0, 0, 0, 0]}
-
-USERS = set()
 IP = address['target']
 PORT = port['target']
 
-def target_event():
-    return json.dumps({"event": "none", "type": "tgt", "tgt": TARGET["value"]})
-
-async def notify_target():
-    if USERS:
-        message = target_event()
-        await asyncio.wait([user.send(message) for user in USERS])
-
-async def register(websocket):
-    USERS.add(websocket)
 
-async def unregister(websocket):
-    USERS.remove(websocket)
-
-async def packet_handler(websocket, path):
-    # register(websocket) sends user_event() to websocket
-    await register(websocket)
+if __name__ == "__main__":
+    p_file = sys.argv[1] if len(sys.argv) > 1 else 'config/params.txt'
+    counts_file = sys.argv[2] if len(sys.argv) > 2 else 'data/target_counts.bin'
+    n_targets = ParamsLoader().load(p_file).get('N Targets', 8)
+    service = TargetService(n_targets, counts_file)
+    server = websockets.serve(service.handler, IP, PORT)
     try:
-        # await websocket.send(state_event())
-        async for message in websocket:
-            data = json.loads(message)
-            if data["event"] == "get":
-                await notify_target()
-            elif data["event"] == "set":
-                TARGET["value"] = data["tgt"]
-                TARGET["count"][data["tgt"]] += 1
+        asyncio.get_event_loop().run_until_complete(server)
+        asyncio.get_event_loop().run_forever()
     finally:
-        await unregister(websocket)
-        print(TARGET)
-
-server = websockets.serve(packet_handler, IP, PORT)
-asyncio.get_event_loop().run_until_complete(server)
-asyncio.get_event_loop().run_forever()
+        print({"value": service.target, "count": service.counts.counts.tolist()})
+        service.close()